@@ -1,6 +1,6 @@
 # endpoints.py
 from fastapi import APIRouter, UploadFile, File, HTTPException, Request
-from app.services.file_management import save_upload_file
+from app.services.file_management import save_upload_file, UploadRejectedError
 from app.services.vision_extraction import extract_invoice_fields_with_ai
 from typing import List
 import os
@@ -12,6 +12,8 @@ async def upload_file(file: UploadFile = File(...)):
     try:
         file_path = await save_upload_file(file)
         return {"status": "success", "file_path": file_path}
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred while uploading the file: {str(e)}")
 
@@ -30,7 +32,7 @@ async def extract_invoice_with_ai(invoice_id: str, request: Request):
         file_path = os.path.join(root_dir, "uploaded_files", f"{invoice_id}.pdf")
 
         # Mock result (replace with your actual function)
-        result =  extract_invoice_fields_with_ai()
+        result = await extract_invoice_fields_with_ai()
 
         return {
             "success": True,
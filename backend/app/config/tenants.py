@@ -0,0 +1,9 @@
+# zoku/backend/app/config/tenants.py
+
+# TEMPORARY FIX (from the QA system): documents of the test users are visible to everyone
+SHARED_TEST_USER_IDS = ["test-user-123", "test-user-esra"]
+
+
+def tenant_user_ids(user_id):
+    """User IDs whose documents belong to this user's index"""
+    return list(dict.fromkeys([user_id, *SHARED_TEST_USER_IDS]))
@@ -1,7 +1,10 @@
 # zoku/backend/app/db/supabase_client.py
 import os
+import time
+from collections import OrderedDict
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from app.config.tenants import tenant_user_ids
 
 load_dotenv()
 
@@ -15,6 +18,13 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 # Initialize Supabase client
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Invoice metadata cache used by the QA system (user_id -> {invoice_id: (expires_at, row)}),
+# least recently used user first
+INVOICE_METADATA_TTL_SECONDS = float(os.getenv("INVOICE_METADATA_TTL_SECONDS", "60"))
+INVOICE_METADATA_CACHE_USERS = int(os.getenv("INVOICE_METADATA_CACHE_USERS", "256"))
+INVOICE_METADATA_FIELDS = "id, filename, supplier, upload_date"
+_invoice_metadata_cache = OrderedDict()
+
 
 # Helper functions for invoice table operations
 async def create_invoice(invoice_data):
@@ -29,6 +39,72 @@ async def get_invoice(invoice_id):
     return result.data[0] if result.data else None
 
 
+async def get_invoice_metadata_bulk(invoice_ids, user_id=None):
+    """
+    Get filename, supplier and upload_date of several invoices in one query.
+    With a user_id only the invoices that user may see are returned (their own and
+    the shared test users'). Results are cached per user for INVOICE_METADATA_TTL_SECONDS,
+    for the INVOICE_METADATA_CACHE_USERS most recent users.
+
+    Returns:
+        dict: invoice_id -> metadata row (invoices that don't exist are left out)
+    """
+    now = time.monotonic()
+    cache = _invoice_metadata_cache.setdefault(user_id, {})
+    _invoice_metadata_cache.move_to_end(user_id)
+
+    found = {}
+    missing = []
+    for invoice_id in dict.fromkeys(invoice_ids):
+        cached = cache.get(invoice_id)
+        if cached and cached[0] > now:
+            found[invoice_id] = cached[1]
+        else:
+            missing.append(invoice_id)
+
+    if missing:
+        query = supabase.table("zokuai_invoices").select(INVOICE_METADATA_FIELDS).in_("id", missing)
+        if user_id is not None:
+            query = query.in_("user_id", tenant_user_ids(user_id))
+        result = query.execute()
+
+        # Expired entries are dropped whenever the user's cache is written
+        for invoice_id in [key for key, (expires_at, _) in cache.items() if expires_at <= now]:
+            del cache[invoice_id]
+        for row in result.data or []:
+            cache[row["id"]] = (now + INVOICE_METADATA_TTL_SECONDS, row)
+            found[row["id"]] = row
+        while len(_invoice_metadata_cache) > INVOICE_METADATA_CACHE_USERS:
+            _invoice_metadata_cache.popitem(last=False)
+
+    return found
+
+
+def invalidate_invoice_metadata(invoice_id):
+    """Drop an invoice from every user's metadata cache"""
+    for cache in _invoice_metadata_cache.values():
+        cache.pop(invoice_id, None)
+
+
+async def find_invoice_by_content_hash(user_id, content_hash):
+    """Get the user's oldest fully processed invoice with the given file content hash"""
+    result = supabase.table("zokuai_invoices")\
+        .select("*")\
+        .eq("user_id", user_id)\
+        .eq("content_hash", content_hash)\
+        .eq("status", "Processed")\
+        .order("upload_date", desc=False)\
+        .limit(1)\
+        .execute()
+    return result.data[0] if result.data else None
+
+
+async def count_invoices_with_storage_path(storage_path):
+    """Count invoices that point at a storage file (deduplicated uploads share one file)"""
+    result = supabase.table("zokuai_invoices").select("id", count="exact").eq("storage_path", storage_path).execute()
+    return result.count or 0
+
+
 async def get_invoices(limit=10, offset=0, sort_by="upload_date", sort_dir="desc", search=None, user_id=None):
     """Get invoices with pagination, sorting and filtering"""
     query = supabase.table("zokuai_invoices").select("*", count="exact")
@@ -66,6 +142,7 @@ async def update_invoice(invoice_id, invoice_data):
         # Only attempt update if there are valid fields to update
         if filtered_data:
             result = supabase.table("zokuai_invoices").update(filtered_data).eq("id", invoice_id).execute()
+            invalidate_invoice_metadata(invoice_id)
             return result.data[0] if result.data else None
         else:
             # If no valid fields to update, just return the current invoice
@@ -78,6 +155,7 @@ async def update_invoice(invoice_id, invoice_data):
 async def delete_invoice(invoice_id):
     """Delete an invoice record"""
     result = supabase.table("zokuai_invoices").delete().eq("id", invoice_id).execute()
+    invalidate_invoice_metadata(invoice_id)
     return result.data[0] if result.data else None
 
 
@@ -87,9 +165,10 @@ def get_file_url(bucket_name, file_path):
     return supabase.storage.from_(bucket_name).get_public_url(file_path)
 
 
-async def upload_file_to_storage(bucket_name, file_path, file_content):
-    """Upload a file to Supabase Storage"""
-    result = supabase.storage.from_(bucket_name).upload(file_path, file_content)
+async def upload_file_to_storage(bucket_name, file_path, file_content, content_type=None):
+    """Upload a file to Supabase Storage (file_content can be bytes or an open file, which is streamed)"""
+    file_options = {"content-type": content_type} if content_type else None
+    result = supabase.storage.from_(bucket_name).upload(file_path, file_content, file_options)
     return result
 
 
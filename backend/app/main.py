@@ -1,6 +1,7 @@
 # main.py
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import logging
 import os
 import sys
@@ -14,6 +15,13 @@ from app.routers.chat_sessions import router as chat_sessions_router
 from app.routers.e_prompt_optimizer import router as prompt_optimizer_router
 from app.routers.template_library import router as template_library_router
 from app.routers.ai_systems import router as ai_systems_router
+from app.services.e_ocr_executor import ocr_executor
+from app.services.e_job_queue import get_job_queue, purge_periodically, JOB_PURGE_INTERVAL_SECONDS
+from app.services.e_llm_gateway import close_llm_client
+from app.services.e_openai_client import embedding_batcher
+from app.services.e_chat_writer import chat_writer, SESSION_RECONCILE_SECONDS
+from app.services.e_session_memory import session_memory
+from app.services.e_document_processor import follow_document_changes, DOCUMENT_CHANGES_POLL_SECONDS
 
 # Configure logging
 logging.basicConfig(
@@ -52,6 +60,55 @@ app.include_router(template_library_router)
 app.include_router(ai_systems_router)
 
 
+# Ingestion normally runs in separate worker processes (python -m app.workers.ingestion_worker).
+# For single-process development, INGESTION_EMBEDDED_WORKERS starts that many worker loops in the API.
+EMBEDDED_INGESTION_WORKERS = int(os.getenv("INGESTION_EMBEDDED_WORKERS", "0"))
+EMBEDDED_WORKER_STATS_ID = f"api-{os.getpid()}"
+embedded_worker_tasks = []
+background_tasks = []
+
+
+@app.on_event("startup")
+async def startup_event():
+    # The ingestion workers publish the documents they add or replace; keep this process's indexes in step
+    background_tasks.append(asyncio.create_task(follow_document_changes(DOCUMENT_CHANGES_POLL_SECONDS)))
+
+    # Done jobs and old document changes would otherwise pile up in the queue file
+    if JOB_PURGE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(purge_periodically(JOB_PURGE_INTERVAL_SECONDS)))
+
+    if SESSION_RECONCILE_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(chat_writer.reconcile_periodically(SESSION_RECONCILE_SECONDS)))
+
+    if EMBEDDED_INGESTION_WORKERS > 0:
+        from app.workers.ingestion_worker import worker_loop, publish_stats
+        from app.services.e_job_queue import DEFAULT_VISIBILITY_TIMEOUT
+
+        queue = get_job_queue()
+        for i in range(EMBEDDED_INGESTION_WORKERS):
+            worker_id = f"{EMBEDDED_WORKER_STATS_ID}-{i}"
+            embedded_worker_tasks.append(asyncio.create_task(worker_loop(queue, worker_id, DEFAULT_VISIBILITY_TIMEOUT)))
+        # OCR runs in this process then; publish its metrics like a worker process does for /invoices/ocr-stats
+        embedded_worker_tasks.append(asyncio.create_task(publish_stats(queue, EMBEDDED_WORKER_STATS_ID)))
+        logger.info(f"Started {EMBEDDED_INGESTION_WORKERS} embedded ingestion workers")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in embedded_worker_tasks + background_tasks:
+        task.cancel()
+    if embedded_worker_tasks:
+        try:
+            await asyncio.to_thread(get_job_queue().remove_worker_stats, EMBEDDED_WORKER_STATS_ID)
+        except Exception as e:
+            logger.error(f"Removing worker stats failed: {str(e)}")
+    await session_memory.close()
+    await chat_writer.close()
+    await embedding_batcher.close()
+    ocr_executor.shutdown()
+    await close_llm_client()
+
+
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the API"}
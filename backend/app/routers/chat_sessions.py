@@ -7,6 +7,7 @@ from ..services.e_chat_manager import (
     create_chat_session,
     get_chat_sessions,
     get_chat_session_with_messages,
+    get_session_messages,
     update_chat_session,
     delete_chat_session,
     generate_session_title
@@ -45,6 +46,13 @@ class ChatSessionWithMessages(BaseModel):
     session: Optional[dict] = None
     message: Optional[str] = None
 
+class ChatMessagesPage(BaseModel):
+    status: str
+    messages: Optional[List[dict]] = None
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+    message: Optional[str] = None
+
 
 @router.post("", response_model=ChatSessionResponse)
 async def create_new_chat_session(
@@ -117,7 +125,7 @@ async def get_chat_session(
     session_id: str,
     user=None
 ):
-    """Get a specific chat session with all messages"""
+    """Get a specific chat session with its latest messages"""
 
     # For testing - replace with actual auth
     if user is None:
@@ -141,6 +149,41 @@ async def get_chat_session(
         raise HTTPException(status_code=500, detail=f"Error fetching session: {str(e)}")
 
 
+@router.get("/{session_id}/messages", response_model=ChatMessagesPage)
+async def list_session_messages(
+    session_id: str,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    user=None
+):
+    """Get a page of a session's messages, older than the cursor"""
+
+    # For testing - replace with actual auth
+    if user is None:
+        user = {"id": "test-user-esra"}
+
+    result = await get_session_messages(
+        session_id=session_id,
+        user_id=user['id'],
+        cursor=cursor,
+        limit=limit
+    )
+
+    if result["status"] == "success":
+        return ChatMessagesPage(
+            status="success",
+            messages=result["messages"],
+            next_cursor=result["next_cursor"],
+            has_more=result["has_more"]
+        )
+    elif result["message"] == "Invalid cursor":
+        raise HTTPException(status_code=400, detail=result["message"])
+    elif result["message"] == "Session not found":
+        raise HTTPException(status_code=404, detail=result["message"])
+    else:
+        raise HTTPException(status_code=500, detail=f"Error fetching messages: {result['message']}")
+
+
 @router.put("/{session_id}", response_model=ChatSessionResponse)
 async def update_session(
     session_id: str,
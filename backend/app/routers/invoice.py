@@ -1,8 +1,9 @@
 import os
-import shutil
+import asyncio
+import logging
 import tempfile
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Path, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Path
 from fastapi.responses import JSONResponse, FileResponse
 import uuid
 from datetime import datetime
@@ -30,18 +31,26 @@ from ..db.supabase_client import (
     get_file_url,
     upload_file_to_storage,
     delete_file_from_storage,
+    find_invoice_by_content_hash,
+    count_invoices_with_storage_path,
     supabase,  # Import supabase client
 )
 from ..services.openai_client import extract_invoice_data, create_document_embedding
 from ..auth.auth_handler import get_current_user
-# Import the new function for PDF to PNG conversion
-from ..services.e_file_conversion import convert_pdf_to_png
+from ..services.e_ocr_executor import ocr_executor, aggregate_stats as aggregate_ocr_stats
+from ..services.e_ingestion_jobs import enqueue_pdf_ingestion
+from ..services.e_job_queue import get_job_queue
+from ..services.e_document_processor import link_invoice_documents, delete_invoice_documents
+from ..services.file_management import spool_upload_file, UploadRejectedError, EXTENSION_MIME_TYPES
 
 router = APIRouter(
     prefix="/invoices",
     tags=["invoices"]
 )
 
+# Set up logging
+logger = logging.getLogger(__name__)
+
 # Constants
 STORAGE_BUCKET = "zokuinvoices"
 ALLOWED_EXTENSIONS = {"pdf", "jpg", "jpeg", "png"}
@@ -54,7 +63,6 @@ def allowed_file(filename):
 
 @router.post("", response_model=InvoiceResponse)
 async def upload_invoice(
-    background_tasks: BackgroundTasks,  # Move this to the front
     file: UploadFile = File(...),
     user=None
 ):
@@ -81,14 +89,58 @@ async def upload_invoice(
         file_ext = os.path.splitext(file.filename)[1]
         storage_path = f"{user['id']}/{file_id}{file_ext}"
 
-        # Save file temporarily
+        # Save file temporarily in one streaming pass: hash, size limit and type check on the way
         with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            shutil.copyfileobj(file.file, temp_file)
             temp_file_path = temp_file.name
+        try:
+            upload_info = await spool_upload_file(
+                file,
+                temp_file_path,
+                expected_mime_type=EXTENSION_MIME_TYPES.get(file_ext.lower())
+            )
+        except UploadRejectedError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        content_hash = upload_info["sha256"]
+
+        # Same file uploaded before: link to its storage file, text and embeddings
+        existing = await find_invoice_by_content_hash(user['id'], content_hash)
+        if existing:
+            logger.info(f"Duplicate upload of invoice {existing['id']} (sha256 {content_hash[:12]}...)")
+            invoice = await create_invoice({
+                "id": file_id,
+                "filename": file.filename,
+                "upload_date": datetime.now().isoformat(),
+                "supplier": existing.get("supplier"),
+                "status": "Uploaded",
+                "file_url": existing["file_url"],
+                "user_id": user['id'],
+                "storage_path": existing["storage_path"],
+                "content_hash": content_hash
+            })
+            os.unlink(temp_file_path)
+
+            if not invoice:
+                raise HTTPException(status_code=500, detail="Failed to create invoice record")
+
+            # Processed only once its documents are linked, so QA never sees it half done
+            try:
+                await link_invoice_documents(existing["id"], file_id, user['id'])
+                invoice = await update_invoice(file_id, {"status": "Processed"}) or invoice
+            except Exception:
+                logger.exception(f"Linking the documents of invoice {existing['id']} to {file_id} failed")
+                await update_invoice(file_id, {"status": "Error"})
+                await delete_invoice_documents(file_id)  # Drop the rows linked before the failure
+                raise
+
+            return InvoiceResponse(
+                success=True,
+                data=parse_obj_as(Invoice, invoice),
+                message="Duplicate of an already processed invoice, reused its extracted data"
+            )
 
-        # Upload to Supabase Storage
+        # Upload to Supabase Storage (streamed from the spooled file)
         with open(temp_file_path, "rb") as f:
-            await upload_file_to_storage(STORAGE_BUCKET, storage_path, f)
+            await upload_file_to_storage(STORAGE_BUCKET, storage_path, f, content_type=upload_info["mime_type"])
         # Get public URL
         file_url = get_file_url(STORAGE_BUCKET, storage_path)
 
@@ -101,7 +153,8 @@ async def upload_invoice(
             "status": "Uploaded",  # Changed from "Pending" to "Uploaded"
             "file_url": file_url,
             "user_id": user['id'],
-            "storage_path": storage_path
+            "storage_path": storage_path,
+            "content_hash": content_hash
         }
 
         # Store in database
@@ -112,16 +165,13 @@ async def upload_invoice(
             os.unlink(temp_file_path)
             raise HTTPException(status_code=500, detail="Failed to create invoice record")
 
-        # If it's a PDF file, add the conversion task
+        # If it's a PDF file, queue it for the ingestion workers
         if file_ext.lower() == '.pdf':
-            # Add the background task for PDF to PNG conversion
-            background_tasks.add_task(
-                convert_pdf_to_png,
-                temp_file_path,
-                file_id,
-                storage_path,
-                user['id']
-            )
+            try:
+                await asyncio.to_thread(enqueue_pdf_ingestion, temp_file_path, file_id, storage_path, user['id'])
+            except Exception:
+                await update_invoice(file_id, {"status": "Error"})
+                raise
         else:
             # For non-PDF files (like PNGs), mark as processed right away
             await update_invoice(file_id, {"status": "Processed"})
@@ -140,6 +190,8 @@ async def upload_invoice(
                 os.unlink(temp_file_path)
             except:
                 pass
+        if isinstance(e, HTTPException):
+            raise
         return InvoiceResponse(success=False, message=f"Error uploading invoice: {str(e)}")
 
 
@@ -283,6 +335,26 @@ async def check_schema():
     except Exception as e:
         return {"error": str(e)}
 
+@router.get("/ocr-stats")
+async def get_ocr_stats():
+    """OCR queue depth and wait-time metrics, as published by the ingestion workers (where OCR runs, embedded ones included)"""
+    workers = await asyncio.to_thread(get_job_queue().worker_stats)
+    per_worker = {worker_id: stats["ocr"] for worker_id, stats in workers.items() if "ocr" in stats}
+    return {
+        "success": True,
+        "data": {
+            "workers": len(per_worker),
+            **aggregate_ocr_stats(list(per_worker.values())),
+            "per_worker": per_worker,
+        }
+    }
+
+@router.get("/ingestion-stats")
+async def get_ingestion_stats():
+    """Ingestion job counts per stage and status"""
+    stats = await asyncio.to_thread(get_job_queue().get_stats)
+    return {"success": True, "data": stats}
+
 @router.get("/{invoice_id}", response_model=InvoiceResponse)
 async def get_invoice_by_id(
     invoice_id: str = Path(...),
@@ -578,8 +650,6 @@ async def get_extracted_text(invoice_id: str, user=None):
             }
 
         # Extract text from PDF or PNG
-        from PIL import Image
-        import pytesseract
         import fitz  # PyMuPDF
 
         extracted_text = ""
@@ -598,8 +668,7 @@ async def get_extracted_text(invoice_id: str, user=None):
         # If it's an image
         elif pdf_path.lower().endswith(('.png', '.jpg', '.jpeg')):
             try:
-                img = Image.open(pdf_path)
-                extracted_text = pytesseract.image_to_string(img)
+                extracted_text = await ocr_executor.run(pdf_path)
             except Exception as img_err:
                 return {"success": False, "message": f"Image extraction error: {str(img_err)}"}
 
@@ -642,11 +711,13 @@ async def delete_invoice_by_id(
         if invoice["user_id"] != user['id']:
             return InvoiceResponse(success=False, message="Access denied")
 
-        # Delete file from storage
+        # Delete file from storage, unless a deduplicated upload still points at it
         storage_path = invoice["storage_path"]
-        await delete_file_from_storage(STORAGE_BUCKET, storage_path)
+        if await count_invoices_with_storage_path(storage_path) <= 1:
+            await delete_file_from_storage(STORAGE_BUCKET, storage_path)
 
-        # Delete from database
+        # Delete its extracted documents (and their vectors), then the invoice itself
+        await delete_invoice_documents(invoice_id)
         await delete_invoice(invoice_id)
 
         return InvoiceResponse(
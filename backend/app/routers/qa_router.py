@@ -1,9 +1,19 @@
 # zoku/backend/app/routers/qa_router.py
 
+import json
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Optional
-from ..services.e_qa_system import answer_question
+from ..services.e_qa_system import answer_question, stream_answer, save_answer, RETRIEVAL_MODES
+from ..services.e_openai_client import get_embedding_stats
+from ..services.e_vector_index import vector_index_registry
+from ..services.e_ann_index import ann_index_registry
+from ..services.e_lexical_index import lexical_index_registry
+from ..services.e_answer_cache import answer_cache
+from ..services.e_chat_writer import chat_writer
+from ..services.e_session_memory import session_memory
 from ..auth.auth_handler import get_current_user
 
 router = APIRouter(
@@ -15,12 +25,42 @@ class QuestionRequest(BaseModel):
     question: str
     document_ids: Optional[List[str]] = None
     session_id: Optional[str] = None
+    retrieval_mode: Optional[str] = None  # "vector" (default, QA_RETRIEVAL_MODE) or "hybrid" to opt into BM25 fusion
 
 class QuestionResponse(BaseModel):
     answer: str
     sources: dict
     session_id: Optional[str] = None
 
+@router.get("/embedding-stats")
+async def embedding_stats():
+    """Embedding cache hit/miss counters and batching metrics"""
+    return get_embedding_stats()
+
+@router.get("/index-stats")
+async def index_stats():
+    """Documents loaded in this process's vector indexes, per tenant"""
+    return {
+        "selected_documents": vector_index_registry.get_stats(),
+        "all_documents": ann_index_registry.get_stats(),
+        "lexical": lexical_index_registry.get_stats(),
+    }
+
+@router.get("/answer-cache-stats")
+async def answer_cache_stats():
+    """Semantic answer cache hit rate and invalidations"""
+    return answer_cache.get_stats()
+
+@router.get("/chat-writer-stats")
+async def chat_writer_stats():
+    """Write-behind chat history queue depth and flush lag"""
+    return chat_writer.get_stats()
+
+@router.get("/session-memory-stats")
+async def session_memory_stats():
+    """Conversation memory turns and summaries"""
+    return session_memory.get_stats()
+
 @router.post("", response_model=QuestionResponse)
 async def ask_document_question(
     request: QuestionRequest,
@@ -35,11 +75,15 @@ async def ask_document_question(
     if user is None:
         user = {"id": "test-user-esra"}
 
+    if request.retrieval_mode and request.retrieval_mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"retrieval_mode must be one of {', '.join(RETRIEVAL_MODES)}")
+
     result = await answer_question(
         query=request.question,
         user_id=user['id'],
         document_ids=request.document_ids,
-        session_id=request.session_id  # NEW: Pass session ID
+        session_id=request.session_id,  # NEW: Pass session ID
+        retrieval_mode=request.retrieval_mode
     )
 
     print(f"=== QA RESPONSE DEBUG ===")
@@ -49,3 +93,56 @@ async def ask_document_question(
     return result
 
 
+def _sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/stream")
+async def ask_document_question_stream(
+    request: QuestionRequest,
+    user=None
+):
+    """
+    Same as POST /qa, but streams the answer as server-sent events:
+    "token" events ({"text": ...}) as the answer is generated, then one "done" event
+    ({"sources": ..., "session_id": ...}) or an "error" event. The chat history is
+    written after the stream has been sent.
+    """
+    if user is None:
+        user = {"id": "test-user-esra"}
+
+    if request.retrieval_mode and request.retrieval_mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"retrieval_mode must be one of {', '.join(RETRIEVAL_MODES)}")
+
+    result = {}
+
+    async def events():
+        async for event, data in stream_answer(
+            query=request.question,
+            user_id=user['id'],
+            document_ids=request.document_ids,
+            session_id=request.session_id,
+            retrieval_mode=request.retrieval_mode,
+            result=result
+        ):
+            yield _sse_event(event, {"text": data} if event == "token" else data)
+
+    async def persist():
+        if "response" in result:
+            await save_answer(
+                request.question,
+                result["response"],
+                result["prepared"],
+                user_id=user['id'],
+                document_ids=request.document_ids,
+                session_id=request.session_id,
+                ctx=result["ctx"]
+            )
+            print(f"Request calls: {result['ctx'].get_stats()}")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(persist)
+    )
@@ -0,0 +1,320 @@
+# zoku/backend/app/services/e_ann_index.py
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import numpy as np
+from app.services.e_vector_index import (
+    EMBEDDING_DIM,
+    VectorIndex,
+    VectorIndexRegistry,
+    VECTOR_INDEX_REFRESH_SECONDS,
+    parse_embedding,
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+ANN_INDEX_DIR = os.getenv("ANN_INDEX_DIR", "vector_indexes")
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))  # Lists searched per query: higher = better recall, slower
+ANN_MIN_TRAIN_SIZE = int(os.getenv("ANN_MIN_TRAIN_SIZE", "1024"))  # Below this the search is exact
+KMEANS_ITERATIONS = 10
+KMEANS_MAX_TRAIN_POINTS = 20000
+
+
+def kmeans(vectors, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Spherical k-means on normalized vectors.
+
+    Returns:
+        np.ndarray: (k, dim) normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    if vectors.shape[0] > KMEANS_MAX_TRAIN_POINTS:
+        vectors = vectors[rng.choice(vectors.shape[0], KMEANS_MAX_TRAIN_POINTS, replace=False)]
+
+    centroids = vectors[rng.choice(vectors.shape[0], k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=k)
+
+        # Reseed empty clusters with random points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(vectors.shape[0], int(empty.sum()), replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+
+    return centroids.astype(np.float32)
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index over normalized vectors: k-means centroids partition the
+    documents into lists (each a flat VectorIndex) and a query only scans the
+    `nprobe` lists whose centroids are closest.
+
+    Until it holds `min_train_size` documents the index keeps one list and the
+    search is exact. It needs retraining (needs_training()) whenever it has doubled
+    in size since the last training, so incremental inserts keep the lists
+    balanced; add() never trains by itself, the caller runs train() off the event loop.
+
+    The centroids, lists and document assignments are replaced together by one
+    assignment of `_state`, so a search running while train() rebuilds them in
+    another thread sees either the old or the new lists, never a mix.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, nprobe=ANN_NPROBE, min_train_size=ANN_MIN_TRAIN_SIZE):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self._state = (None, [VectorIndex(dim)], {})  # (centroids, lists, doc_id -> list number)
+        self._trained_size = 0
+
+    @property
+    def centroids(self):
+        return self._state[0]
+
+    @property
+    def nlist(self):
+        return len(self._state[1])
+
+    def __len__(self):
+        return len(self._state[2])
+
+    def __contains__(self, doc_id):
+        return doc_id in self._state[2]
+
+    def ids(self):
+        return set(self._state[2])
+
+    def invoice_ids(self):
+        return set().union(*[inverted_list.invoice_ids() for inverted_list in self._state[1]])
+
+    def add(self, doc_id, embedding, metadata):
+        """Add or replace a document vector"""
+        if doc_id in self:
+            self.remove(doc_id)
+
+        vector = parse_embedding(embedding)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+
+        centroids, lists, list_of = self._state
+        list_no = int(np.argmax(centroids @ vector)) if centroids is not None else 0
+        lists[list_no].add(doc_id, vector, metadata)
+        list_of[doc_id] = list_no
+
+    def needs_training(self):
+        """Whether the index has grown enough since the last training to retrain"""
+        return len(self) >= self.min_train_size and len(self) >= 2 * self._trained_size
+
+    def remove(self, doc_id):
+        _, lists, list_of = self._state
+        list_no = list_of.pop(doc_id, None)
+        if list_no is None:
+            return False
+        return lists[list_no].remove(doc_id)
+
+    def remove_invoice(self, invoice_id):
+        for inverted_list in self._state[1]:
+            for doc_id in inverted_list.invoice_documents(invoice_id):
+                self.remove(doc_id)
+
+    def items(self):
+        ids, vectors, metadata = [], [], []
+        for inverted_list in self._state[1]:
+            list_ids, list_vectors, list_metadata = inverted_list.items()
+            ids.extend(list_ids)
+            vectors.append(list_vectors)
+            metadata.extend(list_metadata)
+        return ids, np.concatenate(vectors) if vectors else np.zeros((0, self.dim), dtype=np.float32), metadata
+
+    def _rebuild(self, ids, vectors, metadata, centroids):
+        lists = [VectorIndex(self.dim) for _ in range(len(centroids) if centroids is not None else 1)]
+        list_of = {}
+
+        assignments = np.zeros(len(ids), dtype=np.int64)
+        if centroids is not None:
+            for start in range(0, len(ids), 4096):
+                assignments[start:start + 4096] = np.argmax(vectors[start:start + 4096] @ centroids.T, axis=1)
+
+        for doc_id, vector, doc_metadata, list_no in zip(ids, vectors, metadata, assignments):
+            lists[list_no].add(doc_id, vector, doc_metadata)
+            list_of[doc_id] = int(list_no)
+
+        self._state = (centroids, lists, list_of)
+
+    def train(self):
+        """
+        (Re)compute the centroids, about sqrt(n) lists, and redistribute the documents.
+        Slow (k-means): run it in a worker thread, with no add() or remove() meanwhile.
+        """
+        ids, vectors, metadata = self.items()
+        nlist = max(1, int(np.sqrt(len(ids))))
+        self._rebuild(ids, vectors, metadata, kmeans(vectors, nlist))
+        self._trained_size = len(ids)
+        logger.info(f"Trained IVF index: {len(ids)} documents in {nlist} lists")
+
+    def search(self, query_embedding, k=5, invoice_ids=None, nprobe=None):
+        """
+        Approximate top-k documents by cosine similarity.
+
+        Args:
+            query_embedding: Query vector
+            k (int): Number of results
+            invoice_ids (list, optional): Only consider documents of these invoices (searched exactly)
+            nprobe (int, optional): Lists to scan, defaults to self.nprobe
+
+        Returns:
+            list: (doc_id, score, metadata) tuples, best first
+        """
+        query = parse_embedding(query_embedding)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        centroids, lists, _ = self._state
+        if centroids is None or invoice_ids is not None:
+            probe = range(len(lists))
+        else:
+            nprobe = min(nprobe or self.nprobe, len(lists))
+            probe = np.argsort(-(centroids @ query))[:nprobe]
+
+        results = []
+        for list_no in probe:
+            results.extend(lists[list_no].search(query, k=k, invoice_ids=invoice_ids))
+
+        results.sort(key=lambda hit: hit[1], reverse=True)
+        return results[:k]
+
+    def save(self, path):
+        """Write the index to an .npz file (atomically)"""
+        ids, vectors, metadata = self.items()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            ids=np.array(json.dumps(ids)),
+            vectors=vectors,
+            metadata=np.array(json.dumps(metadata)),
+            centroids=self.centroids if self.centroids is not None else np.zeros((0, self.dim), dtype=np.float32),
+            trained_size=np.array(self._trained_size),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Read an index written by save()"""
+        with np.load(path) as data:
+            centroids = data["centroids"]
+            index = cls(dim=data["vectors"].shape[1], **kwargs)
+            index._rebuild(
+                json.loads(str(data["ids"])),
+                data["vectors"],
+                json.loads(str(data["metadata"])),
+                centroids if len(centroids) else None
+            )
+            index._trained_size = int(data["trained_size"])
+        return index
+
+
+class AnnIndexRegistry(VectorIndexRegistry):
+    """
+    Per-tenant IVF indexes for searching across all of a user's documents.
+    Indexes are persisted under `index_dir`, so a restart only downloads the
+    embeddings of documents added since the last save. An index that outgrew its
+    training is retrained in a worker thread under the tenant lock.
+    """
+
+    def __init__(self, index_dir=ANN_INDEX_DIR, nprobe=ANN_NPROBE, refresh_seconds=VECTOR_INDEX_REFRESH_SECONDS):
+        super().__init__(refresh_seconds=refresh_seconds)
+        self.index_dir = index_dir
+        self.nprobe = nprobe
+        self._retraining = set()
+        self._tasks = set()
+
+    def _index_path(self, user_id):
+        name = hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.index_dir, f"{name}.npz")
+
+    def _tenant_user_ids(self, user_id):
+        # Open-corpus search only ever covers the user's own documents
+        # (the shared test users apply to explicitly selected invoices only)
+        return [user_id]
+
+    def _new_index(self, user_id):
+        path = self._index_path(user_id)
+        if os.path.exists(path):
+            try:
+                index = IVFFlatIndex.load(path, nprobe=self.nprobe)
+                logger.info(f"Loaded ANN index for {user_id} from {path} ({len(index)} documents)")
+                return index
+            except Exception as e:
+                logger.error(f"Could not load ANN index {path}, rebuilding: {str(e)}")
+        return IVFFlatIndex(nprobe=self.nprobe)
+
+    def _save(self, user_id, index):
+        try:
+            index.save(self._index_path(user_id))
+        except Exception as e:
+            logger.error(f"Could not save ANN index for {user_id}: {str(e)}")
+
+    def _sync(self, user_id, index):
+        # Runs in a worker thread, so it trains right away
+        before = index.ids()
+        super()._sync(user_id, index)
+        if index.needs_training():
+            index.train()
+        if index.ids() != before:
+            self._save(user_id, index)
+
+    def _train(self, user_id, index):
+        index.train()
+        self._save(user_id, index)
+
+    async def _fresh_index(self, user_id, required_invoice_ids=None):
+        # Open-corpus search always needs the whole tenant
+        return await super()._fresh_index(user_id)
+
+    async def add_document(self, doc_id, payload, metadata):
+        await super().add_document(doc_id, payload, metadata)
+        for user_id, index in list(self._indexes.items()):
+            if index.needs_training() and user_id not in self._retraining:
+                self._retraining.add(user_id)
+                task = asyncio.ensure_future(self._retrain(user_id))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _retrain(self, user_id):
+        """Retrain a tenant's index off the event loop; searches wait for the lock meanwhile"""
+        try:
+            async with self._lock(user_id):
+                index = self._indexes.get(user_id)
+                if index is not None and index.needs_training():
+                    await asyncio.to_thread(self._train, user_id, index)
+        except Exception as e:
+            logger.error(f"Could not retrain ANN index for {user_id}: {str(e)}")
+        finally:
+            self._retraining.discard(user_id)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({
+            "nprobe": self.nprobe,
+            "lists": {user_id: index.nlist for user_id, index in self._indexes.items()},
+            "retraining": len(self._retraining),
+        })
+        return stats
+
+
+# Shared registry for this process
+ann_index_registry = AnnIndexRegistry()
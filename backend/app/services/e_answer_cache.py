@@ -0,0 +1,198 @@
+# zoku/backend/app/services/e_answer_cache.py
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+import numpy as np
+from app.db.supabase_client import supabase
+from app.services.e_vector_index import parse_embedding
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))  # Cosine similarity of the questions
+ANSWER_CACHE_HISTORY_ROWS = int(os.getenv("ANSWER_CACHE_HISTORY_ROWS", "500"))  # Past answers loaded per user
+ANSWER_CACHE_RELOAD_SECONDS = float(os.getenv("ANSWER_CACHE_RELOAD_SECONDS", "300"))
+
+
+def _parse_timestamp(value):
+    """
+    Chat and document timestamps as timezone-aware UTC datetimes. Some are written
+    with and some without a 'T'; ones without an offset were written in this
+    server's local time.
+    """
+    if not value:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return timestamp.astimezone(timezone.utc)
+
+
+def documents_updated_at(index, invoice_ids):
+    """
+    When the documents of the invoices were last (re)processed, from the vector index metadata.
+
+    Returns:
+        datetime: Latest document timestamp (UTC), or None if an invoice has no documents
+    """
+    latest = None
+    for invoice_id in invoice_ids:
+        timestamps = [
+            _parse_timestamp(metadata.get("timestamp"))
+            for metadata in index.invoice_metadata(invoice_id)
+        ]
+        if not timestamps or None in timestamps:
+            return None
+        latest = max([latest, *timestamps]) if latest else max(timestamps)
+    return latest
+
+
+class SemanticAnswerCache:
+    """
+    Reuses the answer to an earlier question when a new question about the same set
+    of invoices is nearly identical (cosine similarity of the query embeddings at or
+    above the threshold) and none of those invoices has been reprocessed since.
+
+    Past answers are read from zokuai_chat_history, which already stores the query
+    embedding, response and document IDs of every question; only rows marked
+    cacheable (answered from the documents alone, not from session memory) are used.
+    Answers given by this process are added as they happen.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, history_rows=ANSWER_CACHE_HISTORY_ROWS,
+                 reload_seconds=ANSWER_CACHE_RELOAD_SECONDS):
+        self.threshold = threshold
+        self.history_rows = history_rows
+        self.reload_seconds = reload_seconds
+        self._entries = {}  # user_id -> {document set: [entry, ...]}
+        self._loaded_at = {}
+        self._locks = {}
+
+        # Metrics
+        self._lookups = 0
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def _document_set(document_ids):
+        return tuple(sorted(set(document_ids or [])))
+
+    @staticmethod
+    def _entry(entry_id, query_embedding, answer, answered_at):
+        vector = parse_embedding(query_embedding)
+        norm = np.linalg.norm(vector)
+        return {
+            "id": entry_id,
+            "vector": vector / norm if norm > 0 else vector,
+            "answer": answer,
+            "answered_at": _parse_timestamp(answered_at),
+        }
+
+    def _load_user(self, user_id):
+        rows = supabase.table("zokuai_chat_history")\
+            .select("id, query_embedding, response, document_ids, timestamp")\
+            .eq("user_id", user_id)\
+            .eq("cacheable", True)\
+            .order("timestamp", desc=True)\
+            .limit(self.history_rows)\
+            .execute().data or []
+
+        entries = {}
+        for row in reversed(rows):
+            if not row.get("document_ids") or row.get("query_embedding") is None or not row.get("response"):
+                continue
+            entries.setdefault(self._document_set(row["document_ids"]), []).append(
+                self._entry(row["id"], row["query_embedding"], row["response"], row.get("timestamp"))
+            )
+        return entries
+
+    async def _user_entries(self, user_id):
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            if time.monotonic() - self._loaded_at.get(user_id, float("-inf")) > self.reload_seconds:
+                self._entries[user_id] = await asyncio.to_thread(self._load_user, user_id)
+                self._loaded_at[user_id] = time.monotonic()
+            return self._entries[user_id]
+
+    async def lookup(self, user_id, document_ids, query_embedding, updated_at):
+        """
+        Find a cached answer.
+
+        Args:
+            user_id (str): Who is asking
+            document_ids (list): Selected invoices
+            query_embedding: Embedding of the new question
+            updated_at (datetime): When the invoices' documents were last processed, in UTC
+                                   (None if unknown: never a hit)
+
+        Returns:
+            dict: {"id", "answer", "similarity"} or None
+        """
+        self._lookups += 1
+        entries = (await self._user_entries(user_id)).get(self._document_set(document_ids), [])
+        if not entries or updated_at is None:
+            self._misses += 1
+            return None
+
+        query = parse_embedding(query_embedding)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        similarities = np.stack([entry["vector"] for entry in entries]) @ query
+        stale = False
+        for i in np.argsort(-similarities):
+            if similarities[i] < self.threshold:
+                break
+            entry = entries[int(i)]
+            if entry["answered_at"] is None or entry["answered_at"] < updated_at:
+                stale = True
+                continue
+            self._hits += 1
+            return {"id": entry["id"], "answer": entry["answer"], "similarity": float(similarities[i])}
+
+        if stale:
+            self._stale += 1
+        self._misses += 1
+        return None
+
+    def add(self, user_id, document_ids, query_embedding, answer, entry_id=None):
+        """Remember an answer given by this process (only answers that may be reused)"""
+        if user_id not in self._entries or not document_ids:
+            return
+        self._entries[user_id].setdefault(self._document_set(document_ids), []).append(
+            self._entry(entry_id, query_embedding, answer, datetime.now(timezone.utc).isoformat())
+        )
+
+    def invalidate_invoice(self, invoice_id):
+        """Forget every answer that involved the invoice (it was reprocessed or deleted)"""
+        for entries in self._entries.values():
+            for document_set in [key for key in entries if invoice_id in key]:
+                self._invalidations += len(entries.pop(document_set))
+
+    def get_stats(self):
+        """Hit rate and invalidation counters"""
+        return {
+            "enabled": ANSWER_CACHE_ENABLED,
+            "threshold": self.threshold,
+            "lookups": self._lookups,
+            "hits": self._hits,
+            "misses": self._misses,
+            "stale_misses": self._stale,
+            "hit_rate": round(self._hits / self._lookups, 4) if self._lookups else 0.0,
+            "invalidated_answers": self._invalidations,
+            "users": len(self._entries),
+            "cached_answers": sum(len(group) for entries in self._entries.values() for group in entries.values()),
+        }
+
+
+# Shared cache for this process
+answer_cache = SemanticAnswerCache()
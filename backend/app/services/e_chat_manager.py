@@ -3,9 +3,17 @@
 
 import uuid
 import json
+import heapq
+import base64
+from itertools import islice
 from datetime import datetime
 from app.db.supabase_client import supabase
 from app.services.e_document_processor import generate_embeddings
+from app.services.e_chat_writer import chat_writer
+from app.services.e_session_memory import session_memory
+
+# Messages per transcript page
+TRANSCRIPT_PAGE_SIZE = 50
 
 # EXTEND EXISTING FUNCTIONS - ADD THESE TO YOUR e_chat_manager.py:
 
@@ -41,44 +49,33 @@ async def create_chat_session(user_id: str, title: str, selected_documents: list
         return {"status": "error", "message": str(e)}
 
 
+def _embedded_count(value):
+    """Read an embedded PostgREST count, which comes back as [{"count": n}]"""
+    if isinstance(value, list) and value:
+        return value[0].get("count") or 0
+    if isinstance(value, dict):
+        return value.get("count") or 0
+    return 0
+
+
 async def get_chat_sessions(user_id: str, limit: int = 50, offset: int = 0):
     """
     Get user's chat sessions with message counts from both tables
     """
     try:
-        # Use the view we created, or query directly with JOIN
+        # One query: PostgREST aggregates both message tables per session (through their session_id foreign keys)
         result = supabase.table("zokuai_chat_sessions") \
-            .select("*, zokuai_chat_history(count)") \
+            .select("*, zokuai_chat_history(count), zokuai_chat_messages(count)") \
             .eq("user_id", user_id) \
             .eq("is_active", True) \
             .order("updated_at", desc=True) \
             .range(offset, offset + limit - 1) \
             .execute()
 
-        # Enhanced: Add actual message counts
         sessions = []
         for session in result.data:
-            # Count messages in both tables for this session
-            history_count = 0
-            messages_count = 0
-
-            try:
-                # Count from zokuai_chat_history (your main backend table)
-                history_result = supabase.table("zokuai_chat_history") \
-                    .select("id", count="exact") \
-                    .eq("session_id", session["id"]) \
-                    .execute()
-                history_count = history_result.count or 0
-
-                # Count from zokuai_chat_messages
-                messages_result = supabase.table("zokuai_chat_messages") \
-                    .select("id", count="exact") \
-                    .eq("session_id", session["id"]) \
-                    .execute()
-                messages_count = messages_result.count or 0
-
-            except Exception as count_error:
-                print(f"Warning: Could not count messages for session {session['id']}: {count_error}")
+            history_count = _embedded_count(session.pop("zokuai_chat_history", None))
+            messages_count = _embedded_count(session.pop("zokuai_chat_messages", None))
 
             # Add counts to session data
             session["history_message_count"] = history_count
@@ -95,9 +92,124 @@ async def get_chat_sessions(user_id: str, limit: int = 50, offset: int = 0):
         return {"status": "error", "message": str(e)}
 
 
-async def get_chat_session_with_messages(session_id: str, user_id: str):
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    try:
+        key = tuple(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii"))))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if len(key) != 4 or key[1] not in (0, 1):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def _sort_time(value):
+    """Timestamps of both tables in one comparable form (some are written with a space instead of 'T')"""
+    return str(value).replace(" ", "T")
+
+
+def _apply_cursor(query, time_column, source, cursor_key):
     """
-    Get a specific session with messages from BOTH tables
+    Keep rows at or before the cursor. At equal times history messages sort before
+    zokuai_chat_messages, and the ID tie-break only applies to the cursor's own table;
+    the exact cut (within a history row) is made in Python.
+    """
+    if not cursor_key:
+        return query
+    timestamp, cursor_source, row_id, _ = cursor_key
+    if cursor_source < source:
+        return query.lt(time_column, timestamp)
+    if cursor_source > source:
+        return query.lte(time_column, timestamp)
+    return query.or_(f'{time_column}.lt."{timestamp}",and({time_column}.eq."{timestamp}",id.lte."{row_id}")')
+
+
+def _history_page(session_id, cursor_key, limit):
+    """Messages from zokuai_chat_history, newest first (each row is a question and an answer)"""
+    query = supabase.table("zokuai_chat_history") \
+        .select("id, query, response, timestamp") \
+        .eq("session_id", session_id)
+    query = _apply_cursor(query, "timestamp", 0, cursor_key)
+    rows = query.order("timestamp", desc=True).order("id", desc=True).limit(limit).execute().data or []
+
+    for msg in rows:
+        yield {
+            "id": f"{msg['id']}_response",
+            "type": "system",
+            "text": msg["response"],
+            "timestamp": msg["timestamp"],
+            "source": "history",
+            "_key": (_sort_time(msg["timestamp"]), 0, msg["id"], 1)
+        }
+        yield {
+            "id": msg["id"],
+            "type": "user",
+            "text": msg["query"],
+            "timestamp": msg["timestamp"],
+            "source": "history",
+            "_key": (_sort_time(msg["timestamp"]), 0, msg["id"], 0)
+        }
+
+
+def _messages_page(session_id, cursor_key, limit):
+    """Messages from zokuai_chat_messages, newest first"""
+    query = supabase.table("zokuai_chat_messages") \
+        .select("id, role, content, created_at") \
+        .eq("session_id", session_id)
+    query = _apply_cursor(query, "created_at", 1, cursor_key)
+    rows = query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute().data or []
+
+    for msg in rows:
+        yield {
+            "id": msg["id"],
+            "type": msg.get("role", "system"),
+            "text": msg["content"],
+            "timestamp": msg["created_at"],
+            "source": "messages",
+            "_key": (_sort_time(msg["created_at"]), 1, msg["id"], 0)
+        }
+
+
+def _transcript_page(session_id, cursor=None, limit=TRANSCRIPT_PAGE_SIZE):
+    """
+    One page of a session's transcript, going back in time.
+
+    Both tables are read newest first with a (timestamp, id) keyset and merged
+    lazily, so each page reads at most limit + 1 rows per table.
+
+    Returns:
+        dict: {"messages" (oldest first), "next_cursor" (for older messages, or None), "has_more"}
+    """
+    cursor_key = _decode_cursor(cursor) if cursor else None
+
+    merged = heapq.merge(
+        _history_page(session_id, cursor_key, limit + 1),
+        _messages_page(session_id, cursor_key, limit + 1),
+        key=lambda message: message["_key"],
+        reverse=True
+    )
+    if cursor_key:
+        merged = (message for message in merged if tuple(message["_key"]) < cursor_key)
+
+    page = list(islice(merged, limit + 1))
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    next_cursor = _encode_cursor(page[-1]["_key"]) if has_more else None
+    for message in page:
+        del message["_key"]
+    page.reverse()
+
+    return {"messages": page, "next_cursor": next_cursor, "has_more": has_more}
+
+
+async def get_chat_session_with_messages(session_id: str, user_id: str, limit: int = TRANSCRIPT_PAGE_SIZE):
+    """
+    Get a specific session with its latest messages (from BOTH tables).
+    Older messages are loaded with get_session_messages and session["next_cursor"].
     """
     try:
         # Get session details
@@ -113,58 +225,12 @@ async def get_chat_session_with_messages(session_id: str, user_id: str):
 
         session = session_result.data[0]
 
-        # Get messages from zokuai_chat_history (main backend table with embeddings)
-        history_result = supabase.table("zokuai_chat_history") \
-            .select("*") \
-            .eq("session_id", session_id) \
-            .order("timestamp", desc=False) \
-            .execute()
+        page = _transcript_page(session_id, limit=limit)
+        session["messages"] = page["messages"]
+        session["next_cursor"] = page["next_cursor"]
+        session["has_more_messages"] = page["has_more"]
 
-        # Get messages from zokuai_chat_messages (if any)
-        messages_result = supabase.table("zokuai_chat_messages") \
-            .select("*") \
-            .eq("session_id", session_id) \
-            .order("created_at", desc=False) \
-            .execute()
-
-        # Combine and format messages
-        all_messages = []
-
-        # Add history messages (these have query/response pairs)
-        for msg in history_result.data:
-            all_messages.append({
-                "id": msg["id"],
-                "type": "user",
-                "text": msg["query"],
-                "timestamp": msg["timestamp"],
-                "source": "history"
-            })
-            all_messages.append({
-                "id": f"{msg['id']}_response",
-                "type": "system",
-                "text": msg["response"],
-                "timestamp": msg["timestamp"],
-                "source": "history"
-            })
-
-        # Add chat messages (these are individual messages)
-        for msg in messages_result.data:
-            all_messages.append({
-                "id": msg["id"],
-                "type": msg.get("role", "system"),
-                "text": msg["content"],
-                "timestamp": msg["created_at"],
-                "source": "messages"
-            })
-
-        # Sort all messages by timestamp
-        all_messages.sort(key=lambda x: x["timestamp"])
-
-        session["messages"] = all_messages
-        session["history_messages"] = history_result.data
-        session["chat_messages"] = messages_result.data
-
-        print(f"📖 Retrieved session {session_id} with {len(all_messages)} total messages")
+        print(f"📖 Retrieved session {session_id} with its latest {len(page['messages'])} messages")
         return {"status": "success", "session": session}
 
     except Exception as e:
@@ -172,6 +238,33 @@ async def get_chat_session_with_messages(session_id: str, user_id: str):
         return {"status": "error", "message": str(e)}
 
 
+async def get_session_messages(session_id: str, user_id: str, cursor: str = None, limit: int = TRANSCRIPT_PAGE_SIZE):
+    """
+    Get one page of a session's messages, older than the cursor (latest page without one)
+    """
+    try:
+        session_result = supabase.table("zokuai_chat_sessions") \
+            .select("id") \
+            .eq("id", session_id) \
+            .eq("user_id", user_id) \
+            .eq("is_active", True) \
+            .execute()
+
+        if not session_result.data:
+            return {"status": "error", "message": "Session not found"}
+
+        page = _transcript_page(session_id, cursor=cursor, limit=limit)
+
+        print(f"📖 Retrieved {len(page['messages'])} messages of session {session_id}")
+        return {"status": "success", **page}
+
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    except Exception as e:
+        print(f"❌ Error retrieving session messages: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
 async def update_chat_session(session_id: str, user_id: str, **updates):
     """
     Update session metadata
@@ -208,6 +301,7 @@ async def delete_chat_session(session_id: str, user_id: str):
             .execute()
 
         if result.data:
+            session_memory.forget(session_id)
             print(f"🗑️ Soft deleted session {session_id}")
             return {"status": "success"}
         else:
@@ -221,15 +315,19 @@ async def delete_chat_session(session_id: str, user_id: str):
 # UPDATE YOUR EXISTING store_chat_message FUNCTION:
 # Add session_id parameter and update session stats
 
-async def store_chat_message(user_id, query, response, document_ids=None, session_id=None):
+async def store_chat_message(user_id, query, response, document_ids=None, session_id=None, ctx=None, cacheable=False):
     """
-    Store a chat message in zokuai_chat_history with session support
+    Store a chat message in zokuai_chat_history with session support.
+    The row is written behind by the chat writer, which also updates the session stats;
+    the message ID is returned right away.
+    ctx (QARequestContext, optional) reuses the query embedding computed while answering.
+    cacheable marks answers the semantic answer cache may serve to other questions.
     """
     try:
         message_id = str(uuid.uuid4())
 
         # Generate embeddings for the query (for future similarity search)
-        query_embedding = await generate_embeddings(query)
+        query_embedding = await ctx.embedding(query) if ctx else await generate_embeddings(query)
 
         # Store the chat message WITH session_id in your existing table
         embedding_list = query_embedding.tolist() if hasattr(query_embedding, 'tolist') else query_embedding
@@ -242,16 +340,13 @@ async def store_chat_message(user_id, query, response, document_ids=None, sessio
             "response": response,
             "document_ids": document_ids,
             "timestamp": datetime.now().isoformat(),
-            "session_id": session_id  # NEW: Link to session
+            "session_id": session_id,  # NEW: Link to session
+            "cacheable": cacheable
         }
 
-        result = supabase.table("zokuai_chat_history").insert(message_data).execute()
-
-        # Update session message count and timestamp
-        if session_id:
-            await update_session_stats(session_id, user_id)
+        await chat_writer.submit(message_data)
 
-        print(f"💬 Stored chat message {message_id} in session {session_id}")
+        print(f"💬 Queued chat message {message_id} for session {session_id}")
         return {"status": "success", "message_id": message_id}
 
     except Exception as e:
@@ -259,31 +354,57 @@ async def store_chat_message(user_id, query, response, document_ids=None, sessio
         return {"status": "error", "message": str(e)}
 
 
-async def update_session_stats(session_id: str, user_id: str):
+def increment_session_counts(deltas: dict):
     """
-    Update session statistics (message count, last updated)
+    Add to the message count of several sessions in one atomic call (and touch updated_at).
+    Each session is only updated if it belongs to the given user.
+
+    Args:
+        deltas (dict): (session_id, user_id) -> number of new messages
+
+    Returns:
+        int: Number of sessions updated
     """
-    try:
-        # Count messages in zokuai_chat_history for this session
-        count_result = supabase.table("zokuai_chat_history") \
-            .select("id", count="exact") \
-            .eq("session_id", session_id) \
-            .execute()
+    if not deltas:
+        return 0
+    result = supabase.rpc(
+        "increment_session_message_counts",
+        {"deltas": [
+            {"session_id": session_id, "user_id": user_id, "delta": delta}
+            for (session_id, user_id), delta in deltas.items()
+        ]}
+    ).execute()
 
-        message_count = count_result.count or 0
+    print(f"📊 Updated stats of {len(deltas)} sessions (+{sum(deltas.values())} messages)")
+    return result.data or 0
 
-        # Update session
-        await update_chat_session(
-            session_id,
-            user_id,
-            message_count=message_count,
-            updated_at=datetime.now().isoformat()
-        )
 
-        print(f"📊 Updated session {session_id} stats: {message_count} messages")
+def reconcile_session_counts(since: datetime = None, skip_session_ids: list = None, idle_seconds: float = 0):
+    """
+    Recount the messages of sessions updated since `since` (all sessions if None)
+    and repair counts that drifted.
 
-    except Exception as e:
-        print(f"❌ Error updating session stats: {str(e)}")
+    Args:
+        since (datetime, optional): Only check sessions updated since then
+        skip_session_ids (list, optional): Sessions left alone (their increments are still pending)
+        idle_seconds (float): Only check sessions without new messages or increments for this long,
+                              so increments other processes still buffer are not counted twice
+
+    Returns:
+        int: Number of sessions repaired
+    """
+    result = supabase.rpc(
+        "reconcile_session_message_counts",
+        {
+            "since": since.isoformat() if since else None,
+            "skip_session_ids": list(skip_session_ids or []),
+            "idle_seconds": idle_seconds,
+        }
+    ).execute()
+
+    repaired = result.data or 0
+    print(f"📊 Reconciled session message counts: {repaired} repaired")
+    return repaired
 
 
 def generate_session_title(first_message: str) -> str:
@@ -0,0 +1,248 @@
+# zoku/backend/app/services/e_chat_writer.py
+
+import os
+import time
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from app.db.supabase_client import supabase
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "1000"))  # Messages allowed to wait for a write
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "50"))
+CHAT_WRITE_FLUSH_SECONDS = float(os.getenv("CHAT_WRITE_FLUSH_SECONDS", "0.5"))  # Longest a message waits for its batch
+SESSION_RECONCILE_SECONDS = float(os.getenv("SESSION_RECONCILE_SECONDS", "3600"))  # 0 disables reconciliation
+# Sessions with messages or increments this recent are not reconciled: another API process
+# may still hold their increment. Must stay well above CHAT_WRITE_FLUSH_SECONDS.
+SESSION_RECONCILE_IDLE_SECONDS = float(os.getenv("SESSION_RECONCILE_IDLE_SECONDS", "60"))
+
+
+class ChatWriter:
+    """
+    Write-behind persistence of chat history rows.
+
+    Answers are queued (bounded: when `max_queue` rows are waiting, submitters wait)
+    and a background task inserts them into zokuai_chat_history in batches of at
+    most `batch_size`, at least every `flush_seconds`. After each batch the message
+    counts of the sessions it touched are incremented in one call; increments that
+    fail are kept and retried with the next batch (or after `flush_seconds` if no
+    batch comes), and reconcile() repairs any drift.
+    """
+
+    def __init__(self, max_queue=CHAT_WRITE_QUEUE_SIZE, batch_size=CHAT_WRITE_BATCH_SIZE,
+                 flush_seconds=CHAT_WRITE_FLUSH_SECONDS):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = None
+        self._task = None
+        self._lock = None
+        self._pending_deltas = Counter()  # (session_id, user_id) -> messages not counted yet
+
+        # Metrics
+        self._submitted = 0
+        self._blocked = 0
+        self._written = 0
+        self._batches = 0
+        self._failed = 0
+        self._session_updates = 0
+        self._increment_failures = 0
+        self._reconciliations = 0
+        self._repaired_sessions = 0
+        self._last_reconciled_at = None
+        self._total_lag = 0.0
+        self._max_lag = 0.0
+        self._last_lag = 0.0
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_queue)
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            self._task = asyncio.ensure_future(self._run())
+            logger.info(f"Started chat writer (batch size {self.batch_size}, flush every {self.flush_seconds}s)")
+
+    async def submit(self, row):
+        """
+        Queue a zokuai_chat_history row for writing.
+
+        Args:
+            row (dict): The row to insert (with "id", "user_id" and "session_id")
+        """
+        self._ensure_started()
+        item = (row, time.monotonic())
+        self._submitted += 1
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._blocked += 1
+            await self._queue.put(item)
+
+    async def _next_batch(self):
+        """
+        Wait for a row, then collect more until the batch is full or the flush interval has passed.
+        While failed increments are pending, returns an empty batch after one flush interval
+        without rows, so they are retried.
+        """
+        if self._pending_deltas:
+            try:
+                batch = [await asyncio.wait_for(self._queue.get(), self.flush_seconds)]
+            except asyncio.TimeoutError:
+                return []
+        else:
+            batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                async with self._lock:
+                    if batch:
+                        await self._write(batch)
+                    else:
+                        await self._increment_sessions()
+            except Exception as e:
+                logger.error(f"Chat writer batch failed: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _insert(self, rows):
+        supabase.table("zokuai_chat_history").insert(rows).execute()
+
+    async def _write(self, batch):
+        rows = [row for row, _ in batch]
+        try:
+            await asyncio.to_thread(self._insert, rows)
+            written = batch
+        except Exception as e:
+            # One bad row should not lose everyone else's message: retry one by one
+            logger.warning(f"Chat history insert of {len(rows)} rows failed ({str(e)}), retrying individually")
+            written = []
+            for row, enqueued_at in batch:
+                try:
+                    await asyncio.to_thread(self._insert, [row])
+                    written.append((row, enqueued_at))
+                except Exception as row_error:
+                    self._failed += 1
+                    logger.error(f"Dropped chat message {row.get('id')}: {str(row_error)}")
+
+        now = time.monotonic()
+        self._batches += 1
+        self._written += len(written)
+        for _, enqueued_at in written:
+            lag = now - enqueued_at
+            self._total_lag += lag
+            self._max_lag = max(self._max_lag, lag)
+            self._last_lag = lag
+
+        self._pending_deltas.update((row["session_id"], row["user_id"]) for row, _ in written if row.get("session_id"))
+        sessions = len(self._pending_deltas)
+        await self._increment_sessions()
+
+        logger.debug(f"Wrote {len(written)}/{len(batch)} chat messages, updated {sessions} sessions")
+
+    async def _increment_sessions(self):
+        if not self._pending_deltas:
+            return
+        from app.services.e_chat_manager import increment_session_counts
+
+        deltas, self._pending_deltas = dict(self._pending_deltas), Counter()
+        try:
+            await asyncio.to_thread(increment_session_counts, deltas)
+            self._session_updates += len(deltas)
+        except Exception as e:
+            # Keep the deltas for the next batch
+            self._increment_failures += 1
+            self._pending_deltas.update(deltas)
+            logger.warning(f"Session count increment failed ({str(e)}), retrying with the next batch")
+
+    async def reconcile(self, since=None, idle_seconds=SESSION_RECONCILE_IDLE_SECONDS):
+        """
+        Recount the messages of sessions updated since `since` (all if None) and repair drift.
+        Runs between batches, so no increment of this process is in flight while the counts
+        are read. Sessions whose increments are still pending here are skipped: their
+        messages are already in the table, the pending increment will add them. Other API
+        processes may buffer increments too, so only sessions idle for `idle_seconds` are checked.
+        """
+        from app.services.e_chat_manager import reconcile_session_counts
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._increment_sessions()
+            skip_session_ids = {session_id for session_id, _ in self._pending_deltas}
+            repaired = await asyncio.to_thread(reconcile_session_counts, since, list(skip_session_ids), idle_seconds)
+
+        self._reconciliations += 1
+        self._repaired_sessions += repaired
+        self._last_reconciled_at = datetime.now().isoformat()
+        return repaired
+
+    async def reconcile_periodically(self, interval=SESSION_RECONCILE_SECONDS):
+        """Reconcile every `interval` seconds the sessions updated in the last two intervals (run as a task)"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile(since=datetime.now(timezone.utc) - timedelta(seconds=2 * interval))
+            except Exception as e:
+                logger.error(f"Session count reconciliation failed: {str(e)}")
+
+    async def flush(self):
+        """Wait until every queued message has been written"""
+        if self._queue is not None and self._task is not None and not self._task.done():
+            await self._queue.join()
+
+    async def close(self):
+        """Flush and stop the background task (on shutdown)"""
+        await self.flush()
+        if self._lock is not None:
+            async with self._lock:
+                await self._increment_sessions()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def get_stats(self):
+        """Queue depth and flush lag (seconds from submit to write)"""
+        pending = self._queue.qsize() if self._queue is not None else 0
+        return {
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_seconds": self.flush_seconds,
+            "pending": pending,
+            "submitted": self._submitted,
+            "blocked_submits": self._blocked,
+            "written": self._written,
+            "failed": self._failed,
+            "batches": self._batches,
+            "avg_batch_size": round(self._written / self._batches, 2) if self._batches else 0.0,
+            "session_updates": self._session_updates,
+            "pending_session_deltas": sum(self._pending_deltas.values()),
+            "increment_failures": self._increment_failures,
+            "reconciliations": self._reconciliations,
+            "repaired_sessions": self._repaired_sessions,
+            "last_reconciled_at": self._last_reconciled_at,
+            "avg_lag_seconds": round(self._total_lag / self._written, 4) if self._written else 0.0,
+            "max_lag_seconds": round(self._max_lag, 4),
+            "last_lag_seconds": round(self._last_lag, 4),
+        }
+
+
+# Shared writer for this process
+chat_writer = ChatWriter()
@@ -1,18 +1,31 @@
 import os
+import asyncio
 import pytesseract
 from PIL import Image
 import logging
 import json
 import uuid
 import datetime
+import socket
 import numpy as np
 from app.db.supabase_client import supabase
-from app.services.e_openai_client import get_embeddings  # FIXED: Use correct function name
+from app.services.e_openai_client import get_embeddings, get_embeddings_batch  # FIXED: Use correct function name
+from app.services.e_text_chunker import chunk_text
+from app.services.e_ocr_executor import ocr_executor
+from app.services.e_vector_index import vector_index_registry, parse_document_metadata
+from app.services.e_ann_index import ann_index_registry
+from app.services.e_lexical_index import lexical_index_registry
+from app.services.e_answer_cache import answer_cache
+from app.services.e_job_queue import get_job_queue
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# How often the API process checks for documents changed by the ingestion workers
+DOCUMENT_CHANGES_POLL_SECONDS = float(os.getenv("DOCUMENT_CHANGES_POLL_SECONDS", "2"))
+PROCESS_ID = f"{socket.gethostname()}-{os.getpid()}"
+
 def extract_text_from_png(image_path):
     """
     Extract text from a PNG image using OCR.
@@ -38,6 +51,52 @@ def extract_text_from_png(image_path):
         logger.error(f"Error extracting text from {image_path}: {str(e)}")
         return ""
 
+async def extract_text_from_png_async(image_path):
+    """
+    Extract text from an image using OCR in the OCR worker pool, without blocking the event loop.
+
+    Args:
+        image_path (str): Path to the image
+
+    Returns:
+        str: Extracted text from the image ("" on failure)
+    """
+    try:
+        text = await ocr_executor.run(image_path)
+        logger.info(f"Successfully extracted text from {image_path} ({len(text)} characters)")
+        return text
+    except Exception as e:
+        logger.error(f"Error extracting text from {image_path}: {str(e)}")
+        return ""
+
+
+async def extract_text_from_pages(page_paths):
+    """
+    OCR several page images in parallel using the OCR worker pool.
+
+    Args:
+        page_paths (list): Paths to the page images, in page order
+
+    Returns:
+        list: Extracted text per page, in the same order as page_paths
+    """
+    return await asyncio.gather(*[extract_text_from_png_async(path) for path in page_paths])
+
+
+def join_page_texts(page_texts):
+    """
+    Put the page texts back together in page order.
+    Multi-page documents get a page marker before each page so the LLM can cite pages.
+    """
+    if len(page_texts) == 1:
+        return page_texts[0]
+
+    parts = []
+    for page_num, text in enumerate(page_texts, start=1):
+        if text and text.strip():
+            parts.append(f"--- Page {page_num} ---\n{text.strip()}")
+    return "\n\n".join(parts)
+
 async def generate_embeddings(text):
     """
     Generate vector embeddings for the given text.
@@ -58,10 +117,196 @@ async def generate_embeddings(text):
         logger.error(f"Error generating embeddings: {str(e)}")
         raise
 
-async def process_document(png_path, user_id=None, document_type="invoice", skip_storage=False, invoice_id=None):
+async def generate_chunk_embeddings(text):
+    """
+    Split text into overlapping token windows and embed all of them in batched API calls.
+
+    Returns:
+        tuple: (chunks, document_embedding) where each chunk dict has an "embedding"
+               and document_embedding is the normalized mean of the chunk embeddings
+    """
+    chunks = chunk_text(text)
+    vectors = await get_embeddings_batch([chunk["content"] for chunk in chunks])
+
+    for chunk, vector in zip(chunks, vectors):
+        chunk["embedding"] = vector
+
+    # ada-002 vectors are unit length, so the normalized mean is a good whole-document vector
+    matrix = np.array(vectors, dtype=np.float32)
+    document_embedding = matrix.mean(axis=0)
+    norm = np.linalg.norm(document_embedding)
+    if norm > 0:
+        document_embedding = document_embedding / norm
+
+    logger.info(f"Embedded {len(chunks)} chunks for text ({len(text)} chars)")
+    return chunks, document_embedding
+
+
+async def extract_text_for_pages(pages):
+    """
+    Fill in the text of every page that has no text layer by OCR'ing its image.
+
+    Args:
+        pages (list): Page dicts as returned by extract_pdf_pages
+
+    Returns:
+        list: The same page dicts, with "text" set for every page
+    """
+    ocr_pages = [page for page in pages if page["method"] == "ocr" and page.get("image_path")]
+
+    if ocr_pages:
+        print(f"OCR needed for {len(ocr_pages)} of {len(pages)} pages")
+        texts = await extract_text_from_pages([page["image_path"] for page in ocr_pages])
+        for page, text in zip(ocr_pages, texts):
+            page["text"] = text
+
+    return pages
+
+
+async def extract_document_text(png_path, pages=None):
+    """
+    Extract the text of a document (step 1 of process_document).
+
+    Args:
+        png_path (str): Path to the PNG file (used when pages is not given)
+        pages (list, optional): Page dicts from extract_pdf_pages for PDF documents
+
+    Returns:
+        tuple: (extracted_text, page_report) where page_report lists the method used per page
+    """
+    if pages:
+        print(f"Starting text extraction for {len(pages)} pages...")
+        pages = await extract_text_for_pages(pages)
+        extracted_text = join_page_texts([page["text"] or "" for page in pages])
+    else:
+        print("Starting text extraction...")
+        extracted_text = await extract_text_from_png_async(png_path)
+        pages = [{"page": 1, "method": "ocr", "text": extracted_text, "image_path": png_path}]
+
+    page_report = [
+        {"page": page["page"], "method": page["method"], "chars": len(page["text"] or "")}
+        for page in pages
+    ]
+    return extracted_text, page_report
+
+
+async def embed_and_store_document(extracted_text, source, user_id=None, document_type="invoice",
+                                   skip_storage=False, invoice_id=None, page_report=None):
+    """
+    Generate embeddings for extracted text and store both in the database (steps 2 and 3 of process_document).
+    Raises on failure so callers can retry.
+
+    Args:
+        extracted_text (str): Text of the document
+        source (str): File name the text came from
+        user_id (str, optional): User ID associated with this document
+        document_type (str): Type of document being processed
+        skip_storage (bool): If True, skip storing in database
+        invoice_id (str, optional): Invoice ID to link back to original invoice
+        page_report (list, optional): Per page extraction methods from extract_document_text
+
+    Returns:
+        dict: Result of the processing
+    """
+    page_report = page_report or [{"page": 1, "method": "ocr", "chars": len(extracted_text)}]
+
+    # Generate embeddings for the text, per token window
+    print("Starting embedding generation...")
+    chunks, embeddings = await generate_chunk_embeddings(extracted_text)
+    print(f"✓ Embeddings generated successfully for {len(chunks)} chunks")
+
+    # Generate a document ID
+    doc_id = str(uuid.uuid4())
+    print(f"✓ Generated document ID: {doc_id}")
+
+    # Create document metadata
+    metadata = {
+        "source": source,
+        "user_id": user_id,
+        "type": document_type,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "invoice_id": invoice_id,
+        "page_count": len(page_report),
+        "page_methods": [page["method"] for page in page_report],
+        "chunk_count": len(chunks)
+    }
+    print(f"✓ Created metadata: {metadata}")
+
+    # Convert embeddings to list format for storage
+    if hasattr(embeddings, 'tolist'):
+        embedding_list = embeddings.tolist()
+    elif isinstance(embeddings, list):
+        embedding_list = embeddings
+    else:
+        embedding_list = list(embeddings)
+
+    # Store in Supabase if not skipped
+    if not skip_storage:
+        print("Storing document in database...")
+        print(f"Embedding converted to list, length: {len(embedding_list)}")
+
+        # Store both text and embeddings
+        insert_data = {
+            "id": doc_id,
+            "content": extracted_text,
+            "embedding": embedding_list,
+            "metadata": json.dumps(metadata),
+            "invoice_id": invoice_id,
+            "user_id": user_id,
+        }
+
+        print(f"Inserting data into zokuai_documents table...")
+        result = supabase.table("zokuai_documents").insert(insert_data).execute()
+
+        print(f"✓ Successfully stored in database")
+        print(f"Database result: {result}")
+
+        # Store the chunks, linked to the document and invoice
+        chunk_rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "document_id": doc_id,
+                "invoice_id": invoice_id,
+                "user_id": user_id,
+                "chunk_index": chunk["chunk_index"],
+                "content": chunk["content"],
+                "token_count": chunk["token_count"],
+                "embedding": chunk["embedding"],
+            }
+            for chunk in chunks
+        ]
+        insert_chunk_rows(chunk_rows)
+        print(f"✓ Stored {len(chunk_rows)} chunks")
+
+        # Make the document searchable right away in this process
+        await vector_index_registry.add_document(doc_id, embedding_list, metadata)
+        await ann_index_registry.add_document(doc_id, embedding_list, metadata)
+        await lexical_index_registry.add_document(doc_id, extracted_text, metadata)
+
+        # Answers about the previous version of this invoice are out of date
+        if invoice_id:
+            answer_cache.invalidate_invoice(invoice_id)
+            await publish_document_change(invoice_id, user_id)
+    else:
+        print("Skipping database storage as requested")
+
+    logger.info(f"Successfully processed document {doc_id}")
+    return {
+        "status": "success",
+        "document_id": doc_id,
+        "extracted_text": extracted_text,
+        "text_length": len(extracted_text),
+        "embedding_length": len(embedding_list) if not skip_storage else 0,
+        "chunk_count": len(chunks),
+        "pages": page_report,
+        "metadata": metadata
+    }
+
+
+async def process_document(png_path, user_id=None, document_type="invoice", skip_storage=False, invoice_id=None, pages=None):
     """
     Process a PNG document:
-    1. Extract text using OCR
+    1. Extract text using OCR (or the PDF text layer, per page, when pages is given)
     2. Generate embeddings from the text
     3. Store both text and embeddings in database
 
@@ -71,6 +316,7 @@ async def process_document(png_path, user_id=None, document_type="invoice", skip
         document_type (str): Type of document being processed
         skip_storage (bool): If True, skip storing in database
         invoice_id (str, optional): Invoice ID to link back to original invoice
+        pages (list, optional): Page dicts from extract_pdf_pages for PDF documents
 
     Returns:
         dict: Result of the processing
@@ -91,9 +337,7 @@ async def process_document(png_path, user_id=None, document_type="invoice", skip
 
         print(f"✓ PNG file exists, size: {os.path.getsize(png_path)} bytes")
 
-        # Extract text using OCR
-        print("Starting text extraction...")
-        extracted_text = extract_text_from_png(png_path)
+        extracted_text, page_report = await extract_document_text(png_path, pages)
 
         if not extracted_text or len(extracted_text.strip()) == 0:
             error_msg = "No text extracted from image"
@@ -103,72 +347,25 @@ async def process_document(png_path, user_id=None, document_type="invoice", skip
         print(f"✓ Text extracted successfully: {len(extracted_text)} characters")
         print(f"First 200 characters: {extracted_text[:200]}")
 
-        # Generate embeddings for the text
-        print("Starting embedding generation...")
-        embeddings = await generate_embeddings(extracted_text)
-        print(f"✓ Embeddings generated successfully")
-
-        # Generate a document ID
-        doc_id = str(uuid.uuid4())
-        print(f"✓ Generated document ID: {doc_id}")
-
-        # Create document metadata
-        metadata = {
-            "source": os.path.basename(png_path),
-            "user_id": user_id,
-            "type": document_type,
-            "timestamp": str(datetime.datetime.now()),
-            "invoice_id": invoice_id
-        }
-        print(f"✓ Created metadata: {metadata}")
-
-        # Store in Supabase if not skipped
-        if not skip_storage:
-            print("Storing document in database...")
-            try:
-                # Convert embeddings to list format for storage
-                if hasattr(embeddings, 'tolist'):
-                    embedding_list = embeddings.tolist()
-                elif isinstance(embeddings, list):
-                    embedding_list = embeddings
-                else:
-                    embedding_list = list(embeddings)
-
-                print(f"Embedding converted to list, length: {len(embedding_list)}")
-
-                # Store both text and embeddings
-                insert_data = {
-                    "id": doc_id,
-                    "content": extracted_text,
-                    "embedding": embedding_list,
-                    "metadata": json.dumps(metadata),
-                }
-
-                print(f"Inserting data into zokuai_documents table...")
-                result = supabase.table("zokuai_documents").insert(insert_data).execute()
-
-                print(f"✓ Successfully stored in database")
-                print(f"Database result: {result}")
-
-            except Exception as storage_error:
-                error_msg = f"Failed to store in database: {str(storage_error)}"
-                print(f"ERROR: {error_msg}")
-                import traceback
-                traceback.print_exc()
-                return {"status": "error", "message": error_msg}
-        else:
-            print("Skipping database storage as requested")
+        try:
+            result = await embed_and_store_document(
+                extracted_text,
+                source=os.path.basename(png_path),
+                user_id=user_id,
+                document_type=document_type,
+                skip_storage=skip_storage,
+                invoice_id=invoice_id,
+                page_report=page_report
+            )
+        except Exception as storage_error:
+            error_msg = f"Failed to store in database: {str(storage_error)}"
+            print(f"ERROR: {error_msg}")
+            import traceback
+            traceback.print_exc()
+            return {"status": "error", "message": error_msg}
 
         print(f"=== DOCUMENT PROCESSING SUCCESS ===")
-        logger.info(f"Successfully processed document {doc_id}")
-        return {
-            "status": "success",
-            "document_id": doc_id,
-            "extracted_text": extracted_text,
-            "text_length": len(extracted_text),
-            "embedding_length": len(embedding_list) if not skip_storage else 0,
-            "metadata": metadata
-        }
+        return result
 
     except Exception as e:
         error_msg = f"Error processing document: {str(e)}"
@@ -178,3 +375,148 @@ async def process_document(png_path, user_id=None, document_type="invoice", skip
         traceback.print_exc()
         logger.error(error_msg)
         return {"status": "error", "message": error_msg}
+
+
+def insert_chunk_rows(chunk_rows, batch_size=500):
+    """Insert chunk rows in a few multi-row inserts"""
+    for start in range(0, len(chunk_rows), batch_size):
+        supabase.table("zokuai_document_chunks").insert(chunk_rows[start:start + batch_size]).execute()
+
+
+async def link_invoice_documents(source_invoice_id, target_invoice_id, user_id):
+    """
+    Reuse the extracted text and embeddings of an already processed invoice for a
+    duplicate upload, instead of running conversion/OCR/embedding again.
+
+    Args:
+        source_invoice_id (str): Invoice whose documents are reused
+        target_invoice_id (str): Newly uploaded duplicate invoice
+        user_id (str): Owner of both invoices
+
+    Returns:
+        list: IDs of the document rows created for the target invoice
+    """
+    source_docs = supabase.table("zokuai_documents")\
+        .select("id, content, embedding, metadata")\
+        .eq("invoice_id", source_invoice_id)\
+        .execute().data or []
+
+    if not source_docs:
+        print(f"No documents found for invoice {source_invoice_id}, nothing to link")
+        return []
+
+    new_rows = []
+    new_doc_ids = {}
+    for doc in source_docs:
+        metadata = parse_document_metadata(doc.get("metadata"))
+        metadata.update({
+            "invoice_id": target_invoice_id,
+            "user_id": user_id,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "deduplicated_from": source_invoice_id
+        })
+        new_doc_ids[doc["id"]] = str(uuid.uuid4())
+        new_rows.append({
+            "id": new_doc_ids[doc["id"]],
+            "content": doc["content"],
+            "embedding": doc["embedding"],
+            "metadata": json.dumps(metadata),
+            "invoice_id": target_invoice_id,
+            "user_id": user_id,
+        })
+
+    supabase.table("zokuai_documents").insert(new_rows).execute()
+    for row in new_rows:
+        await vector_index_registry.add_document(row["id"], row["embedding"], json.loads(row["metadata"]))
+        await ann_index_registry.add_document(row["id"], row["embedding"], json.loads(row["metadata"]))
+        await lexical_index_registry.add_document(row["id"], row["content"], json.loads(row["metadata"]))
+    await publish_document_change(target_invoice_id, user_id)
+
+    # Copy the chunks too, pointing at the new document rows
+    source_chunks = supabase.table("zokuai_document_chunks")\
+        .select("*")\
+        .in_("document_id", list(new_doc_ids))\
+        .execute().data or []
+    insert_chunk_rows([
+        {
+            "id": str(uuid.uuid4()),
+            "document_id": new_doc_ids[chunk["document_id"]],
+            "invoice_id": target_invoice_id,
+            "user_id": user_id,
+            "chunk_index": chunk["chunk_index"],
+            "content": chunk["content"],
+            "token_count": chunk["token_count"],
+            "embedding": chunk["embedding"],
+        }
+        for chunk in source_chunks
+    ])
+
+    print(f"✓ Linked {len(new_rows)} documents from invoice {source_invoice_id} to {target_invoice_id}")
+    return [row["id"] for row in new_rows]
+
+
+async def delete_invoice_documents(invoice_id):
+    """
+    Delete the document and chunk rows of an invoice and drop them from the vector index.
+
+    Args:
+        invoice_id (str): Invoice whose documents are deleted
+
+    Returns:
+        int: Number of document rows deleted
+    """
+    rows = supabase.table("zokuai_documents").select("id").eq("invoice_id", invoice_id).execute().data or []
+    doc_ids = [row["id"] for row in rows]
+
+    if doc_ids:
+        supabase.table("zokuai_document_chunks").delete().in_("document_id", doc_ids).execute()
+        supabase.table("zokuai_documents").delete().in_("id", doc_ids).execute()
+
+    await vector_index_registry.remove_invoice(invoice_id)
+    await ann_index_registry.remove_invoice(invoice_id)
+    await lexical_index_registry.remove_invoice(invoice_id)
+    answer_cache.invalidate_invoice(invoice_id)
+    await publish_document_change(invoice_id)
+    print(f"✓ Deleted {len(doc_ids)} documents of invoice {invoice_id}")
+    return len(doc_ids)
+
+
+async def publish_document_change(invoice_id, user_id=None):
+    """
+    Tell the other processes sharing the job queue (the API and the ingestion workers)
+    that an invoice's documents changed, so they update their indexes and answer cache.
+    """
+    try:
+        await asyncio.to_thread(get_job_queue().publish_document_change, invoice_id, user_id, PROCESS_ID)
+    except Exception as e:
+        # Their periodic index refresh still picks the change up
+        logger.warning(f"Could not publish document change of invoice {invoice_id}: {str(e)}")
+
+
+async def apply_document_change(invoice_id, user_id=None):
+    """Drop what this process holds about an invoice changed elsewhere; it is reloaded on next use"""
+    await vector_index_registry.invalidate_invoice(invoice_id, user_id)
+    await ann_index_registry.invalidate_invoice(invoice_id, user_id)
+    await lexical_index_registry.invalidate_invoice(invoice_id, user_id)
+    answer_cache.invalidate_invoice(invoice_id)
+
+
+async def follow_document_changes(interval=DOCUMENT_CHANGES_POLL_SECONDS):
+    """Apply document changes published by other processes, polling every `interval` seconds (run as a task)"""
+    queue = get_job_queue()
+    # Earlier changes are covered by the indexes' first load
+    seq = await asyncio.to_thread(queue.last_document_change)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            changes = await asyncio.to_thread(queue.document_changes_since, seq)
+        except Exception as e:
+            logger.error(f"Could not read document changes: {str(e)}")
+            continue
+
+        for change in changes:
+            seq = change["seq"]
+            if change["origin"] != PROCESS_ID:
+                await apply_document_change(change["invoice_id"], change["user_id"])
+        if changes:
+            print(f"✓ Applied {len(changes)} document changes from other processes")
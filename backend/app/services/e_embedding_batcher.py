@@ -0,0 +1,118 @@
+# zoku/backend/app/services/e_embedding_batcher.py
+
+import asyncio
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into multi-input API calls.
+
+    Each caller awaits its own vector. Requests are held for at most `max_wait_ms`
+    and sent as soon as `max_batch_size` inputs are waiting, so a single QA query
+    pays only a few milliseconds while bursts (ingestion, many users) share calls.
+    """
+
+    def __init__(self, embed_batch_fn, max_batch_size=256, max_wait_ms=5.0, split_on=()):
+        """
+        Args:
+            embed_batch_fn: async function taking a list of texts and returning their vectors in order
+            max_batch_size (int): Maximum inputs per API call
+            max_wait_ms (float): Maximum time a request waits for others to join its batch
+            split_on (tuple): Exception types caused by a bad input; a batch failing with one
+                is retried one input at a time. Any other error fails the whole batch.
+        """
+        self.embed_batch_fn = embed_batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.split_on = tuple(split_on)
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+        # Metrics
+        self._requests = 0
+        self._batches = 0
+        self._inputs_sent = 0
+        self._failures = 0
+
+    async def embed(self, text):
+        """Get the embedding of one text"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self._requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000.0, self._flush)
+
+        return await future
+
+    async def embed_many(self, texts):
+        """Get the embeddings of several texts, in order"""
+        return await asyncio.gather(*[self.embed(text) for text in texts])
+
+    def _flush(self):
+        """Send everything that is waiting, in batches of at most max_batch_size"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.max_batch_size):
+            task = asyncio.ensure_future(self._send(pending[start:start + self.max_batch_size]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        # Identical texts in the same batch are embedded once
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+
+        try:
+            vectors = await self.embed_batch_fn(unique_texts)
+            self._batches += 1
+            self._inputs_sent += len(unique_texts)
+        except Exception as e:
+            if len(unique_texts) > 1 and isinstance(e, self.split_on):
+                # One bad input should not fail everyone else's request: retry one by one.
+                # Rate limits, timeouts and server errors would only fail again N times.
+                logger.warning(f"Embedding batch of {len(unique_texts)} failed ({str(e)}), retrying individually")
+                await asyncio.gather(*[self._send([item]) for item in batch])
+                return
+
+            self._failures += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(unique_texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    async def close(self):
+        """Send what is waiting and wait for the batches in flight (on shutdown)"""
+        if self._pending:
+            self._flush()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def get_stats(self):
+        """Batching metrics"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "pending": len(self._pending),
+            "in_flight": len(self._tasks),
+            "requests": self._requests,
+            "api_calls": self._batches,
+            "inputs_sent": self._inputs_sent,
+            "avg_batch_size": round(self._inputs_sent / self._batches, 2) if self._batches else 0.0,
+            "failures": self._failures,
+        }
@@ -0,0 +1,194 @@
+# zoku/backend/app/services/e_embedding_cache.py
+
+import os
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "5000"))
+EMBEDDING_CACHE_DISK_ITEMS = int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS", "100000"))
+EVICTION_CHECK_EVERY = 500  # Disk writes between size checks
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (model, text_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access);
+"""
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model, sha256(text)): an in-memory LRU in front
+    of a SQLite file shared by every process on the host. Both tiers evict the least
+    recently used entries once they exceed their size cap.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, memory_items=EMBEDDING_CACHE_MEMORY_ITEMS,
+                 disk_items=EMBEDDING_CACHE_DISK_ITEMS):
+        self.path = path
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_check = 0
+
+        # Metrics
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA busy_timeout=30000")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _disk_get_many(self, model, hashes):
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({', '.join('?' for _ in part)})",
+                    [model, *part]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(time.time(), model, text_hash) for text_hash in found]
+                )
+                conn.commit()
+        return found
+
+    def _disk_put_many(self, model, items):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                [(model, text_hash, np.asarray(vector, dtype=np.float32).tobytes(), now) for text_hash, vector in items]
+            )
+            conn.commit()
+
+            self._writes_since_check += len(items)
+            if self._writes_since_check >= EVICTION_CHECK_EVERY:
+                self._writes_since_check = 0
+                count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                excess = count - self.disk_items
+                if excess > 0:
+                    conn.execute(
+                        "DELETE FROM embeddings WHERE rowid IN "
+                        "(SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                        (excess,)
+                    )
+                    conn.commit()
+                    self._evictions += excess
+                    logger.info(f"Evicted {excess} embeddings from the disk cache")
+
+    async def get_many(self, model, texts):
+        """
+        Look up several texts.
+
+        Returns:
+            list: The cached vector for each text, or None where it is not cached
+        """
+        hashes = [_text_hash(text) for text in texts]
+        results = [None] * len(texts)
+
+        disk_lookup = []
+        for i, text_hash in enumerate(hashes):
+            vector = self._memory.get((model, text_hash))
+            if vector is not None:
+                self._memory.move_to_end((model, text_hash))
+                self._memory_hits += 1
+                results[i] = vector
+            else:
+                disk_lookup.append(i)
+
+        if disk_lookup:
+            try:
+                found = await asyncio.to_thread(self._disk_get_many, model, list({hashes[i] for i in disk_lookup}))
+            except Exception as e:
+                logger.error(f"Embedding disk cache read failed: {str(e)}")
+                found = {}
+
+            for i in disk_lookup:
+                vector = found.get(hashes[i])
+                if vector is not None:
+                    self._disk_hits += 1
+                    self._remember((model, hashes[i]), vector)
+                    results[i] = vector
+                else:
+                    self._misses += 1
+
+        return results
+
+    async def put_many(self, model, texts, vectors):
+        """Store vectors for texts in both tiers"""
+        items = {}
+        for text, vector in zip(texts, vectors):
+            text_hash = _text_hash(text)
+            self._remember((model, text_hash), vector)
+            items[text_hash] = vector
+
+        try:
+            await asyncio.to_thread(self._disk_put_many, model, list(items.items()))
+        except Exception as e:
+            logger.error(f"Embedding disk cache write failed: {str(e)}")
+
+    async def get(self, model, text):
+        return (await self.get_many(model, [text]))[0]
+
+    async def put(self, model, text, vector):
+        await self.put_many(model, [text], [vector])
+
+    def get_stats(self):
+        """Hit/miss counters and tier sizes"""
+        lookups = self._memory_hits + self._disk_hits + self._misses
+        return {
+            "memory_hits": self._memory_hits,
+            "disk_hits": self._disk_hits,
+            "misses": self._misses,
+            "hit_rate": round((self._memory_hits + self._disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "memory_capacity": self.memory_items,
+            "disk_capacity": self.disk_items,
+            "disk_evictions": self._evictions,
+        }
+
+
+# Shared cache for this process
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,118 @@
+# zoku/backend/app/services/e_ingestion_jobs.py
+
+import os
+import asyncio
+import logging
+from ..db.supabase_client import update_invoice
+from .e_job_queue import get_job_queue
+from .e_file_conversion import convert_pdf_pages
+from .e_document_processor import extract_document_text, embed_and_store_document, delete_invoice_documents
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Job kinds, one per pipeline stage: conversion -> OCR -> embedding
+CONVERT_PDF = "convert_pdf"
+EXTRACT_TEXT = "extract_text"
+EMBED_DOCUMENT = "embed_document"
+
+
+def enqueue_pdf_ingestion(pdf_path, invoice_id, storage_path, user_id):
+    """
+    Queue a PDF for ingestion. The invoice stays 'Uploaded' until a worker picks it up.
+    The PDF must be on a disk the workers can read.
+    """
+    return get_job_queue().enqueue(CONVERT_PDF, {
+        "pdf_path": pdf_path,
+        "invoice_id": invoice_id,
+        "storage_path": storage_path,
+        "user_id": user_id
+    })
+
+
+def _next_job_id(job_id, kind):
+    """Follow-up jobs get an ID derived from their parent, so a retried parent doesn't queue them twice"""
+    return f"{job_id}:{kind}"
+
+
+async def handle_convert_pdf(payload, job_id):
+    """Read the PDF pages, upload the preview, mark the invoice 'Converting' and queue OCR"""
+    pages = await convert_pdf_pages(payload["pdf_path"], payload["invoice_id"], payload["storage_path"])
+
+    await asyncio.to_thread(get_job_queue().enqueue, EXTRACT_TEXT, {
+        "invoice_id": payload["invoice_id"],
+        "user_id": payload["user_id"],
+        "source": os.path.basename(pages[0]["image_path"]),
+        "pages": pages
+    }, job_id=_next_job_id(job_id, EXTRACT_TEXT))
+
+
+def cleanup_converted_pdf(payload):
+    """
+    Pages are on disk and the text layer is in the next job, the PDF is no longer needed.
+    Runs once the conversion job is complete, so a retry never finds the PDF gone.
+    """
+    try:
+        os.unlink(payload["pdf_path"])
+        print(f"✓ Cleaned up temp PDF file: {payload['pdf_path']}")
+    except Exception as cleanup_error:
+        print(f"Warning: Could not clean up temp file: {str(cleanup_error)}")
+
+
+async def handle_extract_text(payload, job_id):
+    """OCR the scanned pages and queue the embedding job"""
+    extracted_text, page_report = await extract_document_text(payload["pages"][0]["image_path"], payload["pages"])
+
+    if not extracted_text or len(extracted_text.strip()) == 0:
+        raise ValueError("No text extracted from image")
+
+    for page in page_report:
+        print(f"Page {page['page']}: {page['method']} ({page['chars']} chars)")
+
+    await asyncio.to_thread(get_job_queue().enqueue, EMBED_DOCUMENT, {
+        "invoice_id": payload["invoice_id"],
+        "user_id": payload["user_id"],
+        "source": payload["source"],
+        "text": extracted_text,
+        "page_report": page_report
+    }, job_id=_next_job_id(job_id, EMBED_DOCUMENT))
+
+
+async def handle_embed_document(payload, job_id):
+    """Embed and store the document text, then mark the invoice 'Processed'"""
+    # A retry after the rows were stored (e.g. update_invoice failed) must not store a second set
+    replaced = await delete_invoice_documents(payload["invoice_id"])
+    if replaced:
+        print(f"Replacing {replaced} documents stored by an earlier attempt")
+
+    result = await embed_and_store_document(
+        payload["text"],
+        source=payload["source"],
+        user_id=payload["user_id"],
+        document_type="invoice",
+        invoice_id=payload["invoice_id"],
+        page_report=payload["page_report"]
+    )
+
+    await update_invoice(payload["invoice_id"], {"status": "Processed"})
+    print(f"✓ Processed invoice {payload['invoice_id']} as document {result['document_id']}")
+
+
+async def handle_job_failed(job):
+    """Called once a job has used up all its attempts"""
+    invoice_id = job["payload"].get("invoice_id")
+    logger.error(f"Job {job['id']} ({job['kind']}) failed permanently: {job.get('last_error')}")
+    if invoice_id:
+        await update_invoice(invoice_id, {"status": "Error"})
+
+
+JOB_HANDLERS = {
+    CONVERT_PDF: handle_convert_pdf,
+    EXTRACT_TEXT: handle_extract_text,
+    EMBED_DOCUMENT: handle_embed_document,
+}
+
+# Run after a job of that kind has been marked complete
+JOB_COMPLETED_HOOKS = {
+    CONVERT_PDF: cleanup_converted_pdf,
+}
@@ -0,0 +1,336 @@
+# zoku/backend/app/services/e_job_queue.py
+
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import sqlite3
+import logging
+from contextlib import contextmanager
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+JOB_QUEUE_PATH = os.getenv("INGESTION_QUEUE_PATH", "ingestion_queue.sqlite3")
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "5"))
+DEFAULT_VISIBILITY_TIMEOUT = float(os.getenv("INGESTION_VISIBILITY_TIMEOUT", "300"))  # seconds
+RETRY_BASE_DELAY = float(os.getenv("INGESTION_RETRY_BASE_DELAY", "10"))  # seconds
+RETRY_MAX_DELAY = float(os.getenv("INGESTION_RETRY_MAX_DELAY", "600"))  # seconds
+JOB_RETENTION_SECONDS = float(os.getenv("INGESTION_RETENTION_SECONDS", str(7 * 24 * 3600)))  # Done jobs and document changes
+JOB_PURGE_INTERVAL_SECONDS = float(os.getenv("INGESTION_PURGE_INTERVAL_SECONDS", "3600"))  # 0 disables purging
+WORKER_STATS_INTERVAL_SECONDS = float(os.getenv("INGESTION_STATS_INTERVAL_SECONDS", "5"))  # How often workers publish metrics
+WORKER_STATS_MAX_AGE = 3 * WORKER_STATS_INTERVAL_SECONDS  # Older metrics belong to workers that are gone
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    locked_by TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at);
+CREATE TABLE IF NOT EXISTS document_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    invoice_id TEXT NOT NULL,
+    user_id TEXT,
+    origin TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS worker_stats (
+    worker_id TEXT PRIMARY KEY,
+    stats TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class JobQueue:
+    """
+    Durable job queue stored in a local SQLite file, shared by the API and the ingestion workers.
+    The same file carries a log of document changes, so the API process can update its
+    in-memory indexes and caches when a worker (re)processes an invoice, and the latest
+    metrics each worker process publishes (its OCR executor runs there, not in the API).
+
+    Job status: queued -> running -> done, or back to queued with a backoff delay on failure,
+    and failed once max_attempts is used up. A running job holds a lease until `available_at`;
+    if its worker dies the lease expires and another worker picks the job up again.
+    """
+
+    def __init__(self, path=JOB_QUEUE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_job(row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def enqueue(self, kind, payload, max_attempts=DEFAULT_MAX_ATTEMPTS, delay=0, job_id=None):
+        """
+        Add a job to the queue.
+
+        Args:
+            kind (str): Job type, used by the worker to pick a handler
+            payload (dict): JSON-serializable job arguments
+            max_attempts (int): Attempts before the job is marked failed
+            delay (float): Seconds before the job becomes available
+            job_id (str, optional): Fixed ID; if a job with this ID exists nothing is added,
+                so a retried job can enqueue its follow-up job again safely
+
+        Returns:
+            str: The job ID
+        """
+        job_id = job_id or str(uuid.uuid4())
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, payload, status, attempts, max_attempts, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', 0, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), max_attempts, now + delay, now, now)
+            )
+        if cursor.rowcount:
+            logger.info(f"Enqueued {kind} job {job_id}")
+        else:
+            logger.info(f"{kind} job {job_id} was already enqueued")
+        return job_id
+
+    def claim(self, worker_id, kinds=None, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        """
+        Atomically take the oldest available job and lease it to a worker.
+        Jobs whose lease expired (worker crashed or hung) are available again.
+
+        Returns:
+            dict: The job, or None if nothing is available
+        """
+        now = time.time()
+        query = (
+            "SELECT * FROM jobs WHERE status IN ('queued', 'running') AND available_at <= ? "
+            "AND attempts < max_attempts"
+        )
+        params = [now]
+        if kinds:
+            query += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        query += " ORDER BY available_at LIMIT 1"
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(query, params).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = ?, "
+                    "available_at = ?, updated_at = ? WHERE id = ?",
+                    (worker_id, now + visibility_timeout, now, row["id"])
+                )
+                job = self._row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+                conn.execute("COMMIT")
+                return job
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def extend_lease(self, job_id, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        """Keep a long running job invisible to other workers. Returns False if the lease was lost."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET available_at = ?, updated_at = ? WHERE id = ? AND status = 'running' AND locked_by = ?",
+                (now + visibility_timeout, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id):
+        """Mark a job as done. Returns False if the lease was lost (another worker owns the job)."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', locked_by = NULL, last_error = NULL, updated_at = ? "
+                "WHERE id = ? AND locked_by = ?",
+                (time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """
+        Record a failed attempt. The job is retried with exponential backoff
+        until it runs out of attempts.
+
+        Returns:
+            bool: True if the job will be retried, False if it is now failed
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND locked_by = ?",
+                    (job_id, worker_id)
+                ).fetchone()
+                if row is None:
+                    # Lease was lost to another worker, which now owns the job
+                    conn.execute("COMMIT")
+                    return True
+
+                if row["attempts"] < row["max_attempts"]:
+                    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (row["attempts"] - 1)))
+                    delay *= random.uniform(0.8, 1.2)
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', locked_by = NULL, last_error = ?, "
+                        "available_at = ?, updated_at = ? WHERE id = ?",
+                        (str(error), now + delay, now, job_id)
+                    )
+                    retry = True
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', locked_by = NULL, last_error = ?, updated_at = ? WHERE id = ?",
+                        (str(error), now, job_id)
+                    )
+                    retry = False
+                conn.execute("COMMIT")
+                return retry
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def reap_expired(self):
+        """
+        Mark running jobs whose lease expired on their last attempt as failed.
+
+        Returns:
+            list: The jobs that were marked failed
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'running' AND available_at <= ? AND attempts >= max_attempts",
+                    (now,)
+                ).fetchall()
+                for row in rows:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', locked_by = NULL, "
+                        "last_error = COALESCE(last_error, 'Visibility timeout expired'), updated_at = ? WHERE id = ?",
+                        (now, row["id"])
+                    )
+                conn.execute("COMMIT")
+                return [self._row_to_job(row) for row in rows]
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def purge_finished(self, older_than=JOB_RETENTION_SECONDS):
+        """Delete done jobs and document changes older than `older_than` seconds. Returns the number of jobs removed."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND updated_at < ?",
+                (time.time() - older_than,)
+            )
+            conn.execute("DELETE FROM document_changes WHERE created_at < ?", (time.time() - older_than,))
+            conn.execute("DELETE FROM worker_stats WHERE updated_at < ?", (time.time() - older_than,))
+            return cursor.rowcount
+
+    def publish_document_change(self, invoice_id, user_id, origin):
+        """Record that the documents of an invoice were added, replaced or deleted by process `origin`"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO document_changes (invoice_id, user_id, origin, created_at) VALUES (?, ?, ?, ?)",
+                (invoice_id, user_id, origin, time.time())
+            )
+
+    def last_document_change(self):
+        """Sequence number of the latest document change (0 if none)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT MAX(seq) AS seq FROM document_changes").fetchone()
+        return row["seq"] or 0
+
+    def document_changes_since(self, seq, limit=500):
+        """Document changes after sequence number `seq`, oldest first"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM document_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (seq, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def publish_worker_stats(self, worker_id, stats):
+        """Store the latest metrics of a worker process, replacing the ones it published before"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO worker_stats (worker_id, stats, updated_at) VALUES (?, ?, ?)",
+                (worker_id, json.dumps(stats), time.time())
+            )
+
+    def remove_worker_stats(self, worker_id):
+        """Drop the metrics of a worker process that is shutting down"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM worker_stats WHERE worker_id = ?", (worker_id,))
+
+    def worker_stats(self, max_age=WORKER_STATS_MAX_AGE):
+        """Latest metrics of the worker processes that published within `max_age` seconds: worker_id -> stats"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT worker_id, stats FROM worker_stats WHERE updated_at >= ? ORDER BY worker_id",
+                (time.time() - max_age,)
+            ).fetchall()
+        return {row["worker_id"]: json.loads(row["stats"]) for row in rows}
+
+    def get_stats(self):
+        """Number of jobs per kind and status"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT kind, status, COUNT(*) AS count FROM jobs GROUP BY kind, status").fetchall()
+
+        stats = {}
+        for row in rows:
+            stats.setdefault(row["kind"], {})[row["status"]] = row["count"]
+        return stats
+
+
+async def purge_periodically(interval=JOB_PURGE_INTERVAL_SECONDS, retention=JOB_RETENTION_SECONDS):
+    """Purge done jobs and document changes older than `retention` every `interval` seconds (run as a task)"""
+    while True:
+        try:
+            purged = await asyncio.to_thread(get_job_queue().purge_finished, retention)
+            if purged:
+                logger.info(f"Purged {purged} finished jobs older than {retention}s")
+        except Exception as e:
+            logger.error(f"Job queue purge failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+_job_queue = None
+
+
+def get_job_queue():
+    """Get the shared job queue for this process"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,213 @@
+# zoku/backend/app/services/e_lexical_index.py
+
+import re
+import math
+import logging
+from collections import Counter
+from app.services.e_vector_index import VectorIndexRegistry, VECTOR_INDEX_REFRESH_SECONDS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal rank fusion constant
+
+# Words and identifiers, keeping inner separators: INV-2023-001, 1.234,56, DE123456789, 12/03/2024
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[./,:\-_][A-Za-z0-9]+)*")
+# Identifiers printed in space separated groups: IBANs (DE89 3704 0044 ...) and long numbers
+GROUPED_PATTERNS = [
+    re.compile(r"\b[A-Za-z]{2}\d{2}(?: ?[A-Za-z0-9]{4}){2,}(?: ?[A-Za-z0-9]{1,3})?\b"),
+    re.compile(r"\b\d{1,4}(?: \d{2,4}){2,}\b"),
+]
+SEPARATORS = re.compile(r"[^a-z0-9]")
+
+
+def tokenize(text):
+    """
+    Lowercased terms for BM25. A token with separators is kept whole and also
+    indexed compacted (separators removed) and by its parts, so "INV-2023-001"
+    matches "inv-2023-001", "INV2023001" and "2023", and "1.234,56" matches
+    "1,234.56". Space-grouped IBANs and numbers also get their compact form.
+    """
+    terms = []
+    for match in TOKEN_PATTERN.finditer(text or ""):
+        token = match.group(0).lower()
+        terms.append(token)
+
+        compact = SEPARATORS.sub("", token)
+        if compact != token:
+            terms.append(compact)
+            terms.extend(part for part in SEPARATORS.split(token) if part)
+
+    for pattern in GROUPED_PATTERNS:
+        for match in pattern.finditer(text or ""):
+            terms.append(SEPARATORS.sub("", match.group(0).lower()))
+
+    return terms
+
+
+class BM25Index:
+    """
+    In-memory inverted index with BM25 scoring for one tenant.
+    Documents can be added and removed one at a time.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # term -> {doc_id: term frequency}
+        self._doc_terms = {}  # doc_id -> terms of the document
+        self._doc_length = {}
+        self._metadata = {}
+        self._by_invoice = {}
+        self._by_user = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._doc_length)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_length
+
+    def ids(self):
+        return set(self._doc_length)
+
+    def invoice_ids(self):
+        return set(self._by_invoice)
+
+    def add(self, doc_id, text, metadata):
+        """Add or replace a document"""
+        if doc_id in self._doc_length:
+            self.remove(doc_id)
+
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+
+        length = sum(counts.values())
+        self._doc_terms[doc_id] = list(counts)
+        self._doc_length[doc_id] = length
+        self._metadata[doc_id] = metadata
+        self._total_length += length
+
+        invoice_id = metadata.get("invoice_id")
+        if invoice_id:
+            self._by_invoice.setdefault(invoice_id, set()).add(doc_id)
+        owner = metadata.get("user_id")
+        if owner:
+            self._by_user.setdefault(owner, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        if doc_id not in self._doc_length:
+            return False
+
+        for term in self._doc_terms.pop(doc_id):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+
+        self._total_length -= self._doc_length.pop(doc_id)
+        metadata = self._metadata.pop(doc_id)
+        for groups, key in ((self._by_invoice, metadata.get("invoice_id")), (self._by_user, metadata.get("user_id"))):
+            if key in groups:
+                groups[key].discard(doc_id)
+                if not groups[key]:
+                    del groups[key]
+        return True
+
+    def remove_invoice(self, invoice_id):
+        for doc_id in set(self._by_invoice.get(invoice_id, ())):
+            self.remove(doc_id)
+
+    def search(self, query, k=5, invoice_ids=None, user_ids=None):
+        """
+        Top-k documents by BM25 score.
+
+        Args:
+            query (str): Question text
+            k (int): Number of results
+            invoice_ids (list, optional): Only consider documents of these invoices
+            user_ids (list, optional): Only consider documents owned by these users
+
+        Returns:
+            list: (doc_id, score, metadata) tuples, best first (documents without any query term are left out)
+        """
+        if not self._doc_length:
+            return []
+
+        allowed = None
+        if invoice_ids is not None:
+            allowed = set().union(*[self._by_invoice.get(invoice_id, set()) for invoice_id in invoice_ids])
+            if not allowed:
+                return []
+        if user_ids is not None:
+            owned = set().union(*[self._by_user.get(owner, set()) for owner in user_ids])
+            allowed = owned if allowed is None else allowed & owned
+            if not allowed:
+                return []
+
+        n_docs = len(self._doc_length)
+        avg_length = self._total_length / n_docs if n_docs else 0
+        scores = {}
+
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._doc_length[doc_id] / avg_length) if avg_length else self.k1
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(doc_id, score, self._metadata[doc_id]) for doc_id, score in best]
+
+
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """
+    Fuse ranked hit lists: each document scores sum(1 / (k + rank)) over the lists it appears in.
+
+    Args:
+        rankings: Lists of (doc_id, score, metadata) tuples, best first
+
+    Returns:
+        list: (doc_id, fused score, metadata) tuples, best first
+    """
+    fused = {}
+    metadata = {}
+    for ranking in rankings:
+        for rank, (doc_id, _, doc_metadata) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+            metadata.setdefault(doc_id, doc_metadata)
+
+    return [
+        (doc_id, score, metadata[doc_id])
+        for doc_id, score in sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+
+class LexicalIndexRegistry(VectorIndexRegistry):
+    """Per-tenant BM25 indexes over the OCR text, loaded and synced like the vector indexes"""
+
+    payload_column = "content"
+
+    def __init__(self, refresh_seconds=VECTOR_INDEX_REFRESH_SECONDS):
+        super().__init__(refresh_seconds=refresh_seconds)
+
+    def _new_index(self, user_id):
+        return BM25Index()
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats["terms"] = {user_id: len(index._postings) for user_id, index in self._indexes.items()}
+        return stats
+
+
+# Shared registry for this process
+lexical_index_registry = LexicalIndexRegistry()
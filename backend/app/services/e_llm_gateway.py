@@ -0,0 +1,73 @@
+# zoku/backend/app/services/e_llm_gateway.py
+
+import os
+import logging
+import httpx
+from openai import AsyncOpenAI
+from pydantic import ValidationError
+from dotenv import load_dotenv
+from app.config.settings import get_settings
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def _configured_api_key():
+    """
+    The app settings' openai_api_key (environment or .env file), as vision extraction used
+    before. Processes without the full settings (e.g. ingestion workers without JWT_SECRET)
+    fall back to the OPENAI_API_KEY environment variable.
+    """
+    try:
+        return get_settings().openai_api_key or os.getenv("OPENAI_API_KEY")
+    except ValidationError:
+        return os.getenv("OPENAI_API_KEY")
+
+
+api_key = _configured_api_key()
+if not api_key:
+    raise ValueError("OpenAI API key not found in settings or environment variables")
+
+# Connection pool and timeout settings shared by every LLM call in the process
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))  # seconds, per request
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))  # seconds
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+_client = None
+
+
+def get_llm_client() -> AsyncOpenAI:
+    """
+    Get the shared AsyncOpenAI client. All services use this one client, so
+    completions, embeddings and vision calls reuse pooled keep-alive connections
+    and never block the event loop.
+    """
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+        )
+        _client = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=http_client
+        )
+        logger.info(f"Created shared AsyncOpenAI client (max {OPENAI_MAX_CONNECTIONS} connections)")
+    return _client
+
+
+async def close_llm_client():
+    """Close the pooled connections (on shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
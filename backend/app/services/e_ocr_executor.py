@@ -0,0 +1,160 @@
+# zoku/backend/app/services/e_ocr_executor.py
+
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import pytesseract
+from PIL import Image
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", "64"))  # Pages allowed to wait for a free worker
+
+
+def _ocr_image(image_path):
+    """
+    Run Tesseract on one image. Executed inside a pool process, so it must stay
+    a module-level function and this module must stay cheap to import.
+    """
+    with Image.open(image_path) as image:
+        return pytesseract.image_to_string(image)
+
+
+class OCRExecutor:
+    """
+    Runs OCR in a separate process pool so Tesseract never blocks the event loop.
+
+    At most `max_workers` images are OCR'd at once and at most `max_queue` more
+    wait for a worker. Further submitters wait (without blocking the loop) until
+    there is room, so a burst of large documents cannot flood the pool.
+    """
+
+    def __init__(self, max_workers=OCR_MAX_WORKERS, max_queue=OCR_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = None
+        self._admission = None
+        self._slots = None
+
+        # Metrics
+        self._queued = 0
+        self._running = 0
+        self._blocked = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+
+    def _ensure_started(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._admission = asyncio.Semaphore(self.max_workers + self.max_queue)
+            self._slots = asyncio.Semaphore(self.max_workers)
+            logger.info(f"Started OCR executor with {self.max_workers} workers, queue size {self.max_queue}")
+
+    async def run(self, image_path):
+        """
+        OCR an image in the process pool.
+
+        Args:
+            image_path (str): Path to the image
+
+        Returns:
+            str: Extracted text
+        """
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        enqueued_at = time.monotonic()
+
+        # Bounded submission queue: wait here while the queue is full
+        self._blocked += 1
+        try:
+            await self._admission.acquire()
+        finally:
+            self._blocked -= 1
+
+        try:
+            self._submitted += 1
+            self._queued += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self._queued -= 1
+
+            wait_time = time.monotonic() - enqueued_at
+            self._total_wait += wait_time
+            self._max_wait = max(self._max_wait, wait_time)
+
+            started_at = time.monotonic()
+            self._running += 1
+            try:
+                text = await loop.run_in_executor(self._pool, _ocr_image, image_path)
+                self._completed += 1
+                return text
+            except Exception:
+                self._failed += 1
+                raise
+            finally:
+                self._running -= 1
+                self._total_run += time.monotonic() - started_at
+                self._slots.release()
+        finally:
+            self._admission.release()
+
+    def get_stats(self):
+        """Current queue depth and wait/run time metrics"""
+        finished = self._completed + self._failed
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queued,
+            "running": self._running,
+            "blocked_submitters": self._blocked,
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "failed": self._failed,
+            "avg_wait_seconds": round(self._total_wait / self._submitted, 4) if self._submitted else 0.0,
+            "max_wait_seconds": round(self._max_wait, 4),
+            "avg_run_seconds": round(self._total_run / finished, 4) if finished else 0.0,
+            "total_wait_seconds": round(self._total_wait, 4),
+            "total_run_seconds": round(self._total_run, 4),
+        }
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.info("OCR executor shut down")
+
+
+def aggregate_stats(stats_list):
+    """
+    Combine the get_stats() of several executors, one per ingestion worker process.
+
+    Returns:
+        dict: Same keys as get_stats(), counts summed and averages over all workers
+    """
+    summed = [
+        "max_workers", "max_queue", "queue_depth", "running", "blocked_submitters",
+        "submitted", "completed", "failed", "total_wait_seconds", "total_run_seconds",
+    ]
+    total = {key: sum(stats.get(key, 0) for stats in stats_list) for key in summed}
+    finished = total["completed"] + total["failed"]
+    total["avg_wait_seconds"] = round(total["total_wait_seconds"] / total["submitted"], 4) if total["submitted"] else 0.0
+    total["max_wait_seconds"] = max((stats.get("max_wait_seconds", 0.0) for stats in stats_list), default=0.0)
+    total["avg_run_seconds"] = round(total["total_run_seconds"] / finished, 4) if finished else 0.0
+    total["total_wait_seconds"] = round(total["total_wait_seconds"], 4)
+    total["total_run_seconds"] = round(total["total_run_seconds"], 4)
+    return total
+
+
+# Shared executor for the whole process
+ocr_executor = OCRExecutor()
@@ -1,26 +1,45 @@
 import os
 import logging
-from openai import OpenAI
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from openai import BadRequestError
+from app.services.e_embedding_batcher import EmbeddingBatcher
+from app.services.e_embedding_cache import embedding_cache
+from app.services.e_llm_gateway import get_llm_client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Get API key from environment variables
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OpenAI API key not found in environment variables")
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))  # Inputs per API call (API max is 2048)
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))  # How long a request waits for others
+
+
+async def _create_embeddings(texts):
+    """One multi-input embeddings API call. Returns the vectors in input order."""
+    response = await get_llm_client().embeddings.create(
+        input=texts,
+        model=EMBEDDING_MODEL
+    )
+
+    # The API returns one item per input, tagged with its position
+    ordered = sorted(response.data, key=lambda item: item.index)
+    return [item.embedding for item in ordered]
+
+
+# Shared by every embedding caller in this process (QA queries, chat history, ingestion)
+embedding_batcher = EmbeddingBatcher(
+    _create_embeddings,
+    max_batch_size=EMBEDDING_BATCH_SIZE,
+    max_wait_ms=EMBEDDING_BATCH_WINDOW_MS,
+    split_on=(BadRequestError,)  # An input the API rejects (e.g. too long); other errors fail the batch
+)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=api_key)
 
 async def get_embeddings(text):
     """
     Generate embeddings for the given text using OpenAI's embedding model.
+    Cached embeddings are returned without an API call; concurrent misses are
+    coalesced into one API request by the embedding batcher.
 
     Args:
         text (str): The text to generate embeddings for
@@ -29,15 +48,49 @@ async def get_embeddings(text):
         list: The embedding vector
     """
     try:
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-
-        # Extract the embedding vector from the response
-        embedding = response.data[0].embedding
+        cached = await embedding_cache.get(EMBEDDING_MODEL, text)
+        if cached is not None:
+            return cached
 
+        embedding = await embedding_batcher.embed(text)
+        await embedding_cache.put(EMBEDDING_MODEL, text, embedding)
         return embedding
     except Exception as e:
         logger.error(f"Error generating embeddings: {str(e)}")
         raise
+
+
+async def get_embeddings_batch(texts):
+    """
+    Generate embeddings for many texts with as few API calls as possible.
+
+    Args:
+        texts (list): The texts to generate embeddings for
+
+    Returns:
+        list: One embedding vector per text, in the same order
+    """
+    try:
+        embeddings = await embedding_cache.get_many(EMBEDDING_MODEL, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new_embeddings = await embedding_batcher.embed_many(missing_texts)
+            await embedding_cache.put_many(EMBEDDING_MODEL, missing_texts, new_embeddings)
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+
+        return embeddings
+    except Exception as e:
+        logger.error(f"Error generating batch embeddings: {str(e)}")
+        raise
+
+
+def get_embedding_stats():
+    """Cache and batching metrics of the embedding pipeline"""
+    return {
+        "model": EMBEDDING_MODEL,
+        "cache": embedding_cache.get_stats(),
+        "batcher": embedding_batcher.get_stats()
+    }
@@ -1,37 +1,52 @@
-import os
 import logging
-from openai import OpenAI
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from app.services.e_llm_gateway import get_llm_client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Get API key from environment variables
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OpenAI API key not found in environment variables")
-
-# Initialize OpenAI client
-client = OpenAI(api_key=api_key)
+# Constants
+COMPLETION_MODEL = "gpt-4"
+COMPLETION_MAX_TOKENS = 1000
+MODEL_CONTEXT_TOKENS = 8192  # gpt-4 context window (prompt + completion)
+SYSTEM_PROMPT = "You are a helpful assistant."
 
-async def get_completion(prompt: str) -> str:
+async def get_completion(prompt: str, max_tokens: int = COMPLETION_MAX_TOKENS) -> str:
     """
     Get a completion from OpenAI's GPT model.
     """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
+        response = await get_llm_client().chat.completions.create(
+            model=COMPLETION_MODEL,
             messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=1000
+            max_tokens=max_tokens
         )
         return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Error getting completion: {str(e)}")
         raise
+
+
+async def stream_completion(prompt: str):
+    """
+    Stream a completion from OpenAI's GPT model, yielding text as it arrives.
+    """
+    try:
+        stream = await get_llm_client().chat.completions.create(
+            model=COMPLETION_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=COMPLETION_MAX_TOKENS,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        logger.error(f"Error streaming completion: {str(e)}")
+        raise
@@ -0,0 +1,190 @@
+# zoku/backend/app/services/e_passage_selector.py
+
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+import numpy as np
+from app.db.supabase_client import supabase
+from app.services.e_openai_client import get_embeddings_batch
+from app.services.e_text_chunker import chunk_text, get_encoding, CHUNK_OVERLAP_TOKENS
+from app.services.e_vector_index import parse_embedding
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+PASSAGE_CACHE_DOCUMENTS = int(os.getenv("PASSAGE_CACHE_DOCUMENTS", "256"))
+PASSAGE_GAP_MARKER = "\n[...]\n"
+PASSAGE_GAP_TOKENS = len(PASSAGE_GAP_MARKER)  # Upper bound: every token of it is at least one character
+
+# Parsed chunks per document ID (chunks of a stored document never change)
+_chunk_cache = OrderedDict()
+
+
+def _fetch_chunks(document_ids):
+    """Chunk rows of several documents in one query, grouped by document"""
+    rows = supabase.table("zokuai_document_chunks")\
+        .select("document_id, chunk_index, content, token_count, embedding")\
+        .in_("document_id", list(document_ids))\
+        .execute().data or []
+
+    chunks = {}
+    for row in rows:
+        chunks.setdefault(row["document_id"], []).append(row)
+    return chunks
+
+
+async def _chunk_legacy_document(content):
+    """Documents stored before chunking: chunk and embed on the fly (embeddings are cached)"""
+    chunks = chunk_text(content)
+    vectors = await get_embeddings_batch([chunk["content"] for chunk in chunks])
+    for chunk, vector in zip(chunks, vectors):
+        chunk["embedding"] = vector
+    return chunks
+
+
+async def get_document_chunks(documents):
+    """
+    Chunks with parsed embeddings for each document.
+
+    Args:
+        documents (list): Document dicts with 'document_db_id' and 'content'
+
+    Returns:
+        dict: document_db_id -> (chunks sorted by chunk_index, (n, dim) float32 matrix)
+    """
+    result = {}
+    missing = []
+    for doc in documents:
+        doc_id = doc["document_db_id"]
+        if doc_id in _chunk_cache:
+            _chunk_cache.move_to_end(doc_id)
+            result[doc_id] = _chunk_cache[doc_id]
+        else:
+            missing.append(doc)
+
+    if missing:
+        fetched = await asyncio.to_thread(_fetch_chunks, [doc["document_db_id"] for doc in missing])
+
+        for doc in missing:
+            doc_id = doc["document_db_id"]
+            chunks = fetched.get(doc_id)
+            if not chunks:
+                chunks = await _chunk_legacy_document(doc["content"])
+            if not chunks:
+                continue
+
+            chunks = sorted(chunks, key=lambda chunk: chunk["chunk_index"])
+            matrix = np.stack([parse_embedding(chunk["embedding"]) for chunk in chunks])
+            entry = ([{k: v for k, v in chunk.items() if k != "embedding"} for chunk in chunks], matrix)
+
+            _chunk_cache[doc_id] = entry
+            result[doc_id] = entry
+            while len(_chunk_cache) > PASSAGE_CACHE_DOCUMENTS:
+                _chunk_cache.popitem(last=False)
+
+    return result
+
+
+def _join_passages(chunks):
+    """Join chunks in reading order, dropping the overlap of consecutive chunks"""
+    text = ""
+    previous_index = None
+    for chunk in chunks:
+        content = chunk["content"]
+        if previous_index is not None:
+            if chunk["chunk_index"] == previous_index + 1:
+                encoding = get_encoding()
+                content = encoding.decode(encoding.encode(content)[CHUNK_OVERLAP_TOKENS:])
+            else:
+                text += PASSAGE_GAP_MARKER
+        text += content
+        previous_index = chunk["chunk_index"]
+    return text
+
+
+def _passages_tokens(chunks):
+    """Tokens of chunks (in reading order) once joined by _join_passages"""
+    tokens = 0
+    previous_index = None
+    for chunk in chunks:
+        tokens += chunk["token_count"]
+        if previous_index is not None:
+            if chunk["chunk_index"] == previous_index + 1:
+                tokens -= min(CHUNK_OVERLAP_TOKENS, chunk["token_count"])
+            else:
+                tokens += PASSAGE_GAP_TOKENS
+        previous_index = chunk["chunk_index"]
+    return tokens
+
+
+def _truncate_chunk(chunk, max_tokens):
+    """The chunk cut down to its first max_tokens tokens"""
+    encoding = get_encoding()
+    tokens = encoding.encode(chunk["content"])[:max_tokens]
+    return {**chunk, "content": encoding.decode(tokens), "token_count": len(tokens)}
+
+
+def pack_passages(chunks, scores, max_tokens):
+    """
+    Pick the highest scoring chunks whose joined text fits in max_tokens and return
+    them in reading order. The overlap of consecutive chunks is only counted once.
+    If even the best chunk does not fit, it is cut down to max_tokens.
+    """
+    selected = []
+    used = 0
+    for i in np.argsort(-scores):
+        chunk = chunks[int(i)]
+        if not selected and chunk["token_count"] > max_tokens:
+            selected.append(_truncate_chunk(chunk, max_tokens))
+            used = selected[0]["token_count"]
+            break
+
+        candidate = sorted(selected + [chunk], key=lambda item: item["chunk_index"])
+        tokens = _passages_tokens(candidate)
+        if tokens <= max_tokens:
+            selected, used = candidate, tokens
+
+    return selected, used
+
+
+async def select_passages(query_embedding, documents, max_tokens_per_document):
+    """
+    Select the passages of each document that best match the question.
+
+    Args:
+        query_embedding: Embedding of the question
+        documents (list): Document dicts with 'document_db_id' and 'content'
+        max_tokens_per_document (int): Token budget for each document's passages
+
+    Returns:
+        dict: document_db_id -> {"text", "token_count", "chunks_used", "chunks_total"}
+    """
+    query = parse_embedding(query_embedding)
+    norm = np.linalg.norm(query)
+    if norm > 0:
+        query = query / norm
+
+    document_chunks = await get_document_chunks(documents)
+
+    passages = {}
+    for doc in documents:
+        doc_id = doc["document_db_id"]
+        if doc_id not in document_chunks:
+            passages[doc_id] = {"text": doc["content"], "token_count": 0, "chunks_used": 0, "chunks_total": 0}
+            continue
+
+        chunks, matrix = document_chunks[doc_id]
+        scores = matrix @ query
+        selected, used = pack_passages(chunks, scores, max_tokens_per_document)
+
+        passages[doc_id] = {
+            "text": _join_passages(selected),
+            "token_count": used,
+            "chunks_used": len(selected),
+            "chunks_total": len(chunks),
+        }
+        print(f"✓ Selected {len(selected)}/{len(chunks)} passages ({used} tokens) from document {doc_id}")
+
+    return passages
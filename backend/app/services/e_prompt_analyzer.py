@@ -2,16 +2,20 @@
 
 import json
 import re
+import asyncio
 from typing import Dict, List, Any
-from openai import OpenAI
-from app.services.openai_client import client
+from app.services.e_llm_gateway import get_llm_client
 import tiktoken
 
 class PromptAnalyzer:
     def __init__(self):
-        self.client = client
         self.encoding = tiktoken.get_encoding("cl100k_base")  # For GPT-4/3.5
 
+    @property
+    def client(self):
+        """Shared async OpenAI client"""
+        return get_llm_client()
+
     def count_tokens(self, text: str) -> int:
         """Count tokens in text"""
         return len(self.encoding.encode(text))
@@ -19,11 +23,13 @@ class PromptAnalyzer:
     async def analyze_prompt_comprehensive(self, prompt: str) -> Dict[str, Any]:
         """Run comprehensive analysis on a prompt"""
 
-        # Run all analysis types
-        clarity_result = await self.analyze_clarity(prompt)
-        security_result = await self.analyze_security(prompt)
-        performance_result = await self.analyze_performance(prompt)
-        structure_result = await self.analyze_structure(prompt)
+        # Run all analysis types concurrently
+        clarity_result, security_result, performance_result, structure_result = await asyncio.gather(
+            self.analyze_clarity(prompt),
+            self.analyze_security(prompt),
+            self.analyze_performance(prompt),
+            self.analyze_structure(prompt)
+        )
 
         # Generate optimized version
         optimized_prompt = await self.generate_optimized_prompt(
@@ -68,7 +74,7 @@ class PromptAnalyzer:
         """
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[{"role": "user", "content": analysis_prompt}],
                 response_format={"type": "json_object"},
@@ -117,7 +123,7 @@ class PromptAnalyzer:
         """
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[{"role": "user", "content": analysis_prompt}],
                 response_format={"type": "json_object"},
@@ -166,7 +172,7 @@ class PromptAnalyzer:
         """
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[{"role": "user", "content": analysis_prompt}],
                 response_format={"type": "json_object"},
@@ -216,7 +222,7 @@ class PromptAnalyzer:
         """
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[{"role": "user", "content": analysis_prompt}],
                 response_format={"type": "json_object"},
@@ -267,7 +273,7 @@ class PromptAnalyzer:
         """
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[{"role": "user", "content": optimization_prompt}],
                 temperature=0.2
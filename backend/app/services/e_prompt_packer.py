@@ -0,0 +1,124 @@
+# zoku/backend/app/services/e_prompt_packer.py
+
+import os
+import logging
+from app.services.e_text_chunker import get_encoding, count_tokens
+from app.services.e_openai_completions import COMPLETION_MAX_TOKENS, MODEL_CONTEXT_TOKENS, SYSTEM_PROMPT
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+QA_PROMPT_TOKEN_BUDGET = int(os.getenv("QA_PROMPT_TOKEN_BUDGET", "6000"))
+MESSAGE_OVERHEAD_TOKENS = 12  # Chat formatting tokens around the system and user messages
+TRUNCATION_MARKER = "\n[...]\n"
+
+
+def prompt_token_budget(budget=QA_PROMPT_TOKEN_BUDGET):
+    """The configured budget, capped so prompt + completion fit the model window"""
+    window = MODEL_CONTEXT_TOKENS - COMPLETION_MAX_TOKENS - count_tokens(SYSTEM_PROMPT) - MESSAGE_OVERHEAD_TOKENS
+    return min(budget, window)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to at most max_tokens tokens, marking the cut"""
+    encoding = get_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    marker = TRUNCATION_MARKER if count_tokens(TRUNCATION_MARKER) <= max_tokens else ""
+
+    # A cut token sequence can encode to more tokens once decoded (e.g. a split multi-byte character)
+    keep = max_tokens - count_tokens(marker)
+    while keep > 0:
+        truncated = encoding.decode(tokens[:keep]) + marker
+        if count_tokens(truncated) <= max_tokens:
+            return truncated
+        keep -= 1
+    return marker
+
+
+class PromptPacker:
+    """
+    Builds a prompt from named parts within a token budget.
+
+    Required parts are always included. Optional parts are added in priority order
+    (lower number first) while they fit; a part with min_tokens may be cut down to
+    the remaining space instead of being dropped. The prompt keeps the order in
+    which parts were added.
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget if budget is not None else prompt_token_budget()
+        self._parts = []
+
+    def add(self, name, text, priority=0, required=False, min_tokens=None):
+        self._parts.append({
+            "name": name,
+            "text": text,
+            "tokens": count_tokens(text),
+            "priority": priority,
+            "required": required,
+            "min_tokens": min_tokens,
+        })
+
+    def required_tokens(self):
+        return sum(part["tokens"] for part in self._parts if part["required"])
+
+    def pack(self):
+        """
+        Decide which parts go into the prompt.
+
+        Returns:
+            dict: {"included": {name: text}, "dropped": [names], "truncated": [names]}
+        """
+        remaining = self.budget - self.required_tokens()
+        included = {part["name"]: part["text"] for part in self._parts if part["required"]}
+        dropped = []
+        truncated = []
+
+        optional = sorted(
+            (part for part in self._parts if not part["required"]),
+            key=lambda part: part["priority"]
+        )
+        for part in optional:
+            if part["tokens"] <= remaining:
+                included[part["name"]] = part["text"]
+                remaining -= part["tokens"]
+            elif part["min_tokens"] is not None and remaining >= part["min_tokens"]:
+                included[part["name"]] = truncate_to_tokens(part["text"], remaining)
+                remaining -= count_tokens(included[part["name"]])
+                truncated.append(part["name"])
+            else:
+                dropped.append(part["name"])
+
+        if remaining < 0:
+            logger.warning(f"Required prompt parts exceed the budget by {-remaining} tokens")
+
+        return {"included": included, "dropped": dropped, "truncated": truncated}
+
+    def render(self, packed, overrides=None):
+        """
+        Join the included parts in order.
+
+        Args:
+            packed (dict): Result of pack()
+            overrides (dict, optional): Replacement text for included parts (must not be longer)
+
+        Returns:
+            tuple: (prompt, usage report)
+        """
+        overrides = overrides or {}
+        names = [part["name"] for part in self._parts if part["name"] in packed["included"]]
+        texts = {name: overrides.get(name, packed["included"][name]) for name in names}
+        prompt = "".join(texts[name] for name in names)
+
+        usage = {
+            "budget": self.budget,
+            "prompt_tokens": count_tokens(prompt),
+            "max_completion_tokens": COMPLETION_MAX_TOKENS,
+            "parts": {name: count_tokens(texts[name]) for name in names},
+            "dropped": packed["dropped"],
+            "truncated": packed["truncated"],
+        }
+        return prompt, usage
@@ -1,25 +1,58 @@
 # zoku/backend/app/services/e_qa_system.py
 
+import os
 import logging
-import json
-from app.db.supabase_client import supabase, get_invoice
-from app.services.e_openai_completions import get_completion
-from app.services.e_document_processor import generate_embeddings
+from app.db.supabase_client import supabase, get_invoice_metadata_bulk
+from app.services.e_openai_completions import get_completion, stream_completion
 from app.services.e_chat_manager import store_chat_message
+from app.services.e_vector_index import vector_index_registry
+from app.services.e_ann_index import ann_index_registry
+from app.services.e_lexical_index import lexical_index_registry, reciprocal_rank_fusion
+from app.services.e_passage_selector import select_passages
+from app.services.e_prompt_packer import PromptPacker, prompt_token_budget, truncate_to_tokens
+from app.services.e_text_chunker import count_tokens, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from app.services.e_answer_cache import answer_cache, documents_updated_at, ANSWER_CACHE_ENABLED
+from app.services.e_request_context import QARequestContext
+from app.services.e_session_memory import session_memory
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def get_original_filename(invoice_id):
+# "vector" ranks by embedding similarity only, "hybrid" fuses it with BM25 over the OCR text.
+# Vector is the default; deployments opt into hybrid here, callers per request
+QA_RETRIEVAL_MODE = os.getenv("QA_RETRIEVAL_MODE", "vector")
+RETRIEVAL_MODES = ("vector", "hybrid")
+
+# Token budget for the passages of each document in the prompt: four consecutive chunks
+# for a single document, two for each of several (consecutive chunks share their overlap)
+SINGLE_DOCUMENT_PASSAGE_TOKENS = int(os.getenv(
+    "SINGLE_DOCUMENT_PASSAGE_TOKENS", str(CHUNK_TOKENS + 3 * (CHUNK_TOKENS - CHUNK_OVERLAP_TOKENS))
+))
+MULTI_DOCUMENT_PASSAGE_TOKENS = int(os.getenv(
+    "MULTI_DOCUMENT_PASSAGE_TOKENS", str(CHUNK_TOKENS + (CHUNK_TOKENS - CHUNK_OVERLAP_TOKENS))
+))
+
+# Smallest useful share of the prompt for one document
+MIN_DOCUMENT_TOKENS = 100
+
+PROMPT_HEADER = """You are a helpful assistant that answers questions about invoice documents.
+Use the following invoice information to answer the user's question accurately.
+
+"""
+
+# Candidates fetched per requested document when searching all documents (several may belong to one invoice)
+OPEN_SEARCH_OVERSAMPLE = 4
+
+async def get_original_filename(invoice_id, user_id=None):
     """
     Helper function to get the original filename from the invoice record
     """
     try:
-        result = supabase.table("zokuai_invoices").select("filename").eq("id", invoice_id).execute()
+        invoices = await get_invoice_metadata_bulk([invoice_id], user_id)
 
-        if result.data and len(result.data) > 0:
-            original_filename = result.data[0].get('filename', 'Unknown Document')
+        if invoice_id in invoices:
+            original_filename = invoices[invoice_id].get('filename') or 'Unknown Document'
             print(f"Found original filename for {invoice_id}: {original_filename}")
             return original_filename
         else:
@@ -39,106 +72,121 @@ async def get_original_filename(invoice_id):
 # Fix 1: Update retrieve_context_from_embeddings to get original filenames
 # In e_qa_system.py, modify the document processing part:
 
-async def retrieve_context_from_embeddings(query, user_id=None, document_ids=None, max_results=3):
+async def retrieve_context_from_embeddings(query, user_id=None, document_ids=None, max_results=3, mode=None, ctx=None):
     """
     Retrieve relevant context using vector embeddings - WITH USER-FRIENDLY NAMES
+
+    mode "hybrid" also ranks the documents with BM25 over their OCR text (exact invoice
+    numbers, IBANs, VAT ids, amounts) and fuses both rankings with reciprocal rank fusion.
     """
+    mode = mode or QA_RETRIEVAL_MODE
+    ctx = ctx or QARequestContext(user_id)
     try:
-        print(f"=== USING VECTOR SEARCH (MULTI-DOC) ===")
+        print(f"=== USING {mode.upper()} SEARCH (MULTI-DOC) ===")
         print(f"Query: {query}")
         print(f"Document IDs filter: {document_ids}")
         print(f"Number of document IDs: {len(document_ids) if document_ids else 0}")
 
         # Generate embeddings for the query
-        query_embedding = await generate_embeddings(query)
+        query_embedding = await ctx.embedding(query)
         embedding_list = query_embedding.tolist() if hasattr(query_embedding, 'tolist') else query_embedding
 
-        # If specific document IDs are provided, filter by them
+        # If specific document IDs are provided, rank their documents in the user's vector index
         if document_ids and len(document_ids) > 0:
             print(f"Filtering by specific document IDs: {document_ids}")
 
-            # Get all documents from database
-            try:
-                result = supabase.table("zokuai_documents").select("*").execute()
-                print(f"Retrieved {len(result.data)} total documents from database")
+            async with vector_index_registry.locked_index(user_id, required_invoice_ids=document_ids) as index:
+                hits = index.search(embedding_list, k=len(index), invoice_ids=document_ids)
+                indexed = len(index)
+            print(f"Vector index: {indexed} documents for tenant, {len(hits)} in the selected invoices")
+        else:
+            print("No specific document IDs provided, using general similarity search")
 
+            # Search all of the user's documents with the ANN index
+            async with ann_index_registry.locked_index(user_id) as index:
+                hits = index.search(embedding_list, k=max_results * OPEN_SEARCH_OVERSAMPLE)
+                indexed = len(index)
+            print(f"ANN index: {indexed} documents for tenant, {len(hits)} candidates")
+
+        if mode == "hybrid":
+            if document_ids:
+                async with lexical_index_registry.locked_index(user_id, required_invoice_ids=document_ids) as lexical_index:
+                    lexical_hits = lexical_index.search(query, k=len(lexical_index), invoice_ids=document_ids)
+            else:
+                async with lexical_index_registry.locked_index(user_id) as lexical_index:
+                    # Like the ANN index: only the user's own documents
+                    lexical_hits = lexical_index.search(query, k=max_results * OPEN_SEARCH_OVERSAMPLE, user_ids=[user_id])
+            print(f"BM25 index: {len(lexical_hits)} documents contain query terms")
+            hits = reciprocal_rank_fusion(hits, lexical_hits)
+
+        # Keep the best matching document of each invoice, best first
+        best_hits = {}
+        for doc_id, score, metadata in hits:
+            best_hits.setdefault(metadata.get('invoice_id'), (doc_id, score, metadata))
+
+        if not document_ids:
+            best_hits = dict(list(best_hits.items())[:max_results])
+
+        # Fetch content only for the matched rows
+        contents = {}
+        if best_hits:
+            try:
+                result = supabase.table("zokuai_documents")\
+                    .select("id, content")\
+                    .in_("id", [doc_id for doc_id, _, _ in best_hits.values()])\
+                    .execute()
+                contents = {row['id']: row['content'] for row in result.data}
             except Exception as query_error:
                 print(f"Error querying documents: {str(query_error)}")
-                result = {"data": []}
-
-            # Filter for documents that match the specific invoice IDs
-            invoice_contents = []
-
-            for doc in result.data:
-                try:
-                    # Parse metadata safely
-                    metadata_str = doc.get('metadata', '{}')
-                    if isinstance(metadata_str, str):
-                        metadata = json.loads(metadata_str)
-                    else:
-                        metadata = metadata_str
-
-                    # Check if this document belongs to one of the requested invoices
-                    doc_invoice_id = metadata.get('invoice_id')
-                    doc_user_id = metadata.get('user_id')
-
-                    print(f"Document {doc['id']}: invoice_id={doc_invoice_id}, user_id={doc_user_id}")
-
-                    # TEMPORARY FIX: Accept both test-user-esra and test-user-123
-                    valid_user_ids = [user_id, "test-user-123", "test-user-esra"]
-
-                    # Match user (with fallback) and invoice ID
-                    if doc_user_id in valid_user_ids and doc_invoice_id in document_ids:
-                        print(f"✓ Document matches criteria (user: {doc_user_id}, invoice: {doc_invoice_id})")
-
-                        # GET ORIGINAL FILENAME FROM INVOICE TABLE
-                        original_filename = "Unknown Document"
-                        try:
-                            # Fetch the original invoice record to get the user-friendly filename
-                            invoice_result = await get_invoice(doc_invoice_id)
-                            if invoice_result:
-                                original_filename = invoice_result.get('filename', 'Unknown Document')
-                                print(f"Found original filename: {original_filename}")
-                            else:
-                                print(f"No invoice record found for ID: {doc_invoice_id}")
-                        except Exception as invoice_error:
-                            print(f"Error fetching invoice record: {str(invoice_error)}")
-                            # Fallback: clean up the metadata source name
-                            source_name = metadata.get('source', 'Unknown')
-                            if source_name.endswith('.png') and len(source_name) > 40:  # Likely a UUID-based name
-                                original_filename = f"Document {doc_invoice_id[:8]}..."  # Use first 8 chars of ID
-                            else:
-                                original_filename = source_name
-
-                        invoice_contents.append({
-                            'id': doc_invoice_id,
-                            'document_db_id': doc['id'],
-                            'content': doc['content'],
-                            'filename': original_filename,  # Use original filename instead of processed PNG name
-                            'processed_filename': metadata.get('source', 'Unknown'),  # Keep processed name for debugging
-                            'supplier': metadata.get('supplier', 'Unknown'),
-                            'upload_date': metadata.get('timestamp', 'Unknown')
-                        })
-                    else:
-                        print(f"✗ Document doesn't match criteria (user: {doc_user_id}, invoice: {doc_invoice_id})")
-
-                except Exception as parse_error:
-                    print(f"Error parsing document metadata: {str(parse_error)}")
-                    continue
-
-            print(f"Matched {len(invoice_contents)} documents for invoice IDs: {document_ids}")
 
-        else:
-            print("No specific document IDs provided, using general similarity search")
-            # Handle general similarity search case
-            invoice_contents = []
+        # GET ORIGINAL FILENAMES FROM INVOICE TABLE (one query for all matched invoices)
+        invoices = {}
+        try:
+            invoices = await ctx.invoice_metadata(list(best_hits))
+        except Exception as invoice_error:
+            print(f"Error fetching invoice records: {str(invoice_error)}")
+
+        invoice_contents = []
+
+        for doc_invoice_id, (doc_id, score, metadata) in best_hits.items():
+            if doc_id not in contents:
+                continue
+
+            print(f"✓ Document {doc_id} matches (invoice: {doc_invoice_id}, score: {score:.3f})")
+
+            invoice = invoices.get(doc_invoice_id)
+            if invoice:
+                original_filename = invoice.get('filename') or 'Unknown Document'
+            else:
+                print(f"No invoice record found for ID: {doc_invoice_id}")
+                # Fallback: clean up the metadata source name
+                source_name = metadata.get('source', 'Unknown')
+                if source_name.endswith('.png') and len(source_name) > 40:  # Likely a UUID-based name
+                    original_filename = f"Document {doc_invoice_id[:8]}..."  # Use first 8 chars of ID
+                else:
+                    original_filename = source_name
+                invoice = {}
+
+            invoice_contents.append({
+                'id': doc_invoice_id,
+                'document_db_id': doc_id,
+                'content': contents[doc_id],
+                'filename': original_filename,  # Use original filename instead of processed PNG name
+                'processed_filename': metadata.get('source', 'Unknown'),  # Keep processed name for debugging
+                'supplier': invoice.get('supplier') or metadata.get('supplier', 'Unknown'),
+                'upload_date': invoice.get('upload_date') or metadata.get('timestamp', 'Unknown'),
+                'score': score
+            })
+
+        print(f"Matched {len(invoice_contents)} documents for invoice IDs: {document_ids or list(best_hits)}")
 
         print(f"Final result: Found {len(invoice_contents)} documents using vector search")
 
         return {
             "documents": invoice_contents,
             "document_count": len(invoice_contents),
-            "chat_count": 0
+            "chat_count": 0,
+            "query_embedding": embedding_list
         }
 
     except Exception as e:
@@ -147,32 +195,183 @@ async def retrieve_context_from_embeddings(query, user_id=None, document_ids=Non
         traceback.print_exc()
         return {"documents": [], "document_count": 0, "chat_count": 0}
 
+def _qa_instructions(query, document_names):
+    """Question and answering instructions that close the prompt"""
+    if len(document_names) == 1:
+        context_description = f'the invoice document "{document_names[0]}"'
+    else:
+        context_description = f'the invoice documents: {", ".join(document_names)}'
+
+    return f"""
+USER QUESTION: {query}
+
+Instructions:
+- Analyze ALL the provided documents when answering
+- When referencing documents, use their actual filenames (not processed filenames or IDs)
+- If comparing or summarizing multiple documents, clearly distinguish between them by their filenames
+- If extracting data (like totals, dates, vendors), provide information from ALL relevant documents
+- If the question asks for specific data, format it clearly (e.g., use tables, lists, or clear sections)
+- Be comprehensive but concise
+- Always reference documents by their user-friendly names
+
+Please provide a helpful and accurate answer based on {context_description}.
+"""
+
+
+def _context_title(document_count):
+    if document_count == 1:
+        return "INVOICE DOCUMENT:\n\n"
+    return f"MULTIPLE INVOICE DOCUMENTS ({document_count} documents):\n\n"
+
+
+async def build_document_prompt(query, context, history=None):
+    """
+    Build the QA prompt within the token budget.
+
+    The instructions and question are always included. The remaining budget is
+    shared by the documents (best ranked first) and the session history: each
+    document gets passages worth up to its share, and documents that no longer
+    fit are cut down or left out, lowest ranked first.
+
+    Args:
+        query (str): The user's question
+        context (dict): Result of retrieve_context_from_embeddings
+        history (str, optional): Conversation context of the session
+
+    Returns:
+        tuple: (prompt, token usage report)
+    """
+    documents = context["documents"]
+    packer = PromptPacker()
+
+    header = PROMPT_HEADER
+    title = _context_title(len(documents))
+    instructions = _qa_instructions(query, [doc['filename'] for doc in documents])
+    history_block = f"CONVERSATION SO FAR:\n{history}\n\n" if history else ""
+
+    # Share what is left after the fixed parts between the documents
+    fixed_tokens = count_tokens(header + title + instructions + history_block)
+    document_budget = max(0, packer.budget - fixed_tokens)
+    max_passage_tokens = SINGLE_DOCUMENT_PASSAGE_TOKENS if len(documents) == 1 else MULTI_DOCUMENT_PASSAGE_TOKENS
+    passage_tokens = max(MIN_DOCUMENT_TOKENS, min(max_passage_tokens, document_budget // len(documents)))
+
+    passages = {}
+    try:
+        passages = await select_passages(context["query_embedding"], documents, passage_tokens)
+    except Exception as e:
+        print(f"Error selecting passages, using leading text: {str(e)}")
+
+    packer.add("header", header, required=True)
+    packer.add("context_title", title, required=True)
+    for i, doc in enumerate(documents):
+        if len(documents) == 1:
+            block = f"Document: {doc['filename']}\nContent: {_document_text(doc, passages, passage_tokens)}\n\n"
+        else:
+            block = f"[Document {i+1}] {doc['filename']}\nContent: {_document_text(doc, passages, passage_tokens)}\n\n"
+        # The history ranks right after the best matching document
+        packer.add(f"document:{doc['id']}", block, priority=i if i == 0 else i + 1, min_tokens=MIN_DOCUMENT_TOKENS)
+    if history_block:
+        packer.add("history", history_block, priority=1, min_tokens=MIN_DOCUMENT_TOKENS)
+    packer.add("instructions", instructions, required=True)
+
+    packed = packer.pack()
+
+    # Describe only the documents that made it into the prompt
+    included = [doc for doc in documents if f"document:{doc['id']}" in packed["included"]]
+    overrides = {}
+    if len(included) < len(documents):
+        print(f"Token budget: left out {len(documents) - len(included)} of {len(documents)} documents")
+        overrides = {
+            "context_title": _context_title(len(included)),
+            "instructions": _qa_instructions(query, [doc['filename'] for doc in included]),
+        }
+
+    prompt, usage = packer.render(packed, overrides)
+    usage["documents_included"] = len(included)
+    return prompt, usage
+
+
+def _document_text(doc, passages, max_tokens):
+    """Selected passages of a document, or its leading text if passage selection failed"""
+    if doc['document_db_id'] in passages:
+        return passages[doc['document_db_id']]['text']
+    return truncate_to_tokens(doc['content'], max_tokens)
+
+async def lookup_cached_answer(query, user_id, document_ids, ctx):
+    """
+    Look for an earlier answer to a near-identical question about the same invoices.
+    Only questions about selected documents are cached.
+    """
+    if not ANSWER_CACHE_ENABLED or not user_id or not document_ids:
+        return None
+    try:
+        query_embedding = await ctx.embedding(query)
+        async with vector_index_registry.locked_index(user_id, required_invoice_ids=document_ids) as index:
+            updated_at = documents_updated_at(index, document_ids)
+        return await answer_cache.lookup(user_id, document_ids, query_embedding, updated_at)
+    except Exception as e:
+        print(f"Error checking answer cache: {str(e)}")
+        return None
+
 # Fix 4: Update the answer_question function to handle multiple documents better
 # In e_qa_system.py, update the answer_question function:
 
 # Fix 2: Update the answer_question function to use user-friendly names in prompts
 # In e_qa_system.py, update the answer_question function:
 
-async def answer_question(query, user_id=None, document_ids=None, session_id=None):
+async def prepare_answer(query, user_id=None, document_ids=None, session_id=None, retrieval_mode=None, ctx=None):
     """
-    Answer using vector embeddings - WITH USER-FRIENDLY DOCUMENT NAMES
+    Everything that happens before the LLM call: answer cache lookup, retrieval and prompt building.
+    The session's conversation memory goes into the prompt, so follow-up questions keep their context.
+    ctx (QARequestContext) memoizes lookups shared with save_answer.
+
+    Returns:
+        dict: {"answer": cached answer} or {"prompt": ...}, plus "sources" and "query_embedding"
     """
-    try:
-        print(f"=== QA SYSTEM (MULTI-DOC VECTOR APPROACH) ===")
-        print(f"Query: {query}")
-        print(f"User ID: {user_id}")
-        print(f"Document IDs: {document_ids}")
-        print(f"Number of documents requested: {len(document_ids) if document_ids else 0}")
-        print(f"Session ID: {session_id}")
+    print(f"=== QA SYSTEM (MULTI-DOC VECTOR APPROACH) ===")
+    print(f"Query: {query}")
+    print(f"User ID: {user_id}")
+    print(f"Document IDs: {document_ids}")
+    print(f"Number of documents requested: {len(document_ids) if document_ids else 0}")
+    print(f"Session ID: {session_id}")
+    print(f"Retrieval mode: {retrieval_mode or QA_RETRIEVAL_MODE}")
+
+    history = ""
+    if session_id and user_id:
+        try:
+            history = await session_memory.render(session_id, user_id, ctx)
+        except Exception as e:
+            print(f"Error loading session memory: {str(e)}")
+
+    # Same question about the same, unchanged documents: reuse the earlier answer
+    # (not for follow-ups, whose meaning depends on the conversation)
+    cached = None if history else await lookup_cached_answer(query, user_id, document_ids, ctx)
+    if cached:
+        print(f"✓ Answer cache hit (similarity {cached['similarity']:.3f}, from {cached['id']})")
+        invoices = await ctx.invoice_metadata(document_ids)
+        return {
+            "answer": cached["answer"],
+            "query_embedding": None,
+            "sources": {
+                "document_count": len(document_ids),
+                "document_ids": document_ids,
+                "documents_processed": [
+                    invoices.get(invoice_id, {}).get('filename') or f'Document {invoice_id[:8]}'
+                    for invoice_id in document_ids
+                ],
+                "session_id": session_id,
+                "cached": {"from": cached["id"], "similarity": round(cached["similarity"], 4)}
+            }
+        }
 
-        # Use vector search to find relevant documents
-        context = await retrieve_context_from_embeddings(query, user_id, document_ids)
+    # Use vector search to find relevant documents
+    context = await retrieve_context_from_embeddings(query, user_id, document_ids, mode=retrieval_mode, ctx=ctx)
 
-        print(f"Vector search found {context['document_count']} documents")
+    print(f"Vector search found {context['document_count']} documents")
 
-        if context["document_count"] == 0:
-            if document_ids and len(document_ids) > 0:
-                prompt = f"""You are a helpful assistant for invoice analysis.
+    if context["document_count"] == 0:
+        if document_ids and len(document_ids) > 0:
+            prompt = f"""You are a helpful assistant for invoice analysis.
 
 USER QUESTION: {query}
 
@@ -180,90 +379,86 @@ The selected documents ({len(document_ids)} documents) haven't been processed fo
 
 Please explain that these specific documents need to be processed first, or suggest selecting different documents that have been processed.
 """
-            else:
-                prompt = f"""You are a helpful assistant for invoice analysis.
+        else:
+            prompt = f"""You are a helpful assistant for invoice analysis.
 
 USER QUESTION: {query}
 
-No documents were selected for analysis. Please ask the user to select one or more processed invoices to analyze.
+No documents were selected, and none of the user's processed documents matched the question. Please ask the user to upload or select one or more processed invoices to analyze.
 """
-        else:
-            # Format context for the LLM - HANDLE MULTIPLE DOCUMENTS WITH USER-FRIENDLY NAMES
-            if context["document_count"] == 1:
-                doc = context["documents"][0]
-                user_friendly_name = doc['filename']
-
-                formatted_context = f"INVOICE DOCUMENT:\n\n"
-                formatted_context += f"Document: {user_friendly_name}\n"
-                formatted_context += f"Content: {doc['content'][:2000]}...\n\n"
-
-                context_description = f'the invoice document "{user_friendly_name}"'
-            else:
-                formatted_context = f"MULTIPLE INVOICE DOCUMENTS ({context['document_count']} documents):\n\n"
-                document_names = []
-
-                for i, doc in enumerate(context["documents"]):
-                    user_friendly_name = doc['filename']
-                    document_names.append(user_friendly_name)
-
-                    formatted_context += f"[Document {i+1}] {user_friendly_name}\n"
-                    formatted_context += f"Content: {doc['content'][:1500]}...\n\n"
-
-                context_description = f'the invoice documents: {", ".join(document_names)}'
+        token_usage = {"budget": prompt_token_budget(), "prompt_tokens": count_tokens(prompt)}
+    else:
+        prompt, token_usage = await build_document_prompt(query, context, history=history)
+
+    print(f"Prompt tokens: {token_usage['prompt_tokens']} (budget {token_usage['budget']})")
+
+    # Return response with user-friendly document names
+    processed_document_names = []
+    for doc in context.get("documents", []):
+        processed_document_names.append(doc.get('filename', f'Document {doc.get("id", "Unknown")[:8]}'))
+
+    return {
+        "prompt": prompt,
+        # Only answers grounded in documents alone go into the answer cache
+        "query_embedding": context["query_embedding"] if context["document_count"] > 0 and not history else None,
+        "sources": {
+            "document_count": context["document_count"],
+            "document_ids": document_ids or [doc['id'] for doc in context.get("documents", [])],
+            "documents_processed": processed_document_names,
+            "session_id": session_id,  # ADD THIS LINE
+            "token_usage": token_usage
+        }
+    }
 
-            prompt = f"""You are a helpful assistant that answers questions about invoice documents.
-Use the following invoice information to answer the user's question accurately.
 
-{formatted_context}
+async def save_answer(query, response, prepared, user_id=None, document_ids=None, session_id=None, ctx=None):
+    """Store the question and answer in the chat history, the answer cache and the session memory"""
+    if not user_id:
+        return
+    try:
+        if session_id:
+            session_memory.add_turn(session_id, user_id, query, response)
+
+        cacheable = prepared.get("query_embedding") is not None
+        stored = await store_chat_message(
+            user_id=user_id,
+            query=query,
+            response=response,
+            document_ids=document_ids,
+            session_id=session_id,
+            ctx=ctx,
+            cacheable=cacheable
+        )
+        if cacheable:
+            answer_cache.add(user_id, document_ids, prepared["query_embedding"], response, stored.get("message_id"))
+    except Exception as e:
+        print(f"Error storing chat: {str(e)}")
 
-USER QUESTION: {query}
 
-Instructions:
-- Analyze ALL the provided documents when answering
-- When referencing documents, use their actual filenames (not processed filenames or IDs)
-- If comparing or summarizing multiple documents, clearly distinguish between them by their filenames
-- If extracting data (like totals, dates, vendors), provide information from ALL relevant documents
-- If the question asks for specific data, format it clearly (e.g., use tables, lists, or clear sections)
-- Be comprehensive but concise
-- Always reference documents by their user-friendly names
-
-Please provide a helpful and accurate answer based on {context_description}.
-"""
+async def answer_question(query, user_id=None, document_ids=None, session_id=None, retrieval_mode=None, ctx=None):
+    """
+    Answer using vector embeddings - WITH USER-FRIENDLY DOCUMENT NAMES
+    """
+    ctx = ctx or QARequestContext(user_id)
+    try:
+        prepared = await prepare_answer(query, user_id, document_ids, session_id, retrieval_mode, ctx)
 
         # Get response from LLM
-        response = await get_completion(prompt)
+        if "answer" in prepared:
+            response = prepared["answer"]
+        else:
+            response = await get_completion(prepared["prompt"])
 
         # Store chat history
-        if user_id:
-            try:
-                await store_chat_message(
-                    user_id=user_id,
-                    query=query,
-                    response=response,
-                    document_ids=document_ids,
-                    session_id=session_id
-                )
-            except Exception as e:
-                print(f"Error storing chat: {str(e)}")
-
-        # Return response with user-friendly document names
-        processed_document_names = []
-        for doc in context.get("documents", []):
-            processed_document_names.append(doc.get('filename', f'Document {doc.get("id", "Unknown")[:8]}'))
-
+        await save_answer(query, response, prepared, user_id, document_ids, session_id, ctx)
 
+        print(f"Request calls: {ctx.get_stats()}")
+        prepared["sources"]["request_calls"] = ctx.get_stats()
         return {
             "answer": response,
-            "sources": {
-                "document_count": context["document_count"],
-                "document_ids": document_ids or [],
-                "documents_processed": processed_document_names,
-                "session_id": session_id  # ADD THIS LINE
-            }
+            "sources": prepared["sources"]
         }
 
-
-
     except Exception as e:
         print(f"ERROR in QA system: {str(e)}")
         import traceback
@@ -273,18 +468,35 @@ Please provide a helpful and accurate answer based on {context_description}.
             "sources": {"error": str(e)}
         }
 
-async def get_original_filename(invoice_id):
+
+async def stream_answer(query, user_id=None, document_ids=None, session_id=None, retrieval_mode=None, result=None, ctx=None):
     """
-    Helper function to get the original filename from the invoice record
+    Answer a question as a stream of events.
+
+    Yields ("token", text) for each piece of the answer as it arrives, then ("done", payload)
+    with the sources and session ID, or ("error", payload). The chat history is not written
+    here: the full answer and the prepared state are put in `result` (a dict) so the caller
+    can call save_answer (with result["ctx"]) after the stream has been sent.
     """
+    result = result if result is not None else {}
+    ctx = result["ctx"] = ctx or QARequestContext(user_id)
     try:
-        result = supabase.table("zokuai_invoices").select("filename").eq("id", invoice_id).execute()
+        prepared = await prepare_answer(query, user_id, document_ids, session_id, retrieval_mode, ctx)
 
-        if result.data and len(result.data) > 0:
-            return result.data[0].get('filename', 'Unknown Document')
+        parts = []
+        if "answer" in prepared:
+            parts.append(prepared["answer"])
+            yield "token", prepared["answer"]
         else:
-            return f"Document {invoice_id[:8]}..."
+            async for delta in stream_completion(prepared["prompt"]):
+                parts.append(delta)
+                yield "token", delta
+
+        result.update({"response": "".join(parts), "prepared": prepared})
+        yield "done", {"sources": prepared["sources"], "session_id": session_id}
 
     except Exception as e:
-        print(f"Error fetching original filename for {invoice_id}: {str(e)}")
-        return f"Document {invoice_id[:8]}..."
+        print(f"ERROR in QA stream: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        yield "error", {"message": "I encountered an error processing your question. Please try again.", "error": str(e)}
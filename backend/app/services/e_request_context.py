@@ -0,0 +1,78 @@
+# zoku/backend/app/services/e_request_context.py
+
+import asyncio
+import logging
+from app.db.supabase_client import supabase, get_invoice_metadata_bulk
+from app.services.e_document_processor import generate_embeddings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class QARequestContext:
+    """
+    Memoizes what one QA request looks up more than once (the query embedding,
+    invoice metadata, the chat session row) and counts the external calls it
+    made and saved. Create one per request and pass it down the pipeline.
+    """
+
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+        self._embeddings = {}
+        self._invoices = {}
+        self._sessions = {}
+        self._calls = {"embeddings": 0, "invoice_metadata": 0, "sessions": 0}
+        self._saved = {"embeddings": 0, "invoice_metadata": 0, "sessions": 0}
+
+    async def embedding(self, text):
+        """Embedding of a text, computed at most once per request"""
+        if text not in self._embeddings:
+            self._calls["embeddings"] += 1
+            self._embeddings[text] = asyncio.ensure_future(generate_embeddings(text))
+        else:
+            self._saved["embeddings"] += 1
+        try:
+            return await self._embeddings[text]
+        except Exception:
+            # Don't memoize failures
+            self._embeddings.pop(text, None)
+            raise
+
+    async def invoice_metadata(self, invoice_ids):
+        """Invoice metadata (see get_invoice_metadata_bulk), each invoice looked up at most once per request"""
+        missing = [invoice_id for invoice_id in dict.fromkeys(invoice_ids) if invoice_id not in self._invoices]
+        if len(missing) < len(set(invoice_ids)):
+            self._saved["invoice_metadata"] += 1
+
+        if missing:
+            self._calls["invoice_metadata"] += 1
+            found = await get_invoice_metadata_bulk(missing, self.user_id)
+            for invoice_id in missing:
+                self._invoices[invoice_id] = found.get(invoice_id)
+
+        return {
+            invoice_id: self._invoices[invoice_id]
+            for invoice_id in invoice_ids if self._invoices.get(invoice_id)
+        }
+
+    async def session(self, session_id, user_id):
+        """The chat session row, fetched at most once per request (None if not found)"""
+        if session_id in self._sessions:
+            self._saved["sessions"] += 1
+            return self._sessions[session_id]
+
+        self._calls["sessions"] += 1
+        result = supabase.table("zokuai_chat_sessions")\
+            .select("*")\
+            .eq("id", session_id)\
+            .eq("user_id", user_id)\
+            .execute()
+        self._sessions[session_id] = result.data[0] if result.data else None
+        return self._sessions[session_id]
+
+    def get_stats(self):
+        """External calls made and saved during this request"""
+        return {
+            kind: {"calls": self._calls[kind], "saved": self._saved[kind]}
+            for kind in self._calls
+        }
@@ -0,0 +1,320 @@
+# zoku/backend/app/services/e_session_memory.py
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from collections import OrderedDict
+from app.db.supabase_client import supabase
+from app.services.e_openai_completions import get_completion
+from app.services.e_prompt_packer import truncate_to_tokens
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SESSION_MEMORY_ENABLED = os.getenv("SESSION_MEMORY_ENABLED", "true").lower() == "true"
+SESSION_MEMORY_TURNS = int(os.getenv("SESSION_MEMORY_TURNS", "4"))  # Most recent turns kept verbatim
+SESSION_MEMORY_FOLD_TURNS = int(os.getenv("SESSION_MEMORY_FOLD_TURNS", "2"))  # Turns folded into the summary at once
+SESSION_MEMORY_SUMMARY_TOKENS = int(os.getenv("SESSION_MEMORY_SUMMARY_TOKENS", "300"))
+SESSION_MEMORY_TURN_TOKENS = int(os.getenv("SESSION_MEMORY_TURN_TOKENS", "200"))  # Per question and per answer
+SESSION_MEMORY_CACHE_SESSIONS = int(os.getenv("SESSION_MEMORY_CACHE_SESSIONS", "1000"))
+SESSION_MEMORY_CHECK_SECONDS = float(os.getenv("SESSION_MEMORY_CHECK_SECONDS", "5"))  # Cached copy trusted this long
+SESSION_MEMORY_SAVE_ATTEMPTS = 3
+
+SUMMARY_PROMPT = """Update the summary of a conversation between a user and an assistant about invoice documents.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW TURNS:
+{turns}
+
+Write the updated summary in at most {max_words} words. Keep the facts a follow-up question may refer to:
+invoice names, vendors, amounts, dates, and what the user asked about and was told. Return only the summary.
+"""
+
+
+def _render_turns(turns):
+    return "\n".join(f"User: {turn['query']}\nAssistant: {turn['response']}" for turn in turns)
+
+
+class SessionMemory:
+    """
+    Bounded conversation memory of each chat session: a rolling summary of the
+    older turns (at most `summary_tokens`) plus the last `max_turns` turns, each
+    question and answer cut to `turn_tokens`. The prompt context it renders stays
+    the same size however long the conversation gets.
+
+    A turn is added to the in-process copy as soon as it is answered, so the next
+    question sees it; loading the stored memory, folding old turns into the summary
+    (an LLM call) and saving to zokuai_chat_sessions happen in the background, one
+    update at a time per session.
+
+    Other API processes update the same sessions. The copy remembers the stored
+    memory_updated_at it was built on: it is reloaded when the stored one changed
+    (checked at most every `check_seconds`), and a save only succeeds if the stored
+    memory is still the one the copy was built on; otherwise the turns not saved
+    yet are put after the newer stored memory and the save is retried.
+    """
+
+    def __init__(self, max_turns=SESSION_MEMORY_TURNS, fold_turns=SESSION_MEMORY_FOLD_TURNS,
+                 summary_tokens=SESSION_MEMORY_SUMMARY_TOKENS, turn_tokens=SESSION_MEMORY_TURN_TOKENS,
+                 cache_sessions=SESSION_MEMORY_CACHE_SESSIONS, check_seconds=SESSION_MEMORY_CHECK_SECONDS):
+        self.max_turns = max_turns
+        self.fold_turns = max(1, fold_turns)
+        self.summary_tokens = summary_tokens
+        self.turn_tokens = turn_tokens
+        self.cache_sessions = cache_sessions
+        self.check_seconds = check_seconds
+        self._memories = OrderedDict()  # session_id -> {"summary", "turns", "version", "unsaved", ...}
+        self._locks = {}
+        self._lock_users = {}  # session_id -> updates holding or waiting for its lock
+        self._tasks = set()
+
+        # Metrics
+        self._turns_added = 0
+        self._summaries = 0
+        self._summary_failures = 0
+        self._saves = 0
+        self._reloads = 0
+        self._save_conflicts = 0
+
+    def _cache(self, session_id, memory):
+        self._memories[session_id] = memory
+        self._memories.move_to_end(session_id)
+        while len(self._memories) > self.cache_sessions:
+            evicted, _ = self._memories.popitem(last=False)
+            self._drop_lock(evicted)
+        return memory
+
+    def _drop_lock(self, session_id):
+        # A lock still held or awaited by an update stays, or two updates could run at once
+        if session_id not in self._lock_users:
+            self._locks.pop(session_id, None)
+
+    @staticmethod
+    def _from_row(row):
+        return {
+            "summary": row.get("memory_summary") or "",
+            "turns": list(row.get("memory_turns") or []),
+            "version": row.get("memory_updated_at"),  # Stored memory this copy is built on
+            "unsaved": 0,  # Trailing turns not saved yet
+            "loaded": True,
+            "checked_at": time.monotonic(),
+        }
+
+    @staticmethod
+    def _merge(memory, stored):
+        """Rebuild the copy on the stored memory, keeping the turns not saved yet after it"""
+        memory["unsaved"] = min(memory["unsaved"], len(memory["turns"]))
+        unsaved = memory["turns"][len(memory["turns"]) - memory["unsaved"]:]
+        memory["summary"] = stored["summary"]
+        memory["turns"] = stored["turns"] + unsaved
+        memory["version"] = stored["version"]
+        memory["loaded"] = True
+
+    def _load(self, session_id, user_id):
+        result = supabase.table("zokuai_chat_sessions")\
+            .select("memory_summary, memory_turns, memory_updated_at")\
+            .eq("id", session_id)\
+            .eq("user_id", user_id)\
+            .execute()
+        return self._from_row(result.data[0] if result.data else {})
+
+    async def get(self, session_id, user_id, ctx=None):
+        """
+        The session's memory: {"summary", "turns"}.
+        ctx (QARequestContext, optional) reuses the session row fetched for the request.
+        """
+        memory = self._memories.get(session_id)
+        if memory is None:
+            stored = await self._fetch(session_id, user_id, ctx)
+            # Another request may have added a turn meanwhile
+            memory = self._memories.get(session_id)
+            if memory is None:
+                return self._cache(session_id, stored)
+
+        self._memories.move_to_end(session_id)
+        await self._refresh(session_id, user_id, memory, ctx)
+        return memory
+
+    async def _fetch(self, session_id, user_id, ctx=None):
+        if ctx:
+            row = await ctx.session(session_id, user_id)
+            return self._from_row(row or {})
+        return await asyncio.to_thread(self._load, session_id, user_id)
+
+    async def _refresh(self, session_id, user_id, memory, ctx=None, force=False):
+        """
+        Load the stored memory if the copy was never loaded, or reload it if another process
+        saved since. Turns added here and not saved yet stay after the stored ones.
+        """
+        if memory["loaded"] and not force and time.monotonic() - memory["checked_at"] < self.check_seconds:
+            return
+        version, loaded = memory["version"], memory["loaded"]
+        stored = await self._fetch(session_id, user_id, ctx)
+        # A save or load by this process meanwhile is at least as new as what was fetched
+        if memory["version"] != version or memory["loaded"] != loaded:
+            return
+        if not loaded or stored["version"] != version:
+            if loaded:
+                self._reloads += 1
+            self._merge(memory, stored)
+        memory["checked_at"] = time.monotonic()
+
+    async def render(self, session_id, user_id, ctx=None):
+        """Conversation context for the prompt, or "" if the session has no earlier turns"""
+        if not SESSION_MEMORY_ENABLED or not session_id:
+            return ""
+        memory = await self.get(session_id, user_id, ctx)
+
+        parts = []
+        if memory["summary"]:
+            parts.append(f"Summary of the earlier conversation: {memory['summary']}")
+        if memory["turns"]:
+            parts.append(_render_turns(memory["turns"]))
+        return "\n\n".join(parts)
+
+    def add_turn(self, session_id, user_id, query, response):
+        """
+        Remember a question and its answer. The turn is visible to the next render right
+        away; the summary and the database are updated in the background.
+        """
+        if not SESSION_MEMORY_ENABLED or not session_id:
+            return
+
+        memory = self._memories.get(session_id)
+        if memory is None:
+            # The stored memory is loaded and put in front of this turn by the next get()
+            memory = self._cache(session_id, {
+                "summary": "", "turns": [], "version": None, "unsaved": 0, "loaded": False, "checked_at": 0.0,
+            })
+        memory["turns"].append({
+            "query": truncate_to_tokens(query, self.turn_tokens),
+            "response": truncate_to_tokens(response, self.turn_tokens),
+        })
+        memory["unsaved"] += 1
+        self._turns_added += 1
+
+        task = asyncio.ensure_future(self._update(session_id, user_id, memory))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _update(self, session_id, user_id, memory):
+        """
+        Fold old turns into the summary if needed and save the memory. Works on the
+        memory the turn was added to, so an eviction meanwhile doesn't lose the turn.
+        """
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._lock_users[session_id] = self._lock_users.get(session_id, 0) + 1
+        try:
+            async with lock:
+                await self._refresh(session_id, user_id, memory)
+                for _ in range(SESSION_MEMORY_SAVE_ATTEMPTS):
+                    if not memory["unsaved"]:
+                        return  # An earlier update saved this turn too
+                    if len(memory["turns"]) > self.max_turns:
+                        await self._fold(memory)
+
+                    unsaved = memory["unsaved"]
+                    version = await asyncio.to_thread(
+                        self._save, session_id, user_id, memory["summary"], list(memory["turns"]), memory["version"]
+                    )
+                    if version is not None:
+                        memory["version"] = version
+                        memory["unsaved"] = max(0, memory["unsaved"] - unsaved)
+                        memory["checked_at"] = time.monotonic()
+                        return
+
+                    # Another process saved meanwhile: rebuild on its memory and try again
+                    self._save_conflicts += 1
+                    await self._refresh(session_id, user_id, memory, force=True)
+                logger.warning(f"Memory of session {session_id} not saved: it kept changing elsewhere")
+        except Exception as e:
+            logger.error(f"Error updating memory of session {session_id}: {str(e)}")
+        finally:
+            self._lock_users[session_id] -= 1
+            if not self._lock_users[session_id]:
+                del self._lock_users[session_id]
+                if session_id not in self._memories:
+                    self._drop_lock(session_id)
+
+    async def _fold(self, memory):
+        """Fold the oldest turns into the summary"""
+        fold = max(self.fold_turns, len(memory["turns"]) - self.max_turns)
+        folded = memory["turns"][:fold]
+        try:
+            summary = await get_completion(
+                SUMMARY_PROMPT.format(
+                    summary=memory["summary"] or "(none yet)",
+                    turns=_render_turns(folded),
+                    max_words=int(self.summary_tokens * 0.7)
+                ),
+                max_tokens=self.summary_tokens
+            )
+            memory["summary"] = truncate_to_tokens(summary.strip(), self.summary_tokens)
+            self._summaries += 1
+        except Exception as e:
+            # Keep the turns and try again after the next one, but never let them grow unbounded
+            self._summary_failures += 1
+            logger.warning(f"Session summary failed: {str(e)}")
+            if len(memory["turns"]) < 2 * self.max_turns:
+                return
+        del memory["turns"][:fold]
+
+    def _save(self, session_id, user_id, summary, turns, version):
+        """
+        Save the memory if the stored one is still `version` (compare-and-set).
+
+        Returns:
+            str: The new stored version, or None if another process saved meanwhile
+        """
+        query = supabase.table("zokuai_chat_sessions")\
+            .update({
+                "memory_summary": summary or None,
+                "memory_turns": turns,
+                "memory_updated_at": datetime.now(timezone.utc).isoformat(),
+            })\
+            .eq("id", session_id)\
+            .eq("user_id", user_id)
+        if version is None:
+            query = query.is_("memory_updated_at", "null")
+        else:
+            query = query.eq("memory_updated_at", version)
+        result = query.execute()
+        if not result.data:
+            return None
+        self._saves += 1
+        return result.data[0]["memory_updated_at"]
+
+    async def close(self):
+        """Wait for the background updates (on shutdown)"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def forget(self, session_id):
+        """Drop the in-process copy (the session was deleted)"""
+        self._memories.pop(session_id, None)
+        self._drop_lock(session_id)
+
+    def get_stats(self):
+        """Turns remembered and summaries written"""
+        return {
+            "enabled": SESSION_MEMORY_ENABLED,
+            "max_turns": self.max_turns,
+            "summary_tokens": self.summary_tokens,
+            "sessions_cached": len(self._memories),
+            "pending_updates": len(self._tasks),
+            "turns_added": self._turns_added,
+            "summaries": self._summaries,
+            "summary_failures": self._summary_failures,
+            "saves": self._saves,
+            "reloads": self._reloads,
+            "save_conflicts": self._save_conflicts,
+        }
+
+
+# Shared memory for this process
+session_memory = SessionMemory()
@@ -0,0 +1,65 @@
+# zoku/backend/app/services/e_text_chunker.py
+
+import os
+import tiktoken
+
+# Constants
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+_encoding = None
+
+
+def get_encoding():
+    """
+    Same tokenizer as text-embedding-ada-002 and GPT-4. Loaded on first use: tiktoken
+    may have to download it, which importing this module should not depend on.
+    """
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text):
+    """Count tokens in text"""
+    return len(get_encoding().encode(text))
+
+
+def chunk_text(text, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Split text into overlapping windows of at most chunk_tokens tokens.
+
+    Args:
+        text (str): Text to split
+        chunk_tokens (int): Maximum tokens per chunk
+        overlap_tokens (int): Tokens shared by consecutive chunks, so a line item
+                              cut at a boundary is still whole in one of them
+
+    Returns:
+        list: Chunks as dicts {"chunk_index", "content", "token_count", "start_token"}
+    """
+    if overlap_tokens >= chunk_tokens:
+        raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+
+    encoding = get_encoding()
+    tokens = encoding.encode(text)
+    if not tokens:
+        return []
+
+    step = chunk_tokens - overlap_tokens
+    chunks = []
+    start = 0
+    while True:
+        window = tokens[start:start + chunk_tokens]
+        chunks.append({
+            "chunk_index": len(chunks),
+            "content": encoding.decode(window),
+            "token_count": len(window),
+            "start_token": start
+        })
+        if start + chunk_tokens >= len(tokens):
+            break
+        start += step
+
+    return chunks
@@ -0,0 +1,333 @@
+# zoku/backend/app/services/e_vector_index.py
+
+import os
+import json
+import time
+import asyncio
+import logging
+import numpy as np
+from contextlib import asynccontextmanager
+from app.db.supabase_client import supabase
+from app.config.tenants import tenant_user_ids
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Constants
+EMBEDDING_DIM = 1536  # text-embedding-ada-002
+VECTOR_INDEX_REFRESH_SECONDS = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "60"))
+FETCH_BATCH_SIZE = 200
+
+def parse_document_metadata(metadata):
+    """Document metadata is stored as a JSON string; older rows may hold a dict"""
+    if isinstance(metadata, str):
+        return json.loads(metadata or "{}")
+    return metadata or {}
+
+
+def parse_embedding(embedding):
+    """pgvector columns come back from PostgREST as a '[...]' string"""
+    if isinstance(embedding, str):
+        embedding = json.loads(embedding)
+    return np.asarray(embedding, dtype=np.float32)
+
+
+class VectorIndex:
+    """
+    In-memory cosine similarity index for one tenant.
+
+    Vectors are kept normalized in one contiguous float32 matrix, with the
+    document IDs and metadata in parallel arrays, so a search is a single
+    matrix-vector product. Removal swaps the last row into the freed slot.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, capacity=64):
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids = []
+        self._metadata = []
+        self._positions = {}
+        self._by_invoice = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._positions
+
+    def ids(self):
+        return set(self._positions)
+
+    def invoice_ids(self):
+        return set(self._by_invoice)
+
+    def invoice_documents(self, invoice_id):
+        return set(self._by_invoice.get(invoice_id, ()))
+
+    def invoice_metadata(self, invoice_id):
+        return [self._metadata[self._positions[doc_id]] for doc_id in self._by_invoice.get(invoice_id, ())]
+
+    def add(self, doc_id, embedding, metadata):
+        """Add or replace a document vector"""
+        vector = parse_embedding(embedding)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+
+        if doc_id in self._positions:
+            self.remove(doc_id)
+
+        if len(self._ids) == self._matrix.shape[0]:
+            grown = np.zeros((self._matrix.shape[0] * 2, self.dim), dtype=np.float32)
+            grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+            self._matrix = grown
+
+        row = len(self._ids)
+        self._matrix[row] = vector
+        self._ids.append(doc_id)
+        self._metadata.append(metadata)
+        self._positions[doc_id] = row
+
+        invoice_id = metadata.get("invoice_id")
+        if invoice_id:
+            self._by_invoice.setdefault(invoice_id, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        """Remove a document vector. Returns False if it was not indexed."""
+        row = self._positions.pop(doc_id, None)
+        if row is None:
+            return False
+
+        invoice_id = self._metadata[row].get("invoice_id")
+        if invoice_id in self._by_invoice:
+            self._by_invoice[invoice_id].discard(doc_id)
+            if not self._by_invoice[invoice_id]:
+                del self._by_invoice[invoice_id]
+
+        last = len(self._ids) - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = self._ids[last]
+            self._metadata[row] = self._metadata[last]
+            self._positions[self._ids[row]] = row
+
+        self._ids.pop()
+        self._metadata.pop()
+        return True
+
+    def remove_invoice(self, invoice_id):
+        """Remove every document of an invoice"""
+        for doc_id in self.invoice_documents(invoice_id):
+            self.remove(doc_id)
+
+    def items(self):
+        """(ids, normalized vectors, metadata) of all indexed documents"""
+        return list(self._ids), self._matrix[:len(self._ids)].copy(), list(self._metadata)
+
+    def search(self, query_embedding, k=5, invoice_ids=None):
+        """
+        Top-k documents by cosine similarity.
+
+        Args:
+            query_embedding: Query vector
+            k (int): Number of results
+            invoice_ids (list, optional): Only consider documents of these invoices
+
+        Returns:
+            list: (doc_id, score, metadata) tuples, best first
+        """
+        if not self._ids:
+            return []
+
+        query = parse_embedding(query_embedding)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        if invoice_ids is not None:
+            rows = np.array(
+                [self._positions[doc_id] for invoice_id in invoice_ids for doc_id in self._by_invoice.get(invoice_id, ())],
+                dtype=np.int64
+            )
+            if rows.size == 0:
+                return []
+            scores = self._matrix[rows] @ query
+        else:
+            rows = None
+            scores = self._matrix[:len(self._ids)] @ query
+
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            row = int(rows[i]) if rows is not None else int(i)
+            results.append((self._ids[row], float(scores[i]), self._metadata[row]))
+        return results
+
+
+class VectorIndexRegistry:
+    """
+    Lazily loads one VectorIndex per tenant and keeps it in sync with zokuai_documents.
+
+    Questions about specific invoices only load those invoices' rows, filtered on the
+    indexed invoice_id/user_id columns. A search over the whole tenant loads the
+    tenant once and later refreshes by diffing document IDs, downloading only the
+    embeddings of new rows. Documents processed or deleted in this process are
+    applied immediately; changes made by other processes (e.g. the ingestion
+    workers) arrive through invalidate_invoice, and anything missed is picked up
+    once a load is older than refresh_seconds.
+
+    Every read and change of a tenant's index happens under its lock: loads run
+    in a worker thread while they hold it, so nothing on the event loop may touch
+    the index meanwhile. Use locked_index() to search.
+    """
+
+    # Column of zokuai_documents that is passed to index.add()
+    payload_column = "embedding"
+
+    def __init__(self, refresh_seconds=VECTOR_INDEX_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._indexes = {}
+        self._refreshed_at = {}
+        self._invoice_loaded_at = {}
+        self._locks = {}
+
+    def _new_index(self, user_id):
+        return VectorIndex()
+
+    def _lock(self, user_id):
+        return self._locks.setdefault(user_id, asyncio.Lock())
+
+    def _tenant_user_ids(self, user_id):
+        """Owners whose documents go into this user's index"""
+        return tenant_user_ids(user_id)
+
+    def _document_metadata(self, row):
+        metadata = parse_document_metadata(row.get("metadata"))
+        metadata["invoice_id"] = row.get("invoice_id") or metadata.get("invoice_id")
+        metadata["user_id"] = row.get("user_id") or metadata.get("user_id")
+        return metadata
+
+    def _fetch_payloads(self, doc_ids):
+        payloads = {}
+        doc_ids = list(doc_ids)
+        for start in range(0, len(doc_ids), FETCH_BATCH_SIZE):
+            rows = supabase.table("zokuai_documents")\
+                .select(f"id, {self.payload_column}")\
+                .in_("id", doc_ids[start:start + FETCH_BATCH_SIZE])\
+                .execute().data or []
+            for row in rows:
+                if row.get(self.payload_column) is not None:
+                    payloads[row["id"]] = row[self.payload_column]
+        return payloads
+
+    def _load_invoices(self, user_id, index, invoice_ids):
+        """(Re)load the documents of some invoices in one query"""
+        rows = supabase.table("zokuai_documents")\
+            .select(f"id, invoice_id, user_id, metadata, {self.payload_column}")\
+            .in_("invoice_id", list(invoice_ids))\
+            .in_("user_id", self._tenant_user_ids(user_id))\
+            .execute().data or []
+
+        for invoice_id in invoice_ids:
+            index.remove_invoice(invoice_id)
+        for row in rows:
+            if row.get(self.payload_column) is not None:
+                index.add(row["id"], row[self.payload_column], self._document_metadata(row))
+
+        logger.info(f"{type(index).__name__} for {user_id}: loaded {len(rows)} documents of {len(invoice_ids)} invoices")
+
+    def _sync(self, user_id, index):
+        """Bring the whole tenant up to date"""
+        rows = supabase.table("zokuai_documents")\
+            .select("id, invoice_id, user_id, metadata")\
+            .in_("user_id", self._tenant_user_ids(user_id))\
+            .execute().data or []
+        documents = {row["id"]: self._document_metadata(row) for row in rows}
+        current = index.ids()
+
+        for doc_id in current - set(documents):
+            index.remove(doc_id)
+
+        new_ids = set(documents) - current
+        if new_ids:
+            for doc_id, payload in self._fetch_payloads(new_ids).items():
+                index.add(doc_id, payload, documents[doc_id])
+
+        logger.info(f"{type(index).__name__} for {user_id}: {len(index)} documents ({len(new_ids)} new)")
+
+    async def _fresh_index(self, user_id, required_invoice_ids=None):
+        """The user's index, loaded or refreshed when needed. Call with the tenant lock held."""
+        index = self._indexes.get(user_id)
+        if index is None:
+            index = self._indexes[user_id] = await asyncio.to_thread(self._new_index, user_id)
+        now = time.monotonic()
+
+        if required_invoice_ids is not None:
+            tenant_fresh = now - self._refreshed_at.get(user_id, float("-inf")) <= self.refresh_seconds
+            stale = [
+                invoice_id for invoice_id in dict.fromkeys(required_invoice_ids)
+                if not tenant_fresh and now - self._invoice_loaded_at.get((user_id, invoice_id), float("-inf")) > self.refresh_seconds
+            ]
+            if stale:
+                await asyncio.to_thread(self._load_invoices, user_id, index, stale)
+                # Invoices without documents yet (still processing) are looked up again next time
+                for invoice_id in set(stale) & index.invoice_ids():
+                    self._invoice_loaded_at[(user_id, invoice_id)] = now
+        elif now - self._refreshed_at.get(user_id, float("-inf")) > self.refresh_seconds:
+            await asyncio.to_thread(self._sync, user_id, index)
+            self._refreshed_at[user_id] = now
+
+        return index
+
+    @asynccontextmanager
+    async def locked_index(self, user_id, required_invoice_ids=None):
+        """
+        The user's index, loaded or refreshed when needed, for the duration of an
+        `async with` block. The tenant lock is held meanwhile, so keep the block short.
+
+        Args:
+            user_id (str): Tenant
+            required_invoice_ids (list, optional): Only make sure these invoices are
+                loaded and fresh; without it the whole tenant is loaded
+        """
+        async with self._lock(user_id):
+            yield await self._fresh_index(user_id, required_invoice_ids)
+
+    async def add_document(self, doc_id, payload, metadata):
+        """Add a newly processed document to every loaded index that covers its owner"""
+        for user_id in list(self._indexes):
+            if metadata.get("user_id") in self._tenant_user_ids(user_id):
+                async with self._lock(user_id):
+                    index = self._indexes.get(user_id)
+                    if index is not None:
+                        index.add(doc_id, payload, metadata)
+
+    async def remove_invoice(self, invoice_id):
+        """Drop an invoice's documents from every loaded index"""
+        for user_id in list(self._indexes):
+            async with self._lock(user_id):
+                index = self._indexes.get(user_id)
+                if index is not None:
+                    index.remove_invoice(invoice_id)
+                self._invoice_loaded_at.pop((user_id, invoice_id), None)
+
+    async def invalidate_invoice(self, invoice_id, user_id=None):
+        """The invoice's documents were changed by another process: reload them on next use"""
+        await self.remove_invoice(invoice_id)
+        for tenant in list(self._indexes):
+            if user_id is None or user_id in self._tenant_user_ids(tenant):
+                self._refreshed_at.pop(tenant, None)
+
+    def get_stats(self):
+        return {
+            "tenants": len(self._indexes),
+            "documents": {user_id: len(index) for user_id, index in self._indexes.items()},
+            "refresh_seconds": self.refresh_seconds,
+        }
+
+
+# Shared registry for this process
+vector_index_registry = VectorIndexRegistry()
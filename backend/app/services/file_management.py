@@ -1,9 +1,98 @@
 import os
+import hashlib
 from datetime import datetime
+from typing import Optional
 from fastapi import UploadFile
 
 UPLOAD_DIR = "uploaded_files/"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))  # 25 MB
+
+# File signatures of the formats we accept
+MAGIC_NUMBERS = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+]
+EXTENSION_MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+
+
+class UploadRejectedError(Exception):
+    """Raised when an upload is too large or its content does not match its type"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_mime_type(head: bytes) -> Optional[str]:
+    """Detect the file type from its first bytes. Returns None if unknown."""
+    # The PDF header may be preceded by junk bytes, the spec allows it within the first 1 KB
+    if b"%PDF-" in head[:1024]:
+        return "application/pdf"
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    return None
+
+
+async def spool_upload_file(
+    upload_file: UploadFile,
+    dest_path: str,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    expected_mime_type: Optional[str] = None,
+) -> dict:
+    """
+    Copy an upload to dest_path in a single pass of fixed-size chunks. While the
+    bytes go by they are hashed, counted against max_bytes and the first chunk is
+    used to sniff the real file type. Peak memory is one chunk, whatever the file size.
+
+    Returns a dict with the path, size in bytes, sha256 hex digest and MIME type.
+    Raises UploadRejectedError (and removes the partial file) if the upload is
+    empty, too large or not of the expected type.
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    mime_type = None
+
+    try:
+        with open(dest_path, "wb") as buffer:
+            while True:
+                chunk = await upload_file.read(CHUNK_SIZE)
+                if not chunk:
+                    if size == 0:
+                        # Nothing to sniff: reject before the type check reports "unknown"
+                        raise UploadRejectedError("File is empty", status_code=400)
+                    break
+
+                if size == 0:
+                    mime_type = sniff_mime_type(chunk)
+                    if expected_mime_type and mime_type != expected_mime_type:
+                        raise UploadRejectedError(
+                            f"File content does not match its extension (expected {expected_mime_type}, got {mime_type or 'unknown'})",
+                            status_code=415
+                        )
+
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejectedError(
+                        f"File too large. Maximum size is {max_bytes // (1024 * 1024)} MB",
+                        status_code=413
+                    )
+
+                sha256.update(chunk)
+                buffer.write(chunk)
+    except Exception:
+        if os.path.exists(dest_path):
+            os.unlink(dest_path)
+        raise
+
+    return {"path": dest_path, "size": size, "sha256": sha256.hexdigest(), "mime_type": mime_type}
 
 async def save_upload_file(upload_file: UploadFile) -> str:
     """
@@ -16,8 +105,7 @@ async def save_upload_file(upload_file: UploadFile) -> str:
     safe_filename = f"{os.path.splitext(upload_file.filename)[0]}_{timestamp}{file_extension}"
     file_path = os.path.join(UPLOAD_DIR, safe_filename)
 
-    # Save the file
-    with open(file_path, "wb") as buffer:
-        buffer.write(await upload_file.read())  # <-- Ensure this line is indented
+    # Save the file (streamed in chunks, never fully in memory)
+    await spool_upload_file(upload_file, file_path)
 
     return file_path  # <-- Ensure this line is at the same indentation level as `with`
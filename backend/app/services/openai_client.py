@@ -1,21 +1,9 @@
 # zoku/backend/app/services/openai_client.py
-import os
 import base64
 import json
 from typing import List, Dict, Any, Optional
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Load API key from environment variables
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-if not OPENAI_API_KEY:
-    raise ValueError("OpenAI API key not found in environment variables")
-
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+from app.services.e_openai_client import get_embeddings
+from app.services.e_llm_gateway import get_llm_client
 
 
 def encode_image_to_base64(image_path: str) -> str:
@@ -58,7 +46,7 @@ async def extract_invoice_data(
         """
 
         # Call the OpenAI Vision API
-        response = client.chat.completions.create(
+        response = await get_llm_client().chat.completions.create(
             model="gpt-4-vision-preview",
             messages=[
                 {
@@ -120,7 +108,8 @@ async def extract_invoice_data(
 
 async def create_document_embedding(text: str) -> List[float]:
     """
-    Create an embedding vector for document text using OpenAI's embedding API
+    Create an embedding vector for document text using OpenAI's embedding API.
+    Goes through the shared embedding batcher, so concurrent calls share API requests.
 
     Args:
         text: The document text to embed
@@ -129,14 +118,7 @@ async def create_document_embedding(text: str) -> List[float]:
         List of floats representing the embedding vector
     """
     try:
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-
-        # Extract the embedding vector from the response
-        embedding = response.data[0].embedding
-        return embedding
+        return await get_embeddings(text)
 
     except Exception as e:
         print(f"Error creating document embedding: {str(e)}")
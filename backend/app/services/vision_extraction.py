@@ -2,20 +2,15 @@
 
 from typing import List, Optional
 from app.schemas.invoice import ExtractionField
-from app.config.settings import get_settings
-from openai import OpenAI
+from app.services.e_llm_gateway import get_llm_client
 import os
 import json
 import base64
 import re
 
-settings = get_settings()
-
-# Set OpenAI API key
-client = OpenAI(api_key=settings.openai_api_key)
 UPLOAD_FOLDER = "uploaded_files"  # or wherever you save the invoices
 
-def extract_invoice_fields_with_ai(file_path: Optional[str] = None) -> List[ExtractionField]:
+async def extract_invoice_fields_with_ai(file_path: Optional[str] = None) -> List[ExtractionField]:
     if file_path is None:
         UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "uploaded_files")
         file_path = os.path.abspath(os.path.join(UPLOAD_DIR, "demo-invoice.png"))
@@ -45,7 +40,7 @@ def extract_invoice_fields_with_ai(file_path: Optional[str] = None) -> List[Extr
     """
 
     try:
-        response = client.chat.completions.create(
+        response = await get_llm_client().chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
@@ -0,0 +1,169 @@
+# Unit tests of the IVF (approximate nearest neighbour) index and its retraining.
+# Run from the backend directory: python -m pytest app/test/test_ann_index.py
+
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.services.e_ann_index import AnnIndexRegistry, IVFFlatIndex
+
+DIM = 32
+
+
+def make_vectors(n, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_index(vectors, min_train_size=64, nprobe=4):
+    index = IVFFlatIndex(dim=DIM, nprobe=nprobe, min_train_size=min_train_size)
+    for i, vector in enumerate(vectors):
+        index.add(f"doc-{i}", vector, {"invoice_id": f"inv-{i % 10}", "user_id": "user-1"})
+    return index
+
+
+def test_untrained_index_searches_exactly():
+    vectors = make_vectors(50)
+    index = make_index(vectors, min_train_size=1000)
+
+    assert index.centroids is None
+    assert index.nlist == 1
+    hits = index.search(vectors[7], k=3)
+    assert hits[0][0] == "doc-7"
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert [score for _, score, _ in hits] == sorted((score for _, score, _ in hits), reverse=True)
+
+
+def test_add_does_not_train_by_itself():
+    index = make_index(make_vectors(200), min_train_size=64)
+
+    assert index.needs_training()
+    assert index.centroids is None
+    assert index.nlist == 1
+
+
+def test_train_keeps_every_document_and_finds_them():
+    vectors = make_vectors(400)
+    index = make_index(vectors)
+    index.train()
+
+    assert not index.needs_training()
+    assert index.nlist == int(np.sqrt(400))
+    assert len(index) == 400
+    assert index.ids() == {f"doc-{i}" for i in range(400)}
+    # A stored vector lands in the list of its closest centroid, which is always probed
+    for i in range(0, 400, 37):
+        assert index.search(vectors[i], k=1, nprobe=1)[0][0] == f"doc-{i}"
+
+
+def test_needs_training_again_after_doubling():
+    vectors = make_vectors(300)
+    index = make_index(vectors[:100])
+    index.train()
+
+    for i in range(100, 199):
+        index.add(f"doc-{i}", vectors[i], {})
+    assert not index.needs_training()
+    index.add("doc-199", vectors[199], {})
+    assert index.needs_training()
+
+
+def test_search_during_and_after_retrain():
+    vectors = make_vectors(3000)
+    index = make_index(vectors[:1500])
+    index.train()
+    for i in range(1500, 3000):
+        index.add(f"doc-{i}", vectors[i], {"invoice_id": f"inv-{i % 10}"})
+    assert index.needs_training()
+
+    errors = []
+
+    def train():
+        try:
+            index.train()
+        except Exception as e:
+            errors.append(e)
+
+    searches = 0
+    trainer = threading.Thread(target=train)
+    trainer.start()
+    while trainer.is_alive() or searches == 0:
+        # Every search sees either the old or the new lists, never a mix of both
+        hits = index.search(vectors[42], k=5)
+        assert hits[0][0] == "doc-42"
+        searches += 1
+    trainer.join()
+
+    assert errors == []
+    assert index.nlist == int(np.sqrt(3000))
+    assert len(index) == 3000
+    assert index.search(vectors[2999], k=1)[0][0] == "doc-2999"
+
+
+def test_invoice_filter_searches_all_lists():
+    vectors = make_vectors(400)
+    index = make_index(vectors)
+    index.train()
+
+    hits = index.search(vectors[3], k=400, invoice_ids=["inv-3"], nprobe=1)
+    assert {doc_id for doc_id, _, _ in hits} == {f"doc-{i}" for i in range(3, 400, 10)}
+
+
+def test_remove_after_training():
+    vectors = make_vectors(400)
+    index = make_index(vectors)
+    index.train()
+
+    assert index.remove("doc-5")
+    assert not index.remove("doc-5")
+    index.remove_invoice("inv-1")
+
+    assert "doc-5" not in index
+    assert "inv-1" not in index.invoice_ids()
+    assert len(index) == 400 - 1 - 40
+    assert all(doc_id != "doc-5" for doc_id, _, _ in index.search(vectors[5], k=10))
+
+
+def test_save_and_load_round_trip(tmp_path):
+    vectors = make_vectors(300)
+    index = make_index(vectors)
+    index.train()
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+
+    loaded = IVFFlatIndex.load(path, nprobe=4)
+    assert loaded.ids() == index.ids()
+    assert loaded.nlist == index.nlist
+    assert not loaded.needs_training()
+    assert loaded.search(vectors[9], k=1)[0][0] == "doc-9"
+
+
+def test_registry_retrains_in_the_background(tmp_path):
+    vectors = make_vectors(300)
+
+    async def scenario():
+        registry = AnnIndexRegistry(index_dir=str(tmp_path), nprobe=4)
+        registry._indexes["user-1"] = IVFFlatIndex(dim=DIM, min_train_size=256)
+        registry._refreshed_at["user-1"] = time.monotonic()
+
+        for i, vector in enumerate(vectors):
+            await registry.add_document(f"doc-{i}", vector, {"invoice_id": f"inv-{i}", "user_id": "user-1"})
+        assert registry.get_stats()["retraining"] == 1
+
+        # Once the retraining holds the lock, searches wait for it instead of seeing a half-built index
+        await asyncio.sleep(0)
+        async with registry.locked_index("user-1") as index:
+            assert index.nlist > 1
+            assert len(index) == 300
+            hits = index.search(vectors[0], k=1)
+        assert hits[0][0] == "doc-0"
+
+        await asyncio.gather(*registry._tasks)
+        assert registry.get_stats()["retraining"] == 0
+        assert list(tmp_path.iterdir())  # Saved after training
+
+    asyncio.run(scenario())
@@ -0,0 +1,165 @@
+# Unit tests of the semantic answer cache: similarity threshold, staleness and which answers are reused.
+# zokuai_chat_history is served by an in-memory fake.
+# Run from the backend directory: python -m pytest app/test/test_answer_cache.py
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from app.services import e_answer_cache
+from app.services.e_answer_cache import SemanticAnswerCache, _parse_timestamp, documents_updated_at
+
+ANSWERED_AT = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeQuery:
+    """The few PostgREST builder calls the cache's history query uses"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.descending = False
+        self.row_limit = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def order(self, column, desc=False):
+        self.column, self.descending = column, desc
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if all(keep(row) for keep in self.filters)]
+        rows.sort(key=lambda row: row[self.column], reverse=self.descending)
+        return type("Result", (), {"data": rows[:self.row_limit]})()
+
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def table(self, name):
+        assert name == "zokuai_chat_history"
+        return FakeQuery(self.rows)
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def history_row(row_id, embedding, response, document_ids=("inv-1",), cacheable=True, answered_at=ANSWERED_AT):
+    return {
+        "id": row_id,
+        "user_id": "user-1",
+        "query_embedding": embedding,
+        "response": response,
+        "document_ids": list(document_ids),
+        "timestamp": answered_at.isoformat(),
+        "cacheable": cacheable,
+    }
+
+
+@pytest.fixture
+def history(monkeypatch):
+    rows = []
+    monkeypatch.setattr(e_answer_cache, "supabase", FakeSupabase(rows))
+    return rows
+
+
+def lookup(cache, query_embedding, document_ids=("inv-1",), updated_at=ANSWERED_AT - timedelta(hours=1)):
+    return asyncio.run(cache.lookup("user-1", list(document_ids), query_embedding, updated_at))
+
+
+def test_near_identical_question_is_a_hit(history):
+    history.append(history_row("h1", unit(1, 0, 0), "Total is 100 EUR"))
+    cache = SemanticAnswerCache(threshold=0.97)
+
+    hit = lookup(cache, unit(1, 0.1, 0))  # Cosine similarity ~0.995
+    assert hit["id"] == "h1"
+    assert hit["answer"] == "Total is 100 EUR"
+    assert hit["similarity"] == pytest.approx(0.995, abs=1e-3)
+
+    assert lookup(cache, unit(1, 0.5, 0)) is None  # ~0.894, below the threshold
+    assert lookup(cache, unit(1, 0.1, 0), document_ids=("inv-1", "inv-2")) is None  # Other invoices
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_answer_older_than_the_documents_is_stale(history):
+    history.append(history_row("h1", unit(0, 1, 0), "Old answer"))
+    cache = SemanticAnswerCache(threshold=0.97)
+
+    assert lookup(cache, unit(0, 1, 0), updated_at=ANSWERED_AT + timedelta(seconds=1)) is None
+    assert cache.get_stats()["stale_misses"] == 1
+    # Unknown document age is never a hit
+    assert lookup(cache, unit(0, 1, 0), updated_at=None) is None
+    assert lookup(cache, unit(0, 1, 0))["answer"] == "Old answer"
+
+
+def test_staleness_compares_utc_times(history):
+    # Answered at 12:00 UTC, written with a +02:00 offset
+    answered_at = ANSWERED_AT.astimezone(timezone(timedelta(hours=2)))
+    history.append(history_row("h1", unit(0, 0, 1), "Answer", answered_at=answered_at))
+    cache = SemanticAnswerCache(threshold=0.97)
+
+    assert lookup(cache, unit(0, 0, 1), updated_at=_parse_timestamp("2026-03-01T11:59:00+00:00")) is not None
+    assert lookup(cache, unit(0, 0, 1), updated_at=_parse_timestamp("2026-03-01T13:59:00+02:00")) is not None
+    assert lookup(cache, unit(0, 0, 1), updated_at=_parse_timestamp("2026-03-01T12:01:00Z")) is None
+
+
+def test_parse_timestamp_returns_aware_utc():
+    assert _parse_timestamp("2026-03-01T14:00:00+02:00") == ANSWERED_AT
+    assert _parse_timestamp("2026-03-01 12:00:00Z") == ANSWERED_AT
+    # No offset: written in the server's local time
+    assert _parse_timestamp("2026-03-01 12:00:00") == datetime(2026, 3, 1, 12, 0).astimezone(timezone.utc)
+    assert _parse_timestamp("yesterday") is None
+    assert _parse_timestamp(None) is None
+
+
+def test_only_cacheable_answers_are_loaded(history):
+    history.append(history_row("follow-up", unit(1, 1, 0), "It was paid in March", cacheable=False))
+    history.append(history_row("grounded", unit(1, 1, 0), "Paid on 3 March"))
+    cache = SemanticAnswerCache(threshold=0.97)
+
+    assert lookup(cache, unit(1, 1, 0))["id"] == "grounded"
+    assert cache.get_stats()["cached_answers"] == 1
+
+
+def test_added_answers_are_found_until_their_invoice_changes(history):
+    cache = SemanticAnswerCache(threshold=0.97)
+    assert lookup(cache, unit(1, 0, 1)) is None  # Loads the (empty) history of user-1
+
+    cache.add("user-1", ["inv-2", "inv-1"], unit(1, 0, 1), "Both are from ACME", entry_id="m1")
+    hit = lookup(cache, unit(1, 0, 1), document_ids=("inv-1", "inv-2"))
+    assert hit["id"] == "m1"
+
+    cache.invalidate_invoice("inv-2")
+    assert lookup(cache, unit(1, 0, 1), document_ids=("inv-1", "inv-2")) is None
+    assert cache.get_stats()["invalidated_answers"] == 1
+
+
+def test_documents_updated_at_is_the_latest_document_time():
+    class Index:
+        metadata = {
+            "inv-1": [{"timestamp": "2026-03-01T10:00:00+00:00"}, {"timestamp": "2026-03-01T11:00:00+00:00"}],
+            "inv-2": [{"timestamp": "2026-03-01T13:30:00+02:00"}],
+            "inv-3": [],
+        }
+
+        def invoice_metadata(self, invoice_id):
+            return self.metadata[invoice_id]
+
+    index = Index()
+    assert documents_updated_at(index, ["inv-1", "inv-2"]) == datetime(2026, 3, 1, 11, 30, tzinfo=timezone.utc)
+    assert documents_updated_at(index, ["inv-1", "inv-3"]) is None
@@ -0,0 +1,134 @@
+# Unit tests of the write-behind chat writer: batching, flush on shutdown, session count deltas and retries.
+# Supabase is replaced by in-memory fakes.
+# Run from the backend directory: python -m pytest app/test/test_chat_writer.py
+
+import asyncio
+
+import pytest
+
+from app.services import e_chat_manager
+from app.services.e_chat_writer import ChatWriter
+
+
+class FakeDatabase:
+    """Records inserted history rows and session count increments"""
+
+    def __init__(self):
+        self.inserts = []
+        self.increments = []
+        self.bad_ids = set()
+        self.increment_failures = 0
+        self.reconcile_calls = []
+
+    def insert(self, rows):
+        if self.bad_ids & {row["id"] for row in rows}:
+            raise ValueError("invalid row")
+        self.inserts.append([row["id"] for row in rows])
+
+    def increment(self, deltas):
+        if self.increment_failures:
+            self.increment_failures -= 1
+            raise ConnectionError("database unavailable")
+        self.increments.append(dict(deltas))
+        return len(deltas)
+
+    def reconcile(self, since=None, skip_session_ids=None, idle_seconds=0):
+        self.reconcile_calls.append((since, sorted(skip_session_ids or []), idle_seconds))
+        return 0
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(ChatWriter, "_insert", lambda self, rows: db.insert(rows))
+    monkeypatch.setattr(e_chat_manager, "increment_session_counts", db.increment)
+    monkeypatch.setattr(e_chat_manager, "reconcile_session_counts", db.reconcile)
+    return db
+
+
+def row(row_id, session_id="session-1", user_id="user-1"):
+    return {"id": row_id, "user_id": user_id, "session_id": session_id}
+
+
+def written(db):
+    return sorted(row_id for batch in db.inserts for row_id in batch)
+
+
+def test_close_writes_queued_rows_in_one_batch(db):
+    writer = ChatWriter(batch_size=10, flush_seconds=0.05)
+
+    async def scenario():
+        await writer.submit(row("m1"))
+        await writer.submit(row("m2", session_id="session-2"))
+        await writer.submit(row("m3"))
+        await writer.close()
+
+    asyncio.run(scenario())
+    assert db.inserts == [["m1", "m2", "m3"]]
+    # The messages of each session are counted with one delta per (session, user)
+    assert db.increments == [{("session-1", "user-1"): 2, ("session-2", "user-1"): 1}]
+    stats = writer.get_stats()
+    assert (stats["written"], stats["batches"], stats["pending"]) == (3, 1, 0)
+
+
+def test_batches_are_capped_at_batch_size(db):
+    writer = ChatWriter(batch_size=2, flush_seconds=0.05)
+
+    async def scenario():
+        for i in range(5):
+            await writer.submit(row(f"m{i}"))
+        await writer.close()
+
+    asyncio.run(scenario())
+    assert [len(batch) for batch in db.inserts] == [2, 2, 1]
+    assert sum(delta[("session-1", "user-1")] for delta in db.increments) == 5
+
+
+def test_bad_row_is_dropped_without_losing_the_batch(db):
+    db.bad_ids = {"bad"}
+    writer = ChatWriter(batch_size=10, flush_seconds=0.05)
+
+    async def scenario():
+        for row_id in ["m1", "bad", "m2"]:
+            await writer.submit(row(row_id))
+        await writer.close()
+
+    asyncio.run(scenario())
+    assert written(db) == ["m1", "m2"]
+    assert db.increments == [{("session-1", "user-1"): 2}]
+    assert writer.get_stats()["failed"] == 1
+
+
+def test_failed_increment_is_retried_without_new_rows(db):
+    db.increment_failures = 1
+    writer = ChatWriter(batch_size=10, flush_seconds=0.02)
+
+    async def scenario():
+        await writer.submit(row("m1"))
+        await writer.submit(row("m2", user_id="user-2", session_id="session-2"))
+        await writer.flush()
+        assert writer.get_stats()["pending_session_deltas"] == 2
+        # Retried after one flush interval without rows
+        for _ in range(50):
+            if db.increments:
+                break
+            await asyncio.sleep(0.01)
+        await writer.close()
+
+    asyncio.run(scenario())
+    assert db.increments == [{("session-1", "user-1"): 1, ("session-2", "user-2"): 1}]
+    stats = writer.get_stats()
+    assert (stats["increment_failures"], stats["pending_session_deltas"]) == (1, 0)
+
+
+def test_reconcile_skips_sessions_with_pending_increments(db):
+    db.increment_failures = 2  # The batch's increment and the one reconcile() tries first
+    writer = ChatWriter(batch_size=10, flush_seconds=60)
+
+    async def scenario():
+        await writer._write([(row("m1"), 0.0)])
+        await writer.reconcile(idle_seconds=30)
+
+    asyncio.run(scenario())
+    assert db.reconcile_calls == [(None, ["session-1"], 30)]
+    assert writer.get_stats()["pending_session_deltas"] == 1
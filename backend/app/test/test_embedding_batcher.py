@@ -0,0 +1,117 @@
+# Unit tests of the embedding batcher: coalescing, size-triggered flushes and error fan-out.
+# Run from the backend directory: python -m pytest app/test/test_embedding_batcher.py
+
+import asyncio
+
+from app.services.e_embedding_batcher import EmbeddingBatcher
+
+
+class BadInputError(Exception):
+    pass
+
+
+class FakeEmbeddings:
+    """Records every batch call; a text's vector is [len(text)]"""
+
+    def __init__(self, error=None, bad_texts=()):
+        self.calls = []
+        self.error = error
+        self.bad_texts = set(bad_texts)
+
+    async def __call__(self, texts):
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        if self.bad_texts & set(texts):
+            raise BadInputError("invalid input")
+        return [[float(len(text))] for text in texts]
+
+
+def test_concurrent_requests_share_one_call():
+    embed = FakeEmbeddings()
+    batcher = EmbeddingBatcher(embed, max_batch_size=10, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(batcher.embed("a"), batcher.embed("bb"), batcher.embed("a"))
+
+    assert asyncio.run(scenario()) == [[1.0], [2.0], [1.0]]
+    # Identical texts in a batch are embedded once
+    assert embed.calls == [["a", "bb"]]
+    stats = batcher.get_stats()
+    assert stats["requests"] == 3
+    assert stats["api_calls"] == 1
+    assert stats["inputs_sent"] == 2
+
+
+def test_full_batch_is_sent_without_waiting():
+    embed = FakeEmbeddings()
+    batcher = EmbeddingBatcher(embed, max_batch_size=2, max_wait_ms=60_000)
+
+    async def scenario():
+        first = await asyncio.wait_for(batcher.embed_many(["a", "bb"]), timeout=1)
+        # A lone request waits for the timer, or for close()
+        pending = asyncio.ensure_future(batcher.embed("ccc"))
+        await asyncio.sleep(0.05)
+        assert not pending.done()
+        await batcher.close()
+        return first, await pending
+
+    first, last = asyncio.run(scenario())
+    assert first == [[1.0], [2.0]]
+    assert last == [3.0]
+    assert embed.calls == [["a", "bb"], ["ccc"]]
+
+
+def test_batch_error_fails_every_request():
+    embed = FakeEmbeddings(error=RuntimeError("rate limited"))
+    batcher = EmbeddingBatcher(embed, max_batch_size=10, max_wait_ms=1, split_on=(BadInputError,))
+
+    async def scenario():
+        return await asyncio.gather(batcher.embed("a"), batcher.embed("bb"), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    # Not a bad-input error: no per-input retries
+    assert embed.calls == [["a", "bb"]]
+    assert batcher.get_stats()["failures"] == 1
+
+
+def test_bad_input_only_fails_its_own_request():
+    embed = FakeEmbeddings(bad_texts={"bad"})
+    batcher = EmbeddingBatcher(embed, max_batch_size=10, max_wait_ms=1, split_on=(BadInputError,))
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.embed("a"), batcher.embed("bad"), batcher.embed("ccc"), return_exceptions=True
+        )
+
+    good, bad, other = asyncio.run(scenario())
+    assert good == [1.0]
+    assert isinstance(bad, BadInputError)
+    assert other == [3.0]
+    assert embed.calls[0] == ["a", "bad", "ccc"]
+    assert sorted(embed.calls[1:]) == [["a"], ["bad"], ["ccc"]]
+
+
+def test_embed_many_keeps_the_order():
+    embed = FakeEmbeddings()
+    batcher = EmbeddingBatcher(embed, max_batch_size=3, max_wait_ms=1)
+
+    texts = ["x" * n for n in range(1, 8)]
+    vectors = asyncio.run(batcher.embed_many(texts))
+    assert vectors == [[float(n)] for n in range(1, 8)]
+    assert [len(call) for call in embed.calls] == [3, 3, 1]
+
+
+def test_close_sends_waiting_requests():
+    embed = FakeEmbeddings()
+    batcher = EmbeddingBatcher(embed, max_batch_size=4, max_wait_ms=60_000)
+
+    async def scenario():
+        pending = asyncio.ensure_future(batcher.embed("abc"))
+        await asyncio.sleep(0)
+        await batcher.close()
+        return await pending
+
+    assert asyncio.run(scenario()) == [3.0]
+    assert batcher.get_stats()["pending"] == 0
@@ -0,0 +1,120 @@
+# Unit tests of the two-tier embedding cache: LRU eviction in memory and on disk, and the SQLite fallback.
+# Run from the backend directory: python -m pytest app/test/test_embedding_cache.py
+
+import asyncio
+import types
+
+import pytest
+
+from app.services import e_embedding_cache
+from app.services.e_embedding_cache import EmbeddingCache
+
+MODEL = "text-embedding-ada-002"
+
+
+class Clock:
+    """Manually advanced replacement for time.time()"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(e_embedding_cache, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "embeddings.sqlite3")
+
+
+def vector(value):
+    # Exactly representable in float32, so disk round trips compare equal
+    return [value, value / 2]
+
+
+def test_memory_tier_evicts_least_recently_used(path, clock):
+    cache = EmbeddingCache(path, memory_items=2)
+
+    async def scenario():
+        await cache.put_many(MODEL, ["a", "b"], [vector(1.0), vector(2.0)])
+        assert await cache.get(MODEL, "a") == vector(1.0)  # "a" is now the most recent
+        await cache.put(MODEL, "c", vector(3.0))  # Evicts "b" from memory
+        return await cache.get_many(MODEL, ["a", "b", "c"])
+
+    assert asyncio.run(scenario()) == [vector(1.0), vector(2.0), vector(3.0)]
+    stats = cache.get_stats()
+    assert stats["memory_items"] == 2
+    assert stats["memory_hits"] == 3  # "a" twice, "c"
+    assert stats["disk_hits"] == 1  # "b"
+    assert stats["misses"] == 0
+
+
+def test_disk_tier_is_shared_with_a_new_cache(path, clock):
+    async def scenario():
+        await EmbeddingCache(path).put(MODEL, "invoice total", vector(0.5))
+
+        cache = EmbeddingCache(path)
+        first = await cache.get(MODEL, "invoice total")
+        second = await cache.get(MODEL, "invoice total")
+        missing = await cache.get(MODEL, "something else")
+        return cache, first, second, missing
+
+    cache, first, second, missing = asyncio.run(scenario())
+    assert first == second == vector(0.5)
+    assert missing is None
+    stats = cache.get_stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_entries_are_keyed_by_model(path, clock):
+    cache = EmbeddingCache(path)
+
+    async def scenario():
+        await cache.put("model-a", "text", vector(1.0))
+        return await cache.get("model-a", "text"), await cache.get("model-b", "text")
+
+    assert asyncio.run(scenario()) == (vector(1.0), None)
+
+
+def test_disk_tier_evicts_least_recently_used(path, clock, monkeypatch):
+    monkeypatch.setattr(e_embedding_cache, "EVICTION_CHECK_EVERY", 1)
+
+    async def scenario():
+        writer = EmbeddingCache(path, memory_items=0, disk_items=2)
+        await writer.put(MODEL, "a", vector(1.0))
+        clock.advance(1)
+        await writer.put(MODEL, "b", vector(2.0))
+        clock.advance(1)
+        assert await writer.get(MODEL, "a") == vector(1.0)  # Refreshes last_access of "a"
+        clock.advance(1)
+        await writer.put(MODEL, "c", vector(3.0))  # Evicts "b", the least recently used
+
+        reader = EmbeddingCache(path, memory_items=0)
+        return writer, await reader.get_many(MODEL, ["a", "b", "c"])
+
+    writer, found = asyncio.run(scenario())
+    assert found == [vector(1.0), None, vector(3.0)]
+    assert writer.get_stats()["disk_evictions"] == 1
+
+
+def test_unusable_disk_tier_falls_back_to_memory(tmp_path, clock):
+    # A directory cannot be opened as a SQLite database
+    cache = EmbeddingCache(str(tmp_path), memory_items=10)
+
+    async def scenario():
+        await cache.put(MODEL, "a", vector(1.0))
+        return await cache.get_many(MODEL, ["a", "b"])
+
+    assert asyncio.run(scenario()) == [vector(1.0), None]
+    stats = cache.get_stats()
+    assert (stats["memory_hits"], stats["misses"]) == (1, 1)
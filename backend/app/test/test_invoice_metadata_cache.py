@@ -0,0 +1,96 @@
+# Unit tests of the per-user invoice metadata cache: tenant scoping, expiry and the bound on users.
+# zokuai_invoices is served by an in-memory fake.
+# Run from the backend directory: python -m pytest app/test/test_invoice_metadata_cache.py
+
+import asyncio
+import types
+from collections import OrderedDict
+
+import pytest
+
+from app.db import supabase_client
+from app.db.supabase_client import get_invoice_metadata_bulk
+
+
+class FakeQuery:
+    def __init__(self, rows, queries):
+        self.rows = rows
+        self.filters = {}
+        queries.append(self.filters)
+
+    def select(self, columns):
+        return self
+
+    def in_(self, column, values):
+        self.filters[column] = list(values)
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if all(row[column] in values for column, values in self.filters.items())]
+        return types.SimpleNamespace(data=rows)
+
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def table(self, name):
+        assert name == "zokuai_invoices"
+        return FakeQuery(self.rows, self.queries)
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeSupabase([
+        {"id": f"inv-{i}", "user_id": f"user-{i}", "filename": f"{i}.pdf"} for i in range(4)
+    ] + [{"id": "shared", "user_id": "test-user-123", "filename": "shared.pdf"}])
+    monkeypatch.setattr(supabase_client, "supabase", db)
+    monkeypatch.setattr(supabase_client, "_invoice_metadata_cache", OrderedDict())
+    return db
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(supabase_client, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def bulk(invoice_ids, user_id):
+    return asyncio.run(get_invoice_metadata_bulk(invoice_ids, user_id=user_id))
+
+
+def test_only_the_tenants_invoices_are_returned_and_cached(db, clock):
+    assert set(bulk(["inv-1", "inv-2", "shared"], "user-1")) == {"inv-1", "shared"}
+    assert db.queries[0]["user_id"] == ["user-1", "test-user-123", "test-user-esra"]
+
+    assert set(bulk(["inv-1", "shared"], "user-1")) == {"inv-1", "shared"}
+    assert len(db.queries) == 1
+
+
+def test_expired_entries_are_dropped_on_the_next_write(db, clock, monkeypatch):
+    monkeypatch.setattr(supabase_client, "INVOICE_METADATA_TTL_SECONDS", 60)
+    bulk(["inv-1"], "user-1")
+    clock.now += 61
+    bulk(["shared"], "user-1")
+
+    assert set(supabase_client._invoice_metadata_cache["user-1"]) == {"shared"}
+
+
+def test_least_recently_used_users_are_evicted(db, clock, monkeypatch):
+    monkeypatch.setattr(supabase_client, "INVOICE_METADATA_CACHE_USERS", 2)
+    bulk(["inv-0"], "user-0")
+    bulk(["inv-1"], "user-1")
+    bulk(["inv-0"], "user-0")  # Cached; user-0 is now the most recent
+    bulk(["inv-2"], "user-2")
+
+    assert list(supabase_client._invoice_metadata_cache) == ["user-0", "user-2"]
@@ -0,0 +1,165 @@
+# Unit tests of the SQLite ingestion job queue: leases, retries and failure.
+# Run from the backend directory: python -m pytest app/test/test_job_queue.py
+
+import types
+
+import pytest
+
+from app.services import e_job_queue
+from app.services.e_job_queue import JobQueue
+
+
+class Clock:
+    """Manually advanced replacement for time.time()"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(e_job_queue, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return JobQueue(str(tmp_path / "queue.sqlite3"))
+
+
+def test_claim_leases_the_job_to_one_worker(queue):
+    job_id = queue.enqueue("convert_pdf", {"invoice_id": "inv-1"})
+
+    job = queue.claim("worker-a", visibility_timeout=60)
+    assert job["id"] == job_id
+    assert job["status"] == "running"
+    assert job["attempts"] == 1
+    assert job["payload"] == {"invoice_id": "inv-1"}
+
+    assert queue.claim("worker-b", visibility_timeout=60) is None
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue, clock):
+    job_id = queue.enqueue("convert_pdf", {})
+    queue.claim("worker-a", visibility_timeout=60)
+
+    clock.advance(59)
+    assert queue.claim("worker-b", visibility_timeout=60) is None
+
+    clock.advance(2)
+    job = queue.claim("worker-b", visibility_timeout=60)
+    assert job["id"] == job_id
+    assert job["locked_by"] == "worker-b"
+    assert job["attempts"] == 2
+
+    # The worker that lost the lease can neither extend nor complete the job
+    assert not queue.extend_lease(job_id, "worker-a")
+    assert not queue.complete(job_id, "worker-a")
+    assert queue.complete(job_id, "worker-b")
+    assert queue.get_stats() == {"convert_pdf": {"done": 1}}
+
+
+def test_extended_lease_is_not_reclaimed(queue, clock):
+    job_id = queue.enqueue("extract_text", {})
+    queue.claim("worker-a", visibility_timeout=60)
+
+    clock.advance(50)
+    assert queue.extend_lease(job_id, "worker-a", visibility_timeout=60)
+    clock.advance(50)
+    assert queue.claim("worker-b", visibility_timeout=60) is None
+
+
+def test_failed_job_is_retried_after_backoff(queue, clock):
+    job_id = queue.enqueue("embed_document", {}, max_attempts=3)
+    queue.claim("worker-a")
+
+    assert queue.fail(job_id, "worker-a", "boom") is True
+    assert queue.claim("worker-a") is None  # Backing off
+
+    clock.advance(e_job_queue.RETRY_MAX_DELAY * 1.2 + 1)
+    job = queue.claim("worker-a")
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+    assert job["last_error"] == "boom"
+
+
+def test_job_fails_when_attempts_are_used_up(queue, clock):
+    job_id = queue.enqueue("embed_document", {}, max_attempts=2)
+
+    queue.claim("worker-a")
+    assert queue.fail(job_id, "worker-a", "first") is True
+    clock.advance(e_job_queue.RETRY_MAX_DELAY * 1.2 + 1)
+    queue.claim("worker-a")
+    assert queue.fail(job_id, "worker-a", "second") is False
+
+    clock.advance(e_job_queue.RETRY_MAX_DELAY * 1.2 + 1)
+    assert queue.claim("worker-a") is None
+    assert queue.get_stats() == {"embed_document": {"failed": 1}}
+
+
+def test_expired_lease_on_last_attempt_is_reaped(queue, clock):
+    job_id = queue.enqueue("convert_pdf", {}, max_attempts=1)
+    queue.claim("worker-a", visibility_timeout=60)
+
+    assert queue.reap_expired() == []
+    clock.advance(61)
+    assert queue.claim("worker-b") is None
+
+    reaped = queue.reap_expired()
+    assert [job["id"] for job in reaped] == [job_id]
+    assert queue.get_stats() == {"convert_pdf": {"failed": 1}}
+
+
+def test_enqueue_with_job_id_is_idempotent(queue):
+    first = queue.enqueue("extract_text", {"n": 1}, job_id="parent:extract_text")
+    second = queue.enqueue("extract_text", {"n": 2}, job_id="parent:extract_text")
+
+    assert first == second
+    job = queue.claim("worker-a")
+    assert job["payload"] == {"n": 1}
+    assert queue.claim("worker-a") is None
+
+
+def test_claim_only_takes_the_requested_kinds(queue):
+    queue.enqueue("convert_pdf", {})
+    assert queue.claim("worker-a", kinds=["embed_document"]) is None
+    assert queue.claim("worker-a", kinds=["convert_pdf"])["kind"] == "convert_pdf"
+
+
+def test_purge_finished_drops_old_done_jobs_and_changes(queue, clock):
+    done_id = queue.enqueue("convert_pdf", {})
+    queue.claim("worker-a")
+    queue.complete(done_id, "worker-a")
+    queue.enqueue("convert_pdf", {}, delay=3600)
+    queue.publish_document_change("inv-1", "user-1", "api-1")
+
+    clock.advance(100)
+    queue.publish_document_change("inv-2", "user-1", "api-1")
+
+    assert queue.purge_finished(older_than=50) == 1
+    assert queue.get_stats() == {"convert_pdf": {"queued": 1}}
+    assert [change["invoice_id"] for change in queue.document_changes_since(0)] == ["inv-2"]
+
+
+def test_worker_stats_of_stopped_workers_are_left_out(queue, clock):
+    queue.publish_worker_stats("worker-a", {"ocr": {"queue_depth": 3}})
+    queue.publish_worker_stats("worker-b", {"ocr": {"queue_depth": 1}})
+    queue.publish_worker_stats("worker-a", {"ocr": {"queue_depth": 2}})
+    assert queue.worker_stats(max_age=10) == {
+        "worker-a": {"ocr": {"queue_depth": 2}},
+        "worker-b": {"ocr": {"queue_depth": 1}},
+    }
+
+    clock.advance(11)
+    queue.publish_worker_stats("worker-b", {"ocr": {"queue_depth": 0}})
+    assert queue.worker_stats(max_age=10) == {"worker-b": {"ocr": {"queue_depth": 0}}}
+
+    queue.remove_worker_stats("worker-b")
+    assert queue.worker_stats(max_age=10) == {}
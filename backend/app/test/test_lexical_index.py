@@ -0,0 +1,85 @@
+# Unit tests of the BM25 tokenizer, index and reciprocal rank fusion.
+# Run from the backend directory: python -m pytest app/test/test_lexical_index.py
+
+import pytest
+
+from app.services.e_lexical_index import BM25Index, RRF_K, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_lowercases_words():
+    assert tokenize("Total Amount DUE") == ["total", "amount", "due"]
+    assert tokenize("") == []
+    assert tokenize(None) == []
+
+
+def test_tokenize_keeps_identifiers_whole_compacted_and_split():
+    terms = tokenize("Invoice INV-2023-001")
+    assert "inv-2023-001" in terms
+    assert "inv2023001" in terms
+    assert {"inv", "2023", "001"} <= set(terms)
+
+
+def test_tokenize_matches_amounts_in_either_notation():
+    assert "123456" in set(tokenize("1.234,56")) & set(tokenize("1,234.56"))
+
+
+def test_tokenize_compacts_space_grouped_iban():
+    assert "de89370400440532013000" in tokenize("IBAN: DE89 3704 0044 0532 0130 00")
+
+
+def make_index():
+    index = BM25Index()
+    index.add("doc-1", "Invoice INV-2023-001 from Acme GmbH, total 1.234,56 EUR", {"invoice_id": "inv-a", "user_id": "user-1"})
+    index.add("doc-2", "Invoice INV-2023-002 from Globex, total 99,00 EUR", {"invoice_id": "inv-b", "user_id": "user-1"})
+    index.add("doc-3", "Delivery note for Acme GmbH", {"invoice_id": "inv-c", "user_id": "user-2"})
+    return index
+
+
+def test_search_ranks_exact_identifier_first():
+    hits = make_index().search("INV2023001", k=3)
+    assert [doc_id for doc_id, _, _ in hits] == ["doc-1"]
+
+
+def test_search_leaves_out_documents_without_query_terms():
+    hits = make_index().search("acme", k=10)
+    assert {doc_id for doc_id, _, _ in hits} == {"doc-1", "doc-3"}
+    assert all(score > 0 for _, score, _ in hits)
+
+
+def test_search_filters_by_invoice_and_owner():
+    index = make_index()
+    assert [doc_id for doc_id, _, _ in index.search("acme", invoice_ids=["inv-c"])] == ["doc-3"]
+    assert [doc_id for doc_id, _, _ in index.search("acme", user_ids=["user-1"])] == ["doc-1"]
+    assert index.search("acme", invoice_ids=["inv-c"], user_ids=["user-1"]) == []
+    assert index.search("acme", invoice_ids=["missing"]) == []
+
+
+def test_remove_and_replace_documents():
+    index = make_index()
+    index.remove_invoice("inv-a")
+    assert "doc-1" not in index
+    assert index.search("INV2023001") == []
+
+    index.add("doc-2", "Credit note", {"invoice_id": "inv-b", "user_id": "user-1"})
+    assert len(index) == 2
+    assert index.search("globex") == []
+    assert [doc_id for doc_id, _, _ in index.search("credit")] == ["doc-2"]
+
+
+def test_rrf_rewards_documents_ranked_by_both():
+    vector_hits = [("a", 0.9, {"n": "a"}), ("b", 0.8, {"n": "b"}), ("c", 0.7, {"n": "c"})]
+    lexical_hits = [("c", 12.0, {"n": "c"}), ("b", 3.0, {"n": "b"})]
+
+    fused = reciprocal_rank_fusion(vector_hits, lexical_hits)
+
+    assert [doc_id for doc_id, _, _ in fused] == ["c", "b", "a"]
+    assert fused[0][1] == pytest.approx(1 / (RRF_K + 3) + 1 / (RRF_K + 1))
+    assert fused[1][1] == pytest.approx(2 / (RRF_K + 2))
+    assert fused[2][1] == pytest.approx(1 / (RRF_K + 1))
+    assert fused[1][2] == {"n": "b"}
+
+
+def test_rrf_of_one_ranking_keeps_its_order():
+    hits = [("x", 5.0, {}), ("y", 4.0, {}), ("z", 3.0, {})]
+    assert [doc_id for doc_id, _, _ in reciprocal_rank_fusion(hits)] == ["x", "y", "z"]
+    assert reciprocal_rank_fusion() == []
@@ -0,0 +1,81 @@
+# Unit tests of passage packing: which chunks of a document go into the prompt within its token budget.
+# Run from the backend directory: python -m pytest app/test/test_passage_selector.py
+
+import re
+
+import numpy as np
+
+from app.services import e_passage_selector
+from app.services.e_passage_selector import PASSAGE_GAP_TOKENS, _join_passages, pack_passages
+from app.services.e_qa_system import MULTI_DOCUMENT_PASSAGE_TOKENS, SINGLE_DOCUMENT_PASSAGE_TOKENS
+from app.services.e_text_chunker import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS
+
+
+class WordEncoding:
+    """Stands in for tiktoken: one token per word, with its leading space like cl100k_base"""
+
+    def encode(self, text):
+        return re.findall(r"\s*\S+", text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def words(text):
+    return re.findall(r"w\d+", text)
+
+
+def make_chunks(count, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    """Chunks of a document of words w0 w1 ..., overlapping like chunk_text's"""
+    step = chunk_tokens - overlap
+    return [
+        {
+            "chunk_index": i,
+            "content": " ".join(f"w{n}" for n in range(i * step, i * step + chunk_tokens)),
+            "token_count": chunk_tokens,
+        }
+        for i in range(count)
+    ]
+
+
+def test_budgets_fit_several_chunks():
+    net = CHUNK_TOKENS - CHUNK_OVERLAP_TOKENS
+    assert MULTI_DOCUMENT_PASSAGE_TOKENS >= CHUNK_TOKENS + net
+    assert SINGLE_DOCUMENT_PASSAGE_TOKENS >= CHUNK_TOKENS + 2 * net
+
+
+def test_multi_chunk_document_gets_several_passages_within_budget(monkeypatch):
+    monkeypatch.setattr(e_passage_selector, "get_encoding", lambda: WordEncoding())
+    chunks = make_chunks(6)
+    scores = np.array([0.1, 0.2, 0.9, 0.8, 0.3, 0.7])
+
+    selected, used = pack_passages(chunks, scores, MULTI_DOCUMENT_PASSAGE_TOKENS)
+    assert [chunk["chunk_index"] for chunk in selected] == [2, 3]
+    assert used == 2 * CHUNK_TOKENS - CHUNK_OVERLAP_TOKENS
+    assert used <= MULTI_DOCUMENT_PASSAGE_TOKENS
+    # The overlap is counted once, as the joined text has it once
+    assert len(words(_join_passages(selected))) == used
+
+
+def test_single_document_budget_takes_separate_passages(monkeypatch):
+    monkeypatch.setattr(e_passage_selector, "get_encoding", lambda: WordEncoding())
+    chunks = make_chunks(8)
+    # Header on the first page, totals on the last
+    scores = np.array([0.9, 0.5, 0.4, 0.3, 0.2, 0.1, 0.05, 0.8])
+
+    selected, used = pack_passages(chunks, scores, SINGLE_DOCUMENT_PASSAGE_TOKENS)
+    assert [chunk["chunk_index"] for chunk in selected] == [0, 1, 7]
+    assert used == 3 * CHUNK_TOKENS - CHUNK_OVERLAP_TOKENS + PASSAGE_GAP_TOKENS
+    assert used <= SINGLE_DOCUMENT_PASSAGE_TOKENS
+    assert len(words(_join_passages(selected))) == 3 * CHUNK_TOKENS - CHUNK_OVERLAP_TOKENS
+
+
+def test_chunk_larger_than_the_budget_is_truncated(monkeypatch):
+    monkeypatch.setattr(e_passage_selector, "get_encoding", lambda: WordEncoding())
+    chunks = make_chunks(3)
+    scores = np.array([0.2, 0.9, 0.1])
+
+    selected, used = pack_passages(chunks, scores, 100)
+    assert [chunk["chunk_index"] for chunk in selected] == [1]
+    assert used == 100
+    assert words(selected[0]["content"]) == words(chunks[1]["content"])[:100]
@@ -0,0 +1,150 @@
+# Unit tests of token-budget prompt packing.
+# Run from the backend directory: python -m pytest app/test/test_prompt_packer.py
+
+import random
+
+import pytest
+
+from app.services import e_text_chunker
+from app.services.e_openai_completions import COMPLETION_MAX_TOKENS, MODEL_CONTEXT_TOKENS
+from app.services.e_prompt_packer import (
+    TRUNCATION_MARKER,
+    PromptPacker,
+    count_tokens,
+    prompt_token_budget,
+    truncate_to_tokens,
+)
+
+WORDS = [
+    "Rechnung", "Betrag", "Müller", "Straße", "Größe", "€1.234,56", "IBAN", "DE89",
+    "invoice", "total", "VAT", "19%", "Σύνολο", "請求書", "合計", "🧾", "✓", "naïve", "café",
+]
+
+
+class ByteEncoding:
+    """
+    Stands in for cl100k_base, which tiktoken may have to download: one token per UTF-8
+    byte. Like tiktoken it decodes a split multi-byte character to U+FFFD, which encodes
+    to more tokens than were cut.
+    """
+
+    def encode(self, text):
+        return list(text.encode("utf-8"))
+
+    def decode(self, tokens):
+        return bytes(tokens).decode("utf-8", errors="replace")
+
+
+@pytest.fixture(autouse=True)
+def encoding(monkeypatch):
+    monkeypatch.setattr(e_text_chunker, "_encoding", ByteEncoding())
+
+
+def random_text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + "\n"
+
+
+def included_tokens(packed):
+    return sum(count_tokens(text) for text in packed["included"].values())
+
+
+def test_everything_fits():
+    packer = PromptPacker(budget=1000)
+    packer.add("instructions", "Answer the question.\n", required=True)
+    packer.add("documents", "Invoice 42, total 100 EUR.\n", priority=1)
+    packer.add("history", "User: hi\n", priority=2)
+
+    packed = packer.pack()
+    assert list(packed["included"]) == ["instructions", "documents", "history"]
+    assert packed["dropped"] == []
+    assert packed["truncated"] == []
+
+
+def test_optional_parts_go_in_by_priority():
+    packer = PromptPacker(budget=0)
+    packer.add("question", "What is the total?\n", required=True)
+    packer.add("low", "x " * 40 + "\n", priority=2)
+    packer.add("high", "y " * 40 + "\n", priority=1)
+    packer.add("small", "z\n", priority=3)
+    packer.budget = packer.required_tokens() + count_tokens("y " * 40 + "\n") + count_tokens("z\n")
+
+    packed = packer.pack()
+    assert set(packed["included"]) == {"question", "high", "small"}
+    assert packed["dropped"] == ["low"]
+    assert included_tokens(packed) <= packer.budget
+
+
+def test_part_with_min_tokens_is_cut_to_the_remaining_space():
+    packer = PromptPacker(budget=0)
+    packer.add("question", "What is the total?\n", required=True)
+    packer.add("documents", "Line item 1: 10 EUR\n" * 100, priority=1, min_tokens=20)
+    packer.budget = packer.required_tokens() + 50
+
+    packed = packer.pack()
+    assert packed["truncated"] == ["documents"]
+    assert packed["included"]["documents"].endswith(TRUNCATION_MARKER)
+    assert included_tokens(packed) <= packer.budget
+
+
+def test_part_is_dropped_when_less_than_min_tokens_remain():
+    packer = PromptPacker(budget=0)
+    packer.add("question", "What is the total?\n", required=True)
+    packer.add("documents", "Line item 1: 10 EUR\n" * 100, priority=1, min_tokens=60)
+    packer.budget = packer.required_tokens() + 50
+
+    packed = packer.pack()
+    assert packed["dropped"] == ["documents"]
+    assert "documents" not in packed["included"]
+
+
+def test_render_keeps_the_order_parts_were_added_in():
+    packer = PromptPacker(budget=1000)
+    packer.add("documents", "DOCS\n", priority=2)
+    packer.add("question", "QUESTION\n", required=True)
+    packer.add("history", "HISTORY\n", priority=1)
+
+    prompt, usage = packer.render(packer.pack())
+    assert prompt == "DOCS\nQUESTION\nHISTORY\n"
+    assert usage["prompt_tokens"] <= usage["budget"]
+    assert list(usage["parts"]) == ["documents", "question", "history"]
+
+
+def test_packer_never_exceeds_its_budget():
+    rng = random.Random(0)
+    for _ in range(300):
+        packer = PromptPacker(budget=rng.randint(20, 400))
+        packer.add("question", random_text(rng, rng.randint(1, 5)), required=True)
+        for i in range(rng.randint(0, 6)):
+            packer.add(
+                f"part-{i}",
+                random_text(rng, rng.randint(1, 150)),
+                priority=rng.randint(0, 3),
+                min_tokens=rng.choice([None, 1, 5, 20]),
+            )
+        if packer.required_tokens() > packer.budget:
+            continue
+
+        packed = packer.pack()
+        assert included_tokens(packed) <= packer.budget
+
+        _, usage = packer.render(packed)
+        assert sum(usage["parts"].values()) <= packer.budget
+        assert usage["prompt_tokens"] <= packer.budget
+
+
+@pytest.mark.parametrize("max_tokens", range(0, 40))
+def test_truncate_to_tokens_stays_within_the_limit(max_tokens):
+    text = "Rechnung für Müller & Söhne: 1.234,56 € 🧾 請求書 合計 " * 5
+    truncated = truncate_to_tokens(text, max_tokens)
+    assert count_tokens(truncated) <= max_tokens
+    if count_tokens(TRUNCATION_MARKER) < max_tokens:
+        assert truncated.endswith(TRUNCATION_MARKER)
+
+
+def test_truncate_to_tokens_keeps_short_text():
+    assert truncate_to_tokens("short text", 100) == "short text"
+
+
+def test_budget_is_capped_by_the_model_window():
+    assert prompt_token_budget(budget=100) == 100
+    assert prompt_token_budget(budget=10 ** 6) < MODEL_CONTEXT_TOKENS - COMPLETION_MAX_TOKENS
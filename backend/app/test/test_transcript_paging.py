@@ -0,0 +1,159 @@
+# Unit tests of chat transcript paging: the keyset cursor over zokuai_chat_history and
+# zokuai_chat_messages and their merge. The tables are served by an in-memory fake.
+# Run from the backend directory: python -m pytest app/test/test_transcript_paging.py
+
+import re
+
+import pytest
+
+from app.services import e_chat_manager
+from app.services.e_chat_manager import _transcript_page
+
+OR_FILTER = re.compile(r'^(\w+)\.lt\."([^"]*)",and\(\1\.eq\."([^"]*)",id\.lte\."([^"]*)"\)$')
+
+
+class FakeQuery:
+    """The few PostgREST builder calls the transcript queries use"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.orders = []
+        self.row_limit = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row[column] < value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row[column] <= value)
+        return self
+
+    def or_(self, expression):
+        column, before, at, row_id = OR_FILTER.match(expression).groups()
+        self.filters.append(lambda row: row[column] < before or (row[column] == at and row["id"] <= row_id))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if all(matches(row) for matches in self.filters)]
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda row: row[column], reverse=desc)
+        return type("Result", (), {"data": [dict(row) for row in rows[:self.row_limit]]})()
+
+
+class FakeSupabase:
+    def __init__(self, tables):
+        self.tables = tables
+        self.queries = []
+
+    def table(self, name):
+        query = FakeQuery(self.tables[name])
+        self.queries.append(query)
+        return query
+
+
+def transcript_tables():
+    """Two sessions; equal timestamps within and across both tables"""
+    history = []
+    messages = []
+    for i in range(12):
+        timestamp = f"2024-05-01T10:{i // 2:02d}:00"
+        history.append({
+            "id": f"h{i:02d}", "session_id": "s1", "timestamp": timestamp,
+            "query": f"question {i}", "response": f"answer {i}",
+        })
+        messages.append({
+            "id": f"m{i:02d}", "session_id": "s1", "created_at": timestamp,
+            "role": "user" if i % 2 else "assistant", "content": f"message {i}",
+        })
+    history.append({"id": "h99", "session_id": "s2", "timestamp": "2024-05-01T10:03:00", "query": "q", "response": "a"})
+    messages.append({"id": "m99", "session_id": "s2", "created_at": "2024-05-01T10:03:00", "role": "user", "content": "c"})
+    return {"zokuai_chat_history": history, "zokuai_chat_messages": messages}
+
+
+@pytest.fixture
+def fake_supabase(monkeypatch):
+    fake = FakeSupabase(transcript_tables())
+    monkeypatch.setattr(e_chat_manager, "supabase", fake)
+    return fake
+
+
+def expected_transcript():
+    """Every message of session s1, oldest first"""
+    tables = transcript_tables()
+    keyed = []
+    for row in tables["zokuai_chat_history"]:
+        if row["session_id"] == "s1":
+            keyed.append(((row["timestamp"], 0, row["id"], 0), row["id"]))
+            keyed.append(((row["timestamp"], 0, row["id"], 1), f"{row['id']}_response"))
+    for row in tables["zokuai_chat_messages"]:
+        if row["session_id"] == "s1":
+            keyed.append(((row["created_at"], 1, row["id"], 0), row["id"]))
+    return [message_id for _, message_id in sorted(keyed)]
+
+
+def read_all_pages(limit):
+    pages = []
+    cursor = None
+    while True:
+        page = _transcript_page("s1", cursor=cursor, limit=limit)
+        pages.append(page)
+        if not page["has_more"]:
+            assert page["next_cursor"] is None
+            break
+        cursor = page["next_cursor"]
+    return pages
+
+
+@pytest.mark.parametrize("limit", [1, 2, 50])
+def test_pages_cover_the_transcript_without_duplicates(fake_supabase, limit):
+    pages = read_all_pages(limit)
+
+    ids = [message["id"] for page in reversed(pages) for message in page["messages"]]
+    assert len(ids) == len(set(ids))
+    assert ids == expected_transcript()
+    assert all(len(page["messages"]) == limit for page in pages[:-1])
+    assert 0 < len(pages[-1]["messages"]) <= limit
+
+
+def test_page_messages_are_oldest_first_and_carry_no_sort_key(fake_supabase):
+    page = _transcript_page("s1", limit=5)
+
+    assert [message["id"] for message in page["messages"]] == expected_transcript()[-5:]
+    assert all("_key" not in message for message in page["messages"])
+    assert page["messages"][-1]["source"] == "messages"
+
+
+def test_a_page_reads_at_most_limit_plus_one_rows_per_table(fake_supabase):
+    _transcript_page("s1", limit=3)
+
+    assert [query.row_limit for query in fake_supabase.queries] == [4, 4]
+
+
+def test_short_transcript_fits_one_page(fake_supabase):
+    page = _transcript_page("s2", limit=50)
+
+    assert [message["id"] for message in page["messages"]] == ["h99", "h99_response", "m99"]
+    assert not page["has_more"]
+    assert page["next_cursor"] is None
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "WzEsIDJd"])
+def test_invalid_cursor_is_rejected(fake_supabase, cursor):
+    with pytest.raises(ValueError):
+        _transcript_page("s1", cursor=cursor)
@@ -0,0 +1,88 @@
+# Unit tests of single-pass upload spooling: hashing, size limit and content type checks.
+# Run from the backend directory: python -m pytest app/test/test_upload_spooling.py
+
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+
+from app.services import file_management
+from app.services.file_management import UploadRejectedError, sniff_mime_type, spool_upload_file
+
+PDF = b"%PDF-1.7\n" + b"0" * 5000
+PNG = b"\x89PNG\r\n\x1a\n" + b"0" * 100
+
+
+def spool(content, dest, **kwargs):
+    upload = UploadFile(file=io.BytesIO(content), filename="invoice")
+    return asyncio.run(spool_upload_file(upload, str(dest), **kwargs))
+
+
+def test_spooled_file_is_hashed_and_sized(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_management, "CHUNK_SIZE", 1024)  # Several chunks
+    dest = tmp_path / "upload.pdf"
+
+    info = spool(PDF, dest, expected_mime_type="application/pdf")
+    assert info == {
+        "path": str(dest),
+        "size": len(PDF),
+        "sha256": hashlib.sha256(PDF).hexdigest(),
+        "mime_type": "application/pdf",
+    }
+    assert dest.read_bytes() == PDF
+
+
+def test_too_large_upload_is_rejected_with_413(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_management, "CHUNK_SIZE", 1024)
+    dest = tmp_path / "upload.pdf"
+
+    with pytest.raises(UploadRejectedError) as rejected:
+        spool(PDF, dest, max_bytes=len(PDF) - 1)
+    assert rejected.value.status_code == 413
+    assert not os.path.exists(dest)  # The partial file is removed
+
+    assert spool(PDF, dest, max_bytes=len(PDF))["size"] == len(PDF)
+
+
+def test_content_not_matching_the_extension_is_rejected_with_415(tmp_path):
+    dest = tmp_path / "upload.pdf"
+
+    with pytest.raises(UploadRejectedError) as rejected:
+        spool(PNG, dest, expected_mime_type="application/pdf")
+    assert rejected.value.status_code == 415
+    assert "got image/png" in str(rejected.value)
+    assert not os.path.exists(dest)
+
+    with pytest.raises(UploadRejectedError) as rejected:
+        spool(b"plain text", dest, expected_mime_type="image/jpeg")
+    assert rejected.value.status_code == 415
+    assert "got unknown" in str(rejected.value)
+
+
+def test_empty_upload_is_rejected_with_400(tmp_path):
+    dest = tmp_path / "upload.png"
+
+    with pytest.raises(UploadRejectedError) as rejected:
+        spool(b"", dest, expected_mime_type="image/png")
+    assert rejected.value.status_code == 400
+    assert not os.path.exists(dest)
+
+
+def test_type_is_only_checked_when_expected(tmp_path):
+    info = spool(b"plain text", tmp_path / "upload")
+    assert info["mime_type"] is None
+    assert info["size"] == len(b"plain text")
+
+
+@pytest.mark.parametrize("head, mime_type", [
+    (PDF, "application/pdf"),
+    (b"junk before the header %PDF-1.4", "application/pdf"),
+    (b"\xff\xd8\xff\xe0" + b"0" * 10, "image/jpeg"),
+    (PNG, "image/png"),
+    (b"GIF89a", None),
+])
+def test_sniff_mime_type(head, mime_type):
+    assert sniff_mime_type(head) == mime_type
@@ -0,0 +1,135 @@
+# zoku/backend/app/workers/ingestion_worker.py
+#
+# Standalone ingestion worker. Run one or more from the backend directory:
+#   python -m app.workers.ingestion_worker --concurrency 2
+# Workers must share the local disk and INGESTION_QUEUE_PATH with the API.
+
+import os
+import sys
+import uuid
+import socket
+import asyncio
+import logging
+import argparse
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.services.e_job_queue import get_job_queue, DEFAULT_VISIBILITY_TIMEOUT, WORKER_STATS_INTERVAL_SECONDS
+from app.services.e_ingestion_jobs import JOB_HANDLERS, JOB_COMPLETED_HOOKS, handle_job_failed
+from app.services.e_ocr_executor import ocr_executor
+from app.services.e_openai_client import embedding_batcher
+from app.services.e_llm_gateway import close_llm_client
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = float(os.getenv("INGESTION_POLL_INTERVAL", "1.0"))  # seconds
+
+
+async def _keep_lease(queue, job_id, worker_id, visibility_timeout):
+    """Extend the job lease while the handler is still running"""
+    while True:
+        await asyncio.sleep(visibility_timeout / 3)
+        extended = await asyncio.to_thread(queue.extend_lease, job_id, worker_id, visibility_timeout)
+        if not extended:
+            logger.warning(f"Lost lease on job {job_id}")
+            return
+
+
+async def run_job(queue, job, worker_id, visibility_timeout):
+    """Run one job and record the outcome in the queue"""
+    handler = JOB_HANDLERS.get(job["kind"])
+    logger.info(f"[{worker_id}] Running {job['kind']} job {job['id']} (attempt {job['attempts']}/{job['max_attempts']})")
+
+    lease_task = asyncio.create_task(_keep_lease(queue, job["id"], worker_id, visibility_timeout))
+    try:
+        if handler is None:
+            raise ValueError(f"No handler for job kind '{job['kind']}'")
+        await handler(job["payload"], job["id"])
+    except Exception as e:
+        logger.exception(f"[{worker_id}] Job {job['id']} failed: {str(e)}")
+        retry = await asyncio.to_thread(queue.fail, job["id"], worker_id, str(e))
+        if not retry:
+            job["last_error"] = str(e)
+            await handle_job_failed(job)
+        return
+    finally:
+        lease_task.cancel()
+
+    completed = await asyncio.to_thread(queue.complete, job["id"], worker_id)
+    if not completed:
+        logger.warning(f"[{worker_id}] Lost lease on {job['kind']} job {job['id']} before completing it")
+        return
+    logger.info(f"[{worker_id}] Completed {job['kind']} job {job['id']}")
+
+    hook = JOB_COMPLETED_HOOKS.get(job["kind"])
+    if hook:
+        hook(job["payload"])
+
+
+async def publish_stats(queue, worker_id, interval=WORKER_STATS_INTERVAL_SECONDS):
+    """Publish this process's OCR metrics to the queue database, where the API reads them"""
+    while True:
+        try:
+            await asyncio.to_thread(queue.publish_worker_stats, worker_id, {"ocr": ocr_executor.get_stats()})
+        except Exception as e:
+            logger.error(f"[{worker_id}] Publishing worker stats failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+async def worker_loop(queue, worker_id, visibility_timeout):
+    """Claim and run jobs until cancelled"""
+    while True:
+        try:
+            for dead_job in await asyncio.to_thread(queue.reap_expired):
+                await handle_job_failed(dead_job)
+
+            job = await asyncio.to_thread(queue.claim, worker_id, list(JOB_HANDLERS), visibility_timeout)
+        except Exception as e:
+            logger.error(f"[{worker_id}] Queue error: {str(e)}")
+            job = None
+
+        if job is None:
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+
+        await run_job(queue, job, worker_id, visibility_timeout)
+
+
+async def main(concurrency, visibility_timeout):
+    queue = get_job_queue()
+    base_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    logger.info(f"Starting ingestion worker {base_id} with concurrency {concurrency}, queue {queue.path}")
+
+    loops = [worker_loop(queue, f"{base_id}-{i}", visibility_timeout) for i in range(concurrency)]
+    stats_task = asyncio.create_task(publish_stats(queue, base_id))
+    try:
+        await asyncio.gather(*loops)
+    finally:
+        stats_task.cancel()
+        try:
+            await asyncio.to_thread(queue.remove_worker_stats, base_id)
+        except Exception as e:
+            logger.error(f"Removing worker stats failed: {str(e)}")
+        await embedding_batcher.close()
+        ocr_executor.shutdown()
+        await close_llm_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zoku ingestion worker")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("INGESTION_WORKER_CONCURRENCY", "2")),
+                        help="Jobs processed at the same time by this worker")
+    parser.add_argument("--visibility-timeout", type=float, default=DEFAULT_VISIBILITY_TIMEOUT,
+                        help="Seconds a claimed job stays hidden from other workers without a heartbeat")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args.concurrency, args.visibility_timeout))
+    except KeyboardInterrupt:
+        logger.info("Ingestion worker stopped")
@@ -0,0 +1,5 @@
+-- Content hash of the uploaded file, used to detect re-uploads of the same invoice
+ALTER TABLE zokuai_invoices ADD COLUMN IF NOT EXISTS content_hash text;
+
+CREATE INDEX IF NOT EXISTS idx_zokuai_invoices_user_content_hash
+    ON zokuai_invoices (user_id, content_hash);
@@ -0,0 +1,18 @@
+-- Passage-level chunks of zokuai_documents, each with its own embedding
+CREATE TABLE IF NOT EXISTS zokuai_document_chunks (
+    id uuid PRIMARY KEY,
+    document_id text NOT NULL,
+    invoice_id text,
+    user_id text,
+    chunk_index integer NOT NULL,
+    content text NOT NULL,
+    token_count integer NOT NULL,
+    embedding vector(1536),
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_zokuai_document_chunks_document_id
+    ON zokuai_document_chunks (document_id);
+
+CREATE INDEX IF NOT EXISTS idx_zokuai_document_chunks_invoice_id
+    ON zokuai_document_chunks (invoice_id);
@@ -0,0 +1,15 @@
+-- invoice_id and user_id as real columns of zokuai_documents (they used to live only
+-- inside the metadata JSON string), so retrieval can filter in the query
+ALTER TABLE zokuai_documents ADD COLUMN IF NOT EXISTS invoice_id text;
+ALTER TABLE zokuai_documents ADD COLUMN IF NOT EXISTS user_id text;
+
+UPDATE zokuai_documents
+SET invoice_id = (metadata::jsonb) ->> 'invoice_id',
+    user_id = (metadata::jsonb) ->> 'user_id'
+WHERE invoice_id IS NULL OR user_id IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_zokuai_documents_invoice_id
+    ON zokuai_documents (invoice_id);
+
+CREATE INDEX IF NOT EXISTS idx_zokuai_documents_user_id
+    ON zokuai_documents (user_id);
@@ -0,0 +1,43 @@
+-- Session message counts are maintained incrementally: the chat writer adds the
+-- number of messages it wrote per session in one call per batch
+CREATE OR REPLACE FUNCTION increment_session_message_counts(deltas jsonb)
+RETURNS integer
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE zokuai_chat_sessions s
+        SET message_count = COALESCE(s.message_count, 0) + (d.value ->> 'delta')::integer,
+            updated_at = now()
+        FROM jsonb_array_elements(deltas) d
+        WHERE s.id::text = d.value ->> 'session_id'
+        RETURNING s.id
+    )
+    SELECT count(*)::integer FROM updated;
+$$;
+
+-- Repairs counts that drifted (failed increments, rows written or deleted elsewhere).
+-- Only sessions updated since `since` are checked; NULL checks every session.
+CREATE OR REPLACE FUNCTION reconcile_session_message_counts(since timestamptz DEFAULT NULL)
+RETURNS integer
+LANGUAGE sql
+AS $$
+    WITH actual AS (
+        SELECT s.id, count(h.id)::integer AS message_count
+        FROM zokuai_chat_sessions s
+        LEFT JOIN zokuai_chat_history h ON h.session_id::text = s.id::text
+        WHERE since IS NULL OR s.updated_at >= since
+        GROUP BY s.id
+    ),
+    repaired AS (
+        UPDATE zokuai_chat_sessions s
+        SET message_count = actual.message_count
+        FROM actual
+        WHERE s.id = actual.id
+          AND s.message_count IS DISTINCT FROM actual.message_count
+        RETURNING s.id
+    )
+    SELECT count(*)::integer FROM repaired;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_zokuai_chat_history_session_id
+    ON zokuai_chat_history (session_id);
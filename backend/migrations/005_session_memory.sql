@@ -0,0 +1,5 @@
+-- Rolling conversation memory of a chat session: a summary of the older turns
+-- plus the most recent turns verbatim, fed into the QA prompt
+ALTER TABLE zokuai_chat_sessions ADD COLUMN IF NOT EXISTS memory_summary text;
+ALTER TABLE zokuai_chat_sessions ADD COLUMN IF NOT EXISTS memory_turns jsonb NOT NULL DEFAULT '[]'::jsonb;
+ALTER TABLE zokuai_chat_sessions ADD COLUMN IF NOT EXISTS memory_updated_at timestamptz;
@@ -0,0 +1,30 @@
+-- Sessions whose count increments are still pending in the chat writer are skipped:
+-- their messages are already in zokuai_chat_history, so recounting them now and
+-- then applying the pending increment would count those messages twice.
+DROP FUNCTION IF EXISTS reconcile_session_message_counts(timestamptz);
+
+CREATE OR REPLACE FUNCTION reconcile_session_message_counts(
+    since timestamptz DEFAULT NULL,
+    skip_session_ids text[] DEFAULT '{}'
+)
+RETURNS integer
+LANGUAGE sql
+AS $$
+    WITH actual AS (
+        SELECT s.id, count(h.id)::integer AS message_count
+        FROM zokuai_chat_sessions s
+        LEFT JOIN zokuai_chat_history h ON h.session_id::text = s.id::text
+        WHERE (since IS NULL OR s.updated_at >= since)
+          AND NOT (s.id::text = ANY(skip_session_ids))
+        GROUP BY s.id
+    ),
+    repaired AS (
+        UPDATE zokuai_chat_sessions s
+        SET message_count = actual.message_count
+        FROM actual
+        WHERE s.id = actual.id
+          AND s.message_count IS DISTINCT FROM actual.message_count
+        RETURNING s.id
+    )
+    SELECT count(*)::integer FROM repaired;
+$$;
@@ -0,0 +1,7 @@
+-- Marks the chat answers the semantic answer cache may reuse: answers grounded in
+-- the selected documents alone (no session memory, documents found). Older rows
+-- stay out of the cache.
+ALTER TABLE zokuai_chat_history ADD COLUMN IF NOT EXISTS cacheable boolean NOT NULL DEFAULT false;
+
+CREATE INDEX IF NOT EXISTS idx_zokuai_chat_history_user_cacheable
+    ON zokuai_chat_history (user_id, timestamp DESC) WHERE cacheable;
@@ -0,0 +1,63 @@
+-- Count increments are scoped to the session owner, like every other session update.
+CREATE OR REPLACE FUNCTION increment_session_message_counts(deltas jsonb)
+RETURNS integer
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE zokuai_chat_sessions s
+        SET message_count = COALESCE(s.message_count, 0) + (d.value ->> 'delta')::integer,
+            updated_at = now()
+        FROM jsonb_array_elements(deltas) d
+        WHERE s.id::text = d.value ->> 'session_id'
+          AND s.user_id::text = d.value ->> 'user_id'
+        RETURNING s.id
+    )
+    SELECT count(*)::integer FROM updated;
+$$;
+
+-- When a history row was inserted, by the database clock (the timestamp column is
+-- set by the API process when the answer is given).
+ALTER TABLE zokuai_chat_history ADD COLUMN IF NOT EXISTS created_at timestamptz NOT NULL DEFAULT now();
+
+-- Every API process buffers count increments for a moment after inserting the rows,
+-- so a session with rows or increments in the last `idle_seconds` may still have an
+-- increment pending in some process; recounting it now would count those rows twice.
+-- Only sessions idle for longer are reconciled.
+DROP FUNCTION IF EXISTS reconcile_session_message_counts(timestamptz, text[]);
+
+CREATE OR REPLACE FUNCTION reconcile_session_message_counts(
+    since timestamptz DEFAULT NULL,
+    skip_session_ids text[] DEFAULT '{}',
+    idle_seconds double precision DEFAULT 0
+)
+RETURNS integer
+LANGUAGE sql
+AS $$
+    WITH candidates AS (
+        SELECT s.id
+        FROM zokuai_chat_sessions s
+        WHERE (since IS NULL OR s.updated_at >= since)
+          AND NOT (s.id::text = ANY(skip_session_ids))
+          AND s.updated_at < now() - make_interval(secs => idle_seconds)
+          AND NOT EXISTS (
+              SELECT 1 FROM zokuai_chat_history h
+              WHERE h.session_id::text = s.id::text
+                AND h.created_at >= now() - make_interval(secs => idle_seconds)
+          )
+    ),
+    actual AS (
+        SELECT c.id, count(h.id)::integer AS message_count
+        FROM candidates c
+        LEFT JOIN zokuai_chat_history h ON h.session_id::text = c.id::text
+        GROUP BY c.id
+    ),
+    repaired AS (
+        UPDATE zokuai_chat_sessions s
+        SET message_count = actual.message_count
+        FROM actual
+        WHERE s.id = actual.id
+          AND s.message_count IS DISTINCT FROM actual.message_count
+        RETURNING s.id
+    )
+    SELECT count(*)::integer FROM repaired;
+$$;
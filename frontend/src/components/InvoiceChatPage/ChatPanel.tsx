@@ -2,7 +2,7 @@
 
 import React, { useEffect, useRef, useState } from 'react';
 import { useGlobalChatState } from '../../hooks/useGlobalChatState';
-import { ChatSession, qaApi } from '../../services/api';
+import { ChatSession, ChatSessionMessage, chatSessionsApi, qaApi } from '../../services/api';
 import ChatHistoryModal from './ChatHistoryModal';
 import styles from './ChatPanel.module.css';
 import ConfirmationModal from './ConfirmationModal'; // NEW: Import custom modal
@@ -26,13 +26,16 @@ const ChatPanel: React.FC<ChatPanelProps> = ({
         resetPageState,
         setSelectedDocuments,
         createNewSession,
-        loadSession
+        loadSession,
+        olderMessagesCursor,
+        prependMessages
     } = useGlobalChatState();
 
     const [input, setInput] = useState('');
     const [isLoading, setIsLoading] = useState(false);
     const [isClient, setIsClient] = useState(false);
     const [isHistoryModalOpen, setIsHistoryModalOpen] = useState(false);
+    const [isLoadingOlder, setIsLoadingOlder] = useState(false);
 
     // NEW: Confirmation modal states
     const [confirmationModal, setConfirmationModal] = useState<{
@@ -62,10 +65,17 @@ const ChatPanel: React.FC<ChatPanelProps> = ({
 
     // Auto-scroll to bottom when new messages are added
     const chatAreaRef = useRef<HTMLDivElement>(null);
+    // Scroll height before older messages were prepended (keeps the view in place)
+    const heightBeforePrependRef = useRef<number | null>(null);
 
     useEffect(() => {
         if (chatAreaRef.current) {
-            chatAreaRef.current.scrollTop = chatAreaRef.current.scrollHeight;
+            if (heightBeforePrependRef.current !== null) {
+                chatAreaRef.current.scrollTop = chatAreaRef.current.scrollHeight - heightBeforePrependRef.current;
+                heightBeforePrependRef.current = null;
+            } else {
+                chatAreaRef.current.scrollTop = chatAreaRef.current.scrollHeight;
+            }
         }
     }, [messages]);
 
@@ -127,37 +137,40 @@ const ChatPanel: React.FC<ChatPanelProps> = ({
         setIsHistoryModalOpen(true);
     };
 
+    // Convert session messages to our format
+    const formatSessionMessages = (sessionMessages: any[] = []) =>
+        sessionMessages.map((msg: any) => ({
+            id: Date.now() + Math.random(),
+            type: msg.type === 'user' ? 'user' as const : 'system' as const,
+            text: msg.text || msg.content || 'Message content not available',
+            timestamp: msg.timestamp || Date.now()
+        }));
+
     // Load session from history
-    const handleLoadSession = (session: ChatSession & { messages?: any[] }) => {
+    const handleLoadSession = (session: ChatSession & {
+        messages?: ChatSessionMessage[];
+        next_cursor?: string | null;
+        has_more_messages?: boolean;
+    }) => {
         try {
             console.log('📖 Loading session:', session);
 
-            // Convert messages to our format
-            const formattedMessages = [];
-
-            if (session.messages && session.messages.length > 0) {
-                session.messages.forEach((msg: any) => {
-                    formattedMessages.push({
-                        id: Date.now() + Math.random(),
-                        type: msg.type === 'user' ? 'user' : 'system',
-                        text: msg.text || msg.content || 'Message content not available',
-                        timestamp: msg.timestamp || Date.now()
-                    });
-                });
-            }
+            // The latest page of messages; older ones are loaded on demand
+            const formattedMessages = formatSessionMessages(session.messages);
 
             // Load the session using global state
             loadSession(
                 session.id,
                 formattedMessages,
-                session.selected_documents || []
+                session.selected_documents || [],
+                session.has_more_messages ? session.next_cursor || null : null
             );
 
             // Add confirmation message
             setTimeout(() => {
                 addMessage({
                     type: 'system',
-                    text: `✅ Loaded session: "${session.title}" with ${formattedMessages.length} messages and ${session.selected_documents?.length || 0} documents.`
+                    text: `✅ Loaded session: "${session.title}" with ${formattedMessages.length}${session.has_more_messages ? ' recent' : ''} messages and ${session.selected_documents?.length || 0} documents.`
                 });
             }, 100);
 
@@ -172,6 +185,32 @@ const ChatPanel: React.FC<ChatPanelProps> = ({
         }
     };
 
+    // Load the previous page of the current session's messages
+    const handleLoadOlderMessages = async () => {
+        if (!currentSessionId || !olderMessagesCursor || isLoadingOlder) return;
+
+        setIsLoadingOlder(true);
+        try {
+            const page = await chatSessionsApi.getSessionMessages(currentSessionId, olderMessagesCursor);
+
+            if (page.status === 'success') {
+                heightBeforePrependRef.current = chatAreaRef.current?.scrollHeight ?? null;
+                prependMessages(
+                    formatSessionMessages(page.messages),
+                    page.has_more ? page.next_cursor || null : null
+                );
+            }
+        } catch (error) {
+            console.error('❌ Error loading older messages:', error);
+            addMessage({
+                type: 'error',
+                text: 'Failed to load older messages. Please try again.'
+            });
+        } finally {
+            setIsLoadingOlder(false);
+        }
+    };
+
     // Mouse events for resizing (only when visualization panel is open)
     const handleMouseDown = (e: React.MouseEvent) => {
         if (!isVisualizationPanelOpen) return;
@@ -392,6 +431,16 @@ const ChatPanel: React.FC<ChatPanelProps> = ({
 
                 {/* Chat messages area */}
                 <div className={styles.chatArea} ref={chatAreaRef}>
+                    {currentSessionId && olderMessagesCursor && (
+                        <button
+                            className={styles.loadOlderButton}
+                            onClick={handleLoadOlderMessages}
+                            disabled={isLoadingOlder}
+                        >
+                            {isLoadingOlder ? 'Loading...' : 'Load older messages'}
+                        </button>
+                    )}
+
                     {messages.map((message) => (
                         <div
                             key={message.id}
@@ -18,6 +18,7 @@ interface GlobalChatState {
     isVisualizationPanelOpen: boolean;
     isHydrated: boolean;
     currentSessionId: string | null; // NEW: Track current session
+    olderMessagesCursor: string | null; // Cursor for the session's older messages (null when all are loaded)
 
     // Actions
     addMessage: (message: Omit<Message, 'id'>) => void;
@@ -30,7 +31,8 @@ interface GlobalChatState {
 
     // Session management
     createNewSession: (firstMessage?: string) => Promise<string | null>; // NEW
-    loadSession: (sessionId: string, messages: Message[], documents: string[]) => void; // NEW
+    loadSession: (sessionId: string, messages: Message[], documents: string[], olderMessagesCursor?: string | null) => void; // NEW
+    prependMessages: (messages: Message[], olderMessagesCursor: string | null) => void;
 
     // Reset specific page state
     resetPageState: () => void;
@@ -52,6 +54,7 @@ export const useGlobalChatState = create<GlobalChatState>()(
             isVisualizationPanelOpen: false,
             isHydrated: false,
             currentSessionId: null, // NEW
+            olderMessagesCursor: null,
 
             // Actions
             addMessage: (message) => {
@@ -68,7 +71,8 @@ export const useGlobalChatState = create<GlobalChatState>()(
             clearMessages: () => {
                 set({
                     messages: [initialMessage],
-                    currentSessionId: null // Clear current session when clearing messages
+                    currentSessionId: null, // Clear current session when clearing messages
+                    olderMessagesCursor: null
                 });
             },
 
@@ -125,22 +129,32 @@ export const useGlobalChatState = create<GlobalChatState>()(
             },
 
             // NEW: Load a session
-            loadSession: (sessionId, messages, documents) => {
+            loadSession: (sessionId, messages, documents, olderMessagesCursor = null) => {
                 console.log('📖 Loading session:', sessionId);
                 set({
                     currentSessionId: sessionId,
                     messages: messages.length ? messages : [initialMessage],
-                    selectedDocuments: documents || []
+                    selectedDocuments: documents || [],
+                    olderMessagesCursor
                 });
             },
 
+            // Add a page of older messages above the loaded ones
+            prependMessages: (messages, olderMessagesCursor) => {
+                set((state) => ({
+                    messages: [...messages, ...state.messages],
+                    olderMessagesCursor
+                }));
+            },
+
             resetPageState: () => {
                 set({
                     messages: [initialMessage],
                     selectedDocuments: [],
                     expandedDocumentId: null,
                     isVisualizationPanelOpen: false,
-                    currentSessionId: null // Reset session
+                    currentSessionId: null, // Reset session
+                    olderMessagesCursor: null
                 });
             }
         }),
@@ -150,6 +164,7 @@ export const useGlobalChatState = create<GlobalChatState>()(
                 messages: state.messages,
                 selectedDocuments: state.selectedDocuments,
                 currentSessionId: state.currentSessionId, // Persist current session
+                olderMessagesCursor: state.olderMessagesCursor,
             }),
             version: 1,
             skipHydration: true,
@@ -56,20 +56,32 @@ export interface ChatSessionsListResponse {
   message?: string;
 }
 
+export interface ChatSessionMessage {
+  id: string;
+  type: 'user' | 'system' | 'error';
+  text: string;
+  timestamp: string;
+  source: 'history' | 'messages';
+}
+
 export interface ChatSessionWithMessages {
   status: string;
   session?: ChatSession & {
-    messages: Array<{
-      id: string;
-      type: 'user' | 'system' | 'error';
-      text: string;
-      timestamp: string;
-      source: 'history' | 'messages';
-    }>;
+    messages: ChatSessionMessage[];
+    next_cursor?: string | null;
+    has_more_messages?: boolean;
   };
   message?: string;
 }
 
+export interface ChatMessagesPage {
+  status: string;
+  messages?: ChatSessionMessage[];
+  next_cursor?: string | null;
+  has_more: boolean;
+  message?: string;
+}
+
 // Prompt Optimizer Types
 export interface Prompt {
   id: string;
@@ -523,6 +535,24 @@ export const chatSessionsApi = {
     }
   },
 
+  getSessionMessages: async (sessionId: string, cursor?: string | null, limit: number = 50): Promise<ChatMessagesPage> => {
+    try {
+      const response = await axios.get<ChatMessagesPage>(
+        `${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}/chat-sessions/${sessionId}/messages`,
+        {
+          params: { cursor: cursor || undefined, limit },
+          headers: {
+            'Authorization': `Bearer ${typeof window !== 'undefined' ? localStorage.getItem('auth_token') : null}`
+          }
+        }
+      );
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching chat session messages:', error);
+      throw error;
+    }
+  },
+
   updateSession: async (sessionId: string, updates: ChatSessionUpdate): Promise<ChatSessionResponse> => {
     try {
       const response = await axios.put<ChatSessionResponse>(